@@ -1,4 +1,5 @@
 from Pipeline.AlgorithmResultParsers.AParser import AParser
+from Pipeline.AlgorithmResultParsers.SequenceNormalization import joinResidues
 import pandas as pd
 
 
@@ -11,26 +12,13 @@ class DeepNovoParser(AParser):
         super().__init__(file)
         self.result = None
 
-    @staticmethod
-    def __cleanPeptideModifications(peptide: str) -> str:
-        """Remove all modifications from a peptide sequence.
-        Parameters:
-        :param peptide: Peptide sequence with modifications, separated by commas.
-        :return: Peptide sequence without modifications.
-        """
-        sequence = list()
-        for aa in peptide.split(','):
-            if aa.isalpha():
-                sequence.append(aa[0])
-        return ''.join(sequence)
-
     def parse(self) -> pd.DataFrame:
         """Parse the DeepNovo result file.
         :return: DataFrame containing the scan number and predicted sequence without modifications. """
         temp_df = pd.read_csv(self.file, sep='\t', header=0)
         temp_df = temp_df.drop(columns=['exact_match', 'target_seq', 'accuracy_AA', 'len_AA'])
         temp_df = temp_df.query('output_seq.str.contains("inf")==False')
-        temp_df['output_seq'] = temp_df['output_seq'].apply(lambda x: self.__cleanPeptideModifications(x))
+        temp_df['output_seq'] = joinResidues(temp_df['output_seq'])
         self.result = pd.DataFrame({'Scan': temp_df['scan'], 'Predicted': temp_df['output_seq'], 'Score': temp_df['output_score']})
         return self.result
 
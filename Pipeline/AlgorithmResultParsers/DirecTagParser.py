@@ -1,6 +1,14 @@
+from typing import Iterator
+
+import numpy as np
 import pandas as pd
 
 from Pipeline.AlgorithmResultParsers.AParser import AParser
+from Pipeline.AlgorithmResultParsers.SequenceNormalization import replaceModifications
+
+TAG_COLUMNS = ['ID', 'Predicted', 'Score', 'ComplementScore', 'IntensityScore', 'mzFidelityScore']
+# tab separated field of a tag line holding each score
+TAG_SCORE_FIELDS = {'Score': 7, 'ComplementScore': 8, 'IntensityScore': 9, 'mzFidelityScore': 10}
 
 
 class DirecTagParser(AParser):
@@ -22,15 +30,6 @@ class DirecTagParser(AParser):
         """
         return all([aa in self.aaList for aa in sequence])
 
-    @staticmethod
-    def __cleanPeptideModifications(peptide: str, modification_mapping:dict) -> str:
-        """Remove all modifications from a peptide sequence.
-        Parameters:
-        :param peptide: Peptide sequence with modifications.
-        :param modification_mapping: Mapping from a number to an amino acid.
-        :return: Peptide sequence without modifications.
-        """
-        return ''.join([modification_mapping[int(aa)] if aa.isdigit() else aa for aa in peptide])
     def parseVariableModifications(self, line: str) -> dict:
         """Parse the variable modifications mapping from the result file.
         Parameters:
@@ -50,27 +49,49 @@ class DirecTagParser(AParser):
         for mod in modifications:
             mapping[int(mod[1])] = mod[0]
         return mapping
-    def parse(self,) -> pd.DataFrame:
-        with open(self.file, 'r') as file:
-            lines = file.readlines()
-        entries = list()
+    def iterParse(self, chunksize: int = 100000) -> Iterator[pd.DataFrame]:
+        """Parse the result file in chunks, holding only the tags of the current chunk in memory.
+        Parameters:
+        :param chunksize: Maximum number of tags per chunk.
+        :return: Iterator of DataFrames with the columns ID, Predicted, Score, ComplementScore, IntensityScore and
+            mzFidelityScore. The ID is an integer and the scores are floats.
+        """
+        columns = {column: list() for column in TAG_COLUMNS}
         latestID = -1
-        for idx, line in enumerate(lines):
-            if ", DynamicMods: " in line:
-                self.modification_mapping = self.parseVariableModifications(line)
-                continue
-            if idx < self.skipNLines:
-                continue
-            if line.startswith("S"):
-                latestID = int(line.split('\t')[3])
-            if line.startswith("T"):
-                tagline = line.split('\t')
-                entry = {'ID': latestID, 'Predicted': tagline[1], 'Score': tagline[7],
-                         'ComplementScore': tagline[8], 'IntensityScore': tagline[9], 'mzFidelityScore': tagline[10]}
-                entries.append(entry)
-        temp_df = pd.DataFrame(entries)
-        temp_df['Predicted'] = temp_df.apply(lambda x: self.__cleanPeptideModifications(x['Predicted'], self.modification_mapping), axis=1)
-        self.result = temp_df
+        with open(self.file, 'r') as file:
+            for idx, line in enumerate(file):
+                if ", DynamicMods: " in line:
+                    self.modification_mapping = self.parseVariableModifications(line)
+                    continue
+                if idx < self.skipNLines:
+                    continue
+                if line.startswith("S"):
+                    latestID = int(line.split('\t')[3])
+                if line.startswith("T"):
+                    tagline = line.split('\t')
+                    columns['ID'].append(latestID)
+                    columns['Predicted'].append(tagline[1])
+                    for column, field in TAG_SCORE_FIELDS.items():
+                        columns[column].append(tagline[field])
+                    if len(columns['ID']) == chunksize:
+                        yield self.__toChunk(columns)
+                        columns = {column: list() for column in TAG_COLUMNS}
+        if columns['ID']:
+            yield self.__toChunk(columns)
+
+    def __toChunk(self, columns: dict) -> pd.DataFrame:
+        """Convert the collected tag columns to a typed DataFrame and remove the modifications of the tags."""
+        chunk = pd.DataFrame({'ID': np.array(columns['ID'], dtype=np.int64), 'Predicted': columns['Predicted']})
+        chunk['Predicted'] = replaceModifications(chunk['Predicted'], self.modification_mapping)
+        for column in TAG_SCORE_FIELDS:
+            chunk[column] = np.array(columns[column], dtype=np.float64)
+        return chunk
+
+    def parse(self,) -> pd.DataFrame:
+        chunks = list(self.iterParse())
+        if not chunks:
+            chunks = [pd.DataFrame(columns=TAG_COLUMNS)]
+        self.result = pd.concat(chunks, ignore_index=True)
         return self.result
 
 
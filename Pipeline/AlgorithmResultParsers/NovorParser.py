@@ -2,6 +2,7 @@ from Pipeline.AlgorithmResultParsers.AParser import AParser
 import pandas as pd
 
 from Pipeline.AlgorithmResultParsers.IAverageAminoAcidScore import IAverageAminoAcidScore
+from Pipeline.AlgorithmResultParsers.SequenceNormalization import stripModifications
 
 
 class NovorParser(AParser):
@@ -17,17 +18,6 @@ class NovorParser(AParser):
         self.skipNLines = skipNLines
         self.result = None
 
-
-
-    @staticmethod
-    def __cleanPeptideModifications(peptide: str) -> str:
-        """Remove all modifications from a peptide sequence.
-        Parameters:
-        :param peptide: Peptide sequence with modifications.
-        :return: Peptide sequence without modifications.
-        """
-        return ''.join([aa for aa in peptide if aa.isalpha()])
-
     def parse(self) -> pd.DataFrame:
         """Parse the Novor result file.
         :return: DataFrame containing the scan number, predicted sequence without modifications.
@@ -38,7 +28,7 @@ class NovorParser(AParser):
         temp_df = temp_df.drop(
             columns=['', 'RT', 'aaScore', 'ppm(1e6*err/(mz*z))', 'err(data-denovo)', 'pepMass(denovo)', 'z',
                      'mz(data)', 'scanNum'])
-        temp_df['peptide'] = temp_df['peptide'].apply(lambda x: self.__cleanPeptideModifications(x))
+        temp_df['peptide'] = stripModifications(temp_df['peptide'])
         self.result = pd.DataFrame({'ID': temp_df['id'], 'Predicted': temp_df['peptide'], 'Score': temp_df['score']})
         return self.result
 
@@ -2,6 +2,7 @@ import pandas as pd
 
 from Pipeline.AlgorithmResultParsers.AParser import AParser
 from Pipeline.AlgorithmResultParsers.IAverageAminoAcidScore import IAverageAminoAcidScore
+from Pipeline.AlgorithmResultParsers.SequenceNormalization import stripModifications, averageResidueScores
 
 
 class PEAKSParser(AParser, IAverageAminoAcidScore):
@@ -22,19 +23,10 @@ class PEAKSParser(AParser, IAverageAminoAcidScore):
         """
         return sum(aa_list) / len(aa_list)
 
-    @staticmethod
-    def __cleanPeptideModifications(peptide: str) -> str:
-        """Remove all modifications from a peptide sequence.
-        Parameters:
-        :param peptide: Peptide sequence with modifications.
-        :return: Peptide sequence without modifications.
-        """
-        return ''.join([aa for aa in peptide if aa.isalpha()])
-
     def parse(self) -> pd.DataFrame:
         temp_df = pd.read_csv(self.file, header=0, index_col=False)
-        temp_df['Peptide'] = temp_df['Peptide'].apply(lambda x: self.__cleanPeptideModifications(x))
-        temp_df['local confidence (%)'] = temp_df['local confidence (%)'].apply(lambda x: self.getAverageAAScore([int(score) for score in x.split(' ')]))
+        temp_df['Peptide'] = stripModifications(temp_df['Peptide'])
+        temp_df['local confidence (%)'] = averageResidueScores(temp_df['local confidence (%)'])
         self.result = pd.DataFrame({'Scan': temp_df['Scan'], 'Predicted': temp_df['Peptide'], 'Score': temp_df['local confidence (%)']})
         return self.result
 
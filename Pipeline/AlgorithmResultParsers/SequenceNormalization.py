@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+# everything that is not a letter, e.g. modification masses like (+15.99) or brackets
+NON_LETTERS = r'[^A-Za-z]+'
+# a comma separated residue containing anything but letters, e.g. the modified residue C(Carbamidomethylation)
+MODIFIED_RESIDUE = r'[^,]*[^A-Za-z,][^,]*'
+
+
+def stripModifications(peptides: pd.Series) -> pd.Series:
+    """Remove all modifications from peptide sequences by keeping only their letters.
+    Parameters:
+    :param peptides: Peptide sequences with modifications, e.g. M(+15.99)PEPTIDE.
+    :return: Peptide sequences without modifications.
+    """
+    return peptides.str.replace(NON_LETTERS, '', regex=True)
+
+
+def joinResidues(peptides: pd.Series) -> pd.Series:
+    """Convert comma separated residues to peptide sequences, as written by DeepNovo.
+    Parameters:
+    :param peptides: Peptide sequences with the residues separated by commas, e.g. P,E,P,C(Carbamidomethylation).
+    :return: Peptide sequences without separators and modified residues.
+    """
+    residues = peptides.str.replace(MODIFIED_RESIDUE, '', regex=True)
+    # residues with more than one letter are reduced to their first letter, which needs a slower back reference
+    long_residues = residues.str.contains('[A-Za-z]{2}', regex=True).fillna(False).astype(bool)
+    if long_residues.any():
+        residues[long_residues] = residues[long_residues].str.replace(r'([A-Za-z])[A-Za-z]*', r'\1', regex=True)
+    return residues.str.replace(',', '', regex=False)
+
+
+def modificationTable(modification_mapping: dict) -> dict:
+    """Create a translate table replacing the modification digits of a DirecTag tag by their amino acid.
+    Parameters:
+    :param modification_mapping: Mapping from a number to an amino acid.
+    :return: Table to be used with str.translate.
+    """
+    # tags encode a modified amino acid by a single digit
+    return str.maketrans({str(number): aa for number, aa in modification_mapping.items() if 0 <= number <= 9})
+
+
+def replaceModifications(peptides: pd.Series, modification_mapping: dict) -> pd.Series:
+    """Replace the modification digits of DirecTag tags by their amino acid.
+    Parameters:
+    :param peptides: Tags with modification digits.
+    :param modification_mapping: Mapping from a number to an amino acid.
+    :return: Tags without modifications.
+    """
+    return peptides.str.translate(modificationTable(modification_mapping))
+
+
+def parseNumbers(text: str, separator: str):
+    """Parse separated numbers, None if the text contains anything else."""
+    try:
+        return np.fromstring(text, sep=separator)
+    except ValueError:
+        return None
+
+
+def averageResidueScores(scores: pd.Series, separator: str = ' ') -> np.ndarray:
+    """Calculate the average of per residue scores, e.g. the local confidence of PEAKS.
+    Parameters:
+    :param scores: Per residue scores of each peptide, separated by the separator, e.g. '99 87 100'.
+    :param separator: Separator between the scores of a peptide.
+    :return: Average residue score of each peptide.
+    :raises ValueError: If the scores of a peptide are not numbers separated by single separators.
+    """
+    if len(scores) == 0:
+        return np.empty(0, dtype=np.float64)
+    scores = scores.astype(str).tolist()
+    # parse the scores of all peptides at once and sum them up per peptide
+    counts = np.fromiter((score.count(separator) + 1 for score in scores), dtype=np.int64, count=len(scores))
+    values = parseNumbers(separator.join(scores), separator)
+    if values is None or len(values) != counts.sum():
+        # a doubled or trailing separator or a non numeric score would shift the scores of all following peptides
+        for row, score in enumerate(scores):
+            row_values = parseNumbers(score, separator)
+            if row_values is None or len(row_values) != counts[row]:
+                raise ValueError(f"Invalid residue scores '{score}' in row {row}.")
+    starts = np.cumsum(counts) - counts
+    return np.add.reduceat(values, starts) / counts
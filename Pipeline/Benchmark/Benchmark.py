@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+from Pipeline.AlgorithmResultParsers.DeepNovoParser import DeepNovoParser
+from Pipeline.AlgorithmResultParsers.DirecTagParser import DirecTagParser
+from Pipeline.AlgorithmResultParsers.NovorParser import NovorParser
+from Pipeline.AlgorithmResultParsers.PEAKSParser import PEAKSParser
+from Pipeline.Benchmark.SyntheticData import generateDataset, DIRECTAG_HEADER_LINES, NOVOR_HEADER_LINES
+from Pipeline.Preprocessing.DeepNovoPreProcessor import DeepNovoPreProcessor
+
+# the stages are run as modules of the package from the repository root
+PIPELINE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# metrics compared against the baseline and whether higher values are better
+COMPARED_METRICS = {'rows_per_second': True, 'peak_rss_mb': False}
+
+
+def benchmarkPreprocess(files: Dict[str, str], directory: str, n_jobs: int) -> int:
+    DeepNovoPreProcessor(os.path.join(directory, 'synthetic_deepnovo.mgf'), 'PEPTIDE').process(files['mgf'], n_jobs)
+    return len(pd.read_csv(os.path.join(directory, 'mgf_peaks_distribution.tsv'), sep='\t'))
+
+
+def benchmarkPeakCount(files: Dict[str, str], directory: str, n_jobs: int) -> int:
+    from Pipeline.MgfPeakCounter import MgfPeakCounter
+    return MgfPeakCounter(files['mgf'], use_index=False).count_peaks()
+
+
+def benchmarkPeakCountIndexed(files: Dict[str, str], directory: str, n_jobs: int) -> int:
+    from Pipeline.MgfPeakCounter import MgfPeakCounter
+    # the index is built on first use, which is what is measured
+    index_file = files['mgf'] + '.index.tsv'
+    if os.path.exists(index_file):
+        os.remove(index_file)
+    return MgfPeakCounter(files['mgf']).count_peaks()
+
+
+def benchmarkPEAKSParser(files: Dict[str, str], directory: str, n_jobs: int) -> int:
+    return len(PEAKSParser(files['peaks']).parse())
+
+
+def benchmarkNovorParser(files: Dict[str, str], directory: str, n_jobs: int) -> int:
+    return len(NovorParser(files['novor'], NOVOR_HEADER_LINES).parse())
+
+
+def benchmarkDeepNovoParser(files: Dict[str, str], directory: str, n_jobs: int) -> int:
+    return len(DeepNovoParser(files['deepnovo']).parse())
+
+
+def benchmarkDirecTagParser(files: Dict[str, str], directory: str, n_jobs: int) -> int:
+    return len(DirecTagParser(files['tags'], DIRECTAG_HEADER_LINES).parse())
+
+
+def benchmarkScoring(files: Dict[str, str], directory: str, n_jobs: int) -> int:
+    from Pipeline.ScoreCalculation import processParsed
+    return len(processParsed(files['parsed'], alignment_mode='global', n_jobs=n_jobs))
+
+
+def benchmarkBestMatch(files: Dict[str, str], directory: str, n_jobs: int) -> int:
+    from Pipeline.Matching.InclusionListIndex import InclusionListIndex
+    from Pipeline.Scheduler import alignmentCosts, scheduleChunks
+    from Pipeline.ScoreCalculationUnidentified import best_match_parallel
+    predicted = pd.DataFrame({'Predicted': pd.read_csv(files['parsed'], sep='\t')['Predicted'].unique()})
+    inclusion_index = InclusionListIndex(pd.read_csv(files['inclusion'], sep='\t')['Sequence'].tolist())
+    output = scheduleChunks(best_match_parallel, predicted, alignmentCosts(predicted['Predicted']), inclusion_index,
+                            n_jobs=n_jobs)
+    return len(pd.concat(output, axis=0))
+
+
+# benchmarked stages, each returns the number of rows (spectra, predictions or pairs) it processed
+BENCHMARKS: Dict[str, Callable[[Dict[str, str], str, int], int]] = {
+    'preprocess': benchmarkPreprocess,
+    'count peaks': benchmarkPeakCount,
+    'count peaks indexed': benchmarkPeakCountIndexed,
+    'parse peaks': benchmarkPEAKSParser,
+    'parse novor': benchmarkNovorParser,
+    'parse deepnovo': benchmarkDeepNovoParser,
+    'parse direcTag': benchmarkDirecTagParser,
+    'score': benchmarkScoring,
+    'best match': benchmarkBestMatch,
+}
+
+
+def peakMemory() -> float:
+    """Peak resident memory of the current process in MB. On Linux the high-water mark of /proc is used, which unlike
+    ru_maxrss does not include the memory of the process that started this one."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+
+def runStage(stage: str, files: Dict[str, str], directory: str, n_jobs: int) -> dict:
+    """Run a benchmarked stage and measure it. Called in a fresh process, so caches of earlier stages do not help and
+    the peak memory only belongs to this stage.
+    Parameters:
+    :param stage: Name of the stage in BENCHMARKS.
+    :param files: Synthetic input files as returned by generateDataset.
+    :param directory: Directory for output files of the stage.
+    :param n_jobs: Number of worker processes used by the stage.
+    :return: Dictionary containing the wall time, CPU time, rows, rows per second and peak memory of the stage.
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
+    rows = BENCHMARKS[stage](files, directory, n_jobs)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return {'wall_seconds': wall, 'cpu_seconds': cpu, 'rows': rows, 'rows_per_second': rows / wall if wall else 0.0,
+            'peak_rss_mb': peakMemory()}
+
+
+def runBenchmarks(files: Dict[str, str], stages: List[str] = None, n_jobs: int = 1, repeat: int = 1) -> dict:
+    """Run benchmarked stages, each in a new python process, and keep the fastest of the repetitions.
+    Parameters:
+    :param files: Synthetic input files as returned by generateDataset.
+    :param stages: Names of the stages to run, all stages in BENCHMARKS if None.
+    :param n_jobs: Number of worker processes used by the stages.
+    :param repeat: Number of repetitions of each stage.
+    :return: Dictionary mapping the stage names to their measurements.
+    """
+    results = dict()
+    with tempfile.TemporaryDirectory(prefix='benchmark') as directory:
+        measurement_file = os.path.join(directory, 'measurement.json')
+        for stage in stages or list(BENCHMARKS):
+            runs = list()
+            for _ in range(repeat):
+                # a new interpreter per run, so no stage profits from the imports and caches of another one
+                subprocess.run([sys.executable, '-m', 'Pipeline.Benchmark.Benchmark', '--run-stage', stage,
+                                '--files', json.dumps(files), '--jobs', str(n_jobs), '--output', measurement_file],
+                               cwd=os.path.dirname(PIPELINE_DIRECTORY), check=True)
+                with open(measurement_file, 'r') as measurement:
+                    runs.append(json.load(measurement))
+            results[stage] = min(runs, key=lambda run: run['wall_seconds'])
+            print(f"{stage}: {results[stage]['rows']} rows in {results[stage]['wall_seconds']:.2f} s, "
+                  f"{results[stage]['rows_per_second']:.0f} rows/s, {results[stage]['peak_rss_mb']:.0f} MB")
+    return results
+
+
+def compareBaseline(results: dict, baseline: dict, tolerance: float = 0.2) -> List[dict]:
+    """Find the stages which became slower or use more memory than in a baseline.
+    Parameters:
+    :param results: Measurements as returned by runBenchmarks.
+    :param baseline: Measurements of an earlier run, e.g. the stages of a saved baseline.
+    :param tolerance: Allowed relative change before a stage counts as regressed, e.g. 0.2 for 20%.
+    :return: List of regressions containing the stage, metric, baseline value, current value and their ratio.
+    """
+    regressions = list()
+    for stage, measurements in results.items():
+        if stage not in baseline:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before, now = baseline[stage][metric], measurements[metric]
+            if before <= 0:
+                continue
+            ratio = now / before
+            if (ratio < 1 - tolerance) if higher_is_better else (ratio > 1 + tolerance):
+                regressions.append({'stage': stage, 'metric': metric, 'baseline': before, 'current': now,
+                                    'ratio': ratio})
+    return regressions
+
+
+def saveBaseline(results: dict, file: str, **settings):
+    """Save measurements together with the settings and the machine they were taken with as a JSON baseline."""
+    baseline = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                'machine': platform.platform(), 'cpus': os.cpu_count(), 'settings': settings, 'stages': results}
+    with open(file, 'w') as output:
+        json.dump(baseline, output, indent=2)
+
+
+def loadBaseline(file: str) -> dict:
+    with open(file, 'r') as baseline:
+        return json.load(baseline)
+
+
+def main(arguments: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the preprocessing, parsers and scorers on synthetic data.')
+    parser.add_argument('--spectra', type=int, default=10000, help='number of synthetic spectra and predictions')
+    parser.add_argument('--inclusion', type=int, default=None, help='number of inclusion list peptides')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--data', default=None, help='directory of the synthetic data, kept between runs')
+    parser.add_argument('--stages', nargs='+', choices=list(BENCHMARKS), default=None, help='stages to run')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes of each stage')
+    parser.add_argument('--repeat', type=int, default=1, help='repetitions of each stage, the fastest is kept')
+    parser.add_argument('--output', default=None, help='JSON file to save the measurements to')
+    parser.add_argument('--baseline', default=None, help='JSON baseline to compare the measurements with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    # used by runBenchmarks to measure a single stage in a new process
+    parser.add_argument('--run-stage', choices=list(BENCHMARKS), default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--files', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(arguments)
+
+    if args.run_stage is not None:
+        with tempfile.TemporaryDirectory(prefix='stage') as directory:
+            measurement = runStage(args.run_stage, json.loads(args.files), directory, args.jobs)
+        with open(args.output, 'w') as output:
+            json.dump(measurement, output)
+        return 0
+
+    settings = dict(spectra=args.spectra, inclusion=args.inclusion, seed=args.seed, jobs=args.jobs)
+    with tempfile.TemporaryDirectory(prefix='synthetic') as temporary:
+        data = os.path.abspath(args.data) if args.data is not None else temporary
+        # the synthetic data is only generated again if its settings changed
+        settings_file = os.path.join(data, 'settings.json')
+        files = None
+        if os.path.exists(settings_file):
+            with open(settings_file, 'r') as stored_settings:
+                stored = json.load(stored_settings)
+            if stored['settings'] == {key: settings[key] for key in ('spectra', 'inclusion', 'seed')}:
+                files = stored['files']
+        if files is None:
+            files = generateDataset(data, args.spectra, args.inclusion, args.seed)
+            with open(settings_file, 'w') as output:
+                json.dump({'settings': {key: settings[key] for key in ('spectra', 'inclusion', 'seed')},
+                           'files': files}, output)
+        results = runBenchmarks(files, args.stages, args.jobs, args.repeat)
+
+    if args.output is not None:
+        saveBaseline(results, args.output, **settings)
+    if args.baseline is not None:
+        baseline = loadBaseline(args.baseline)
+        if baseline['settings'] != settings:
+            print(f"Warning: the baseline was measured with {baseline['settings']}, not {settings}.")
+        regressions = compareBaseline(results, baseline['stages'], args.tolerance)
+        for regression in regressions:
+            print(f"Regression in {regression['stage']}: {regression['metric']} changed from "
+                  f"{regression['baseline']:.1f} to {regression['current']:.1f} ({regression['ratio']:.2f}x)")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+AMINO_ACIDS = np.array(list('ACDEFGHIKLMNPQRSTVWY'))
+# modifications as written by each algorithm
+PEAKS_MODIFICATIONS = {'M': 'M(+15.99)', 'C': 'C(+57.02)', 'N': 'N(+.98)'}
+# Novor refers to the index of the modification in its header
+NOVOR_MODIFICATIONS = {'M': 'M(0)', 'C': 'C(1)'}
+DEEPNOVO_MODIFICATIONS = {'M': 'Mmod', 'C': 'Cmod', 'N': 'Nmod', 'Q': 'Qmod'}
+# DirecTag writes the modified residues of a tag as the numbers of its DynamicMods
+DIRECTAG_MODIFICATIONS = {'M': '1', 'C': '0'}
+DIRECTAG_HEADER_LINES = 25
+NOVOR_HEADER_LINES = 20
+
+
+def randomPeptides(rng: np.random.Generator, count: int, min_length: int = 6, max_length: int = 25) -> List[str]:
+    """Create random tryptic peptides, which end with K or R.
+    Parameters:
+    :param rng: Random number generator.
+    :param count: Number of peptides.
+    :param min_length: Minimum peptide length.
+    :param max_length: Maximum peptide length.
+    :return: List of peptide sequences.
+    """
+    lengths = rng.integers(min_length, max_length + 1, size=count)
+    residues = AMINO_ACIDS[rng.integers(0, len(AMINO_ACIDS), size=int(lengths.sum()))]
+    residues[np.cumsum(lengths) - 1] = rng.choice(['K', 'R'], size=count)
+    return [''.join(peptide) for peptide in np.split(residues, np.cumsum(lengths)[:-1])] if count else []
+
+
+def mutatePeptides(rng: np.random.Generator, peptides: List[str], rate: float = 0.15) -> List[str]:
+    """Imitate de novo predictions of peptides by substituting and deleting residues.
+    Parameters:
+    :param rng: Random number generator.
+    :param peptides: Actual peptide sequences.
+    :param rate: Probability of each residue to be substituted, and separately to be deleted.
+    :return: List of predicted sequences, none of them empty.
+    """
+    predicted = list()
+    for peptide in peptides:
+        residues = np.array(list(peptide))
+        substituted = rng.random(len(residues)) < rate
+        residues[substituted] = AMINO_ACIDS[rng.integers(0, len(AMINO_ACIDS), size=int(substituted.sum()))]
+        kept = rng.random(len(residues)) >= rate
+        kept[0] = True
+        predicted.append(''.join(residues[kept]))
+    return predicted
+
+
+def modifyPeptides(rng: np.random.Generator, peptides: List[str], modifications: Dict[str, str],
+                   rate: float = 0.3) -> List[str]:
+    """Write some modifiable residues of peptides with the modification notation of an algorithm."""
+    return [''.join(modifications[aa] if aa in modifications and rng.random() < rate else aa for aa in peptide)
+            for peptide in peptides]
+
+
+def writeMGF(file: str, spectra: int, rng: np.random.Generator, min_peaks: int = 20, max_peaks: int = 200):
+    """Write an MGF file of random spectra with m/z sorted peaks.
+    Parameters:
+    :param file: Path to the MGF file.
+    :param spectra: Number of spectra.
+    :param rng: Random number generator.
+    :param min_peaks: Minimum number of peaks per spectrum.
+    :param max_peaks: Maximum number of peaks per spectrum.
+    """
+    with open(file, 'w') as mgf:
+        for scan in range(1, spectra + 1):
+            charge = int(rng.integers(2, 5))
+            mz = np.sort(rng.uniform(100, 2000, size=int(rng.integers(min_peaks, max_peaks + 1))))
+            intensity = rng.uniform(1, 1e6, size=len(mz))
+            peaks = ''.join(f"{m:.5f} {i:.4f}\n" for m, i in zip(mz.tolist(), intensity.tolist()))
+            mgf.write(f"BEGIN IONS\nTITLE=synthetic.{scan}.{scan}.{charge} File:\"synthetic.raw\", "
+                      f"NativeID:\"controller=0 scan={scan}\"\nRTINSECONDS={rng.uniform(0, 3600):.4f}\n"
+                      f"PEPMASS={rng.uniform(300, 1500):.6f}\nCHARGE={charge}+\nSCANS={scan}\n{peaks}END IONS\n")
+
+
+def writeDirecTagTags(file: str, spectra: int, rng: np.random.Generator, max_tags: int = 10, tag_length: int = 3):
+    """Write a DirecTag .tags file with up to max_tags tags per spectrum, some of them with modified residues."""
+    with open(file, 'w') as tags:
+        for idx in range(DIRECTAG_HEADER_LINES):
+            if idx == 3:
+                tags.write("TagsParameters: synthetic, DynamicMods: C 0 57.021464 M 1 15.994915, MaxTagCount: 10\n")
+            else:
+                tags.write(f"H\tsynthetic header line {idx}\n")
+        for idx in range(spectra):
+            tags.write(f"S\t{idx + 1}\tscan={idx + 1}\t{idx}\t2\t{rng.uniform(600, 3000):.4f}\t\n")
+            count = int(rng.integers(0, max_tags + 1))
+            peptides = modifyPeptides(rng, randomPeptides(rng, count, tag_length, tag_length), DIRECTAG_MODIFICATIONS)
+            for tag, scores in zip(peptides, rng.random((count, 4)).tolist()):
+                tags.write(f"T\t{tag}\t1\t2\t3\t4\t5\t" + '\t'.join(f"{score:.4f}" for score in scores) + "\n")
+
+
+def writeNovorCSV(file: str, peptides: List[str], rng: np.random.Generator):
+    """Write a Novor CSV result with one prediction per spectrum."""
+    modified = modifyPeptides(rng, peptides, NOVOR_MODIFICATIONS)
+    with open(file, 'w') as novor:
+        for idx in range(NOVOR_HEADER_LINES):
+            novor.write(f"# synthetic header line {idx}\n")
+        novor.write("# id, scanNum, RT, mz(data), z, pepMass(denovo), err(data-denovo), ppm(1e6*err/(mz*z)), score, "
+                    "peptide, aaScore, \n")
+        for idx, (peptide, sequence) in enumerate(zip(peptides, modified)):
+            scores = '-'.join(str(score) for score in rng.integers(0, 100, size=len(peptide)).tolist())
+            novor.write(f"{idx + 1}, {idx + 1}, {rng.uniform(0, 60):.2f}, {rng.uniform(300, 1500):.4f}, 2, "
+                        f"{rng.uniform(600, 3000):.4f}, 0.01, 1.0, {rng.uniform(0, 100):.1f}, {sequence}, {scores}, \n")
+
+
+def writePEAKSCSV(file: str, peptides: List[str], rng: np.random.Generator):
+    """Write a PEAKS de novo CSV result with one prediction per spectrum."""
+    data = pd.DataFrame({'Fraction': 1, 'Scan': np.arange(1, len(peptides) + 1), 'Source File': 'synthetic.raw',
+                         'Peptide': modifyPeptides(rng, peptides, PEAKS_MODIFICATIONS),
+                         'Tag Length': [len(peptide) for peptide in peptides],
+                         'ALC (%)': rng.integers(0, 100, size=len(peptides)),
+                         'length': [len(peptide) for peptide in peptides], 'm/z': rng.uniform(300, 1500, len(peptides)),
+                         'z': 2, 'RT': rng.uniform(0, 60, len(peptides)), 'Area': rng.uniform(1e4, 1e8, len(peptides)),
+                         'Mass': rng.uniform(600, 3000, len(peptides)), 'ppm': rng.normal(0, 5, len(peptides)),
+                         'PTM': '',
+                         'local confidence (%)': [' '.join(map(str, rng.integers(0, 100, size=len(peptide)).tolist()))
+                                                  for peptide in peptides],
+                         'tag (>=0%)': peptides, 'mode': 'HCD'})
+    data.to_csv(file, index=False)
+
+
+def writeDeepNovoTSV(file: str, peptides: List[str], rng: np.random.Generator, failed: float = 0.02):
+    """Write a DeepNovo decode output with comma separated residues, a few spectra could not be decoded (inf)."""
+    sequences = [','.join(residues) if rng.random() >= failed else 'inf' for residues in
+                 ([DEEPNOVO_MODIFICATIONS[aa] if aa in DEEPNOVO_MODIFICATIONS and rng.random() < 0.3 else aa
+                   for aa in peptide] for peptide in peptides)]
+    data = pd.DataFrame({'scan': np.arange(1, len(peptides) + 1), 'target_seq': '',
+                         'output_score': -rng.random(len(peptides)), 'output_seq': sequences, 'exact_match': 0,
+                         'accuracy_AA': 0, 'len_AA': 0})
+    data.to_csv(file, sep='\t', index=False)
+
+
+def writeParsedResult(file: str, actual: List[str], rng: np.random.Generator):
+    """Write a parsed result with the columns ID, Predicted, Actual and Score, as read by ScoreCalculation."""
+    data = pd.DataFrame({'ID': np.arange(len(actual)), 'Predicted': mutatePeptides(rng, actual), 'Actual': actual,
+                         'Score': rng.uniform(0, 100, len(actual))})
+    data.to_csv(file, sep='\t', index=False)
+
+
+def generateDataset(directory: str, spectra: int = 10000, inclusion: int = None, seed: int = 0) -> Dict[str, str]:
+    """Generate a synthetic pool: an MGF file, the results of every algorithm, a parsed result and an inclusion list.
+    The predictions are mutated peptides of the inclusion list, so they resemble real de novo results.
+    Parameters:
+    :param directory: Directory to write the files to.
+    :param spectra: Number of spectra, every algorithm predicts one sequence per spectrum.
+    :param inclusion: Number of peptides of the inclusion list, defaults to a tenth of the spectra.
+    :param seed: Seed of the random number generator, the same seed generates the same files.
+    :return: Dictionary mapping the names mgf, tags, novor, peaks, deepnovo, parsed and inclusion to the files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    inclusion_list = randomPeptides(rng, inclusion if inclusion is not None else max(spectra // 10, 1))
+    actual = [inclusion_list[idx] for idx in rng.integers(0, len(inclusion_list), size=spectra)]
+    predicted = mutatePeptides(rng, actual)
+    files = {name: os.path.join(directory, file) for name, file in [
+        ('mgf', 'synthetic.mgf'), ('tags', 'synthetic.tags'), ('novor', 'synthetic.novor.csv'),
+        ('peaks', 'synthetic.denovo.csv'), ('deepnovo', 'synthetic_decode_output.tab'),
+        ('parsed', 'synthetic_results.tsv'), ('inclusion', 'peptides.txt')]}
+    writeMGF(files['mgf'], spectra, rng)
+    writeDirecTagTags(files['tags'], spectra, rng)
+    writeNovorCSV(files['novor'], predicted, rng)
+    writePEAKSCSV(files['peaks'], predicted, rng)
+    writeDeepNovoTSV(files['deepnovo'], predicted, rng)
+    writeParsedResult(files['parsed'], actual, rng)
+    pd.DataFrame({'Sequence': inclusion_list, 'Length': [len(peptide) for peptide in inclusion_list]}).to_csv(
+        files['inclusion'], sep='\t', index=False)
+    return files
+
+
+if __name__ == "__main__":
+    print(generateDataset('../../Data/Benchmark/synthetic', spectra=1000))
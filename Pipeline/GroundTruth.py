@@ -0,0 +1,145 @@
+from functools import lru_cache
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from Pipeline.PackedSequences import PackedSequences
+
+
+def msmsScansFile(pool: str) -> str:
+    """Path to the msmsScans.txt file of a pool, containing the actual sequences identified by MaxQuant."""
+    return f"../Data/Datasets/{pool}/Thermo_SRM_{pool}_01_01_3xHCD-1h-R2-tryptic/msmsScans.txt"
+
+
+def peptidesFile(pool: str) -> str:
+    """Path to the peptides.txt file of a pool, containing the inclusion list of the pool."""
+    return f"../Data/Datasets/{pool}/Thermo_SRM_{pool}_01_01_3xHCD-1h-R2-tryptic/peptides.txt"
+
+
+class GroundTruth:
+    def __init__(self, msms_file: str = None, peptides_file: str = None):
+        """Initializes the GroundTruth object, which loads the actual sequences of the scans and the inclusion list of a
+        pool once, so they can be shared by all parsers and scorers. Only the needed columns are read and stored as
+        numpy arrays, which joblib memory maps into its worker processes instead of copying them.
+        Parameters:
+        :param msms_file: Path to the msmsScans.txt file, containing the scan number and sequence of every scan.
+        :param peptides_file: Path to the peptides.txt file, containing the inclusion list.
+        Each file is read on first use.
+        """
+        self.msms_file = msms_file
+        self.peptides_file = peptides_file
+        self.scans = None
+        self.sequences = None
+        self.sorted_scans = None
+        self.order = None
+        self.peptides = None
+
+    def load(self) -> 'GroundTruth':
+        """Load both files now instead of on first use, e.g. before the object is passed to worker processes."""
+        if self.msms_file is not None:
+            self.__loadScans()
+        if self.peptides_file is not None:
+            self.__loadPeptides()
+        return self
+
+    def __loadScans(self):
+        if self.scans is not None:
+            return
+        # unidentified scans have the sequence ' ', which must not be read as a missing value
+        msms = pd.read_csv(self.msms_file, sep='\t', usecols=['Scan number', 'Sequence'], keep_default_na=False,
+                           dtype={'Scan number': np.int32, 'Sequence': str})
+        self.scans = msms['Scan number'].to_numpy()
+        self.sequences = PackedSequences(msms['Sequence'])
+        # sorted scan numbers and the row of each, for the lookup of scan numbers with a binary search
+        self.order = np.argsort(self.scans, kind='stable')
+        self.sorted_scans = self.scans[self.order]
+
+    def __loadPeptides(self):
+        if self.peptides is not None:
+            return
+        peptides = pd.read_csv(self.peptides_file, sep='\t', usecols=['Sequence'], keep_default_na=False,
+                               dtype={'Sequence': str})
+        self.peptides = PackedSequences(peptides['Sequence'])
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def forPool(pool: str) -> 'GroundTruth':
+        """Load the ground truth of a pool from the standard locations, only once per process.
+        Parameters:
+        :param pool: Name of the pool, e.g. Pool_49.
+        :return: GroundTruth of the pool.
+        """
+        return GroundTruth(msmsScansFile(pool), peptidesFile(pool))
+
+    def __len__(self):
+        self.__loadScans()
+        return len(self.scans)
+
+    def findScans(self, scans: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Find the rows of many scan numbers in msmsScans.txt.
+        Parameters:
+        :param scans: Scan numbers.
+        :return: Tuple of the row of each scan number and a mask which scan numbers were found. The row of a scan
+            number which was not found is undefined.
+        """
+        self.__loadScans()
+        scans = np.asarray(scans)
+        positions = np.searchsorted(self.sorted_scans, scans)
+        positions[positions == len(self.sorted_scans)] = 0
+        found = self.sorted_scans[positions] == scans if len(self.sorted_scans) else np.zeros(len(scans), dtype=bool)
+        return self.order[positions] if len(self.order) else positions, found
+
+    def getSequence(self, scan: int) -> str:
+        """Get the actual sequence of a scan.
+        Parameters:
+        :param scan: Scan number.
+        :return: Actual sequence, ' ' if the scan was not identified.
+        """
+        rows, found = self.findScans(np.array([scan]))
+        if not found[0]:
+            raise KeyError(scan)
+        return self.sequences[rows[0]]
+
+    def getActualSequences(self) -> pd.DataFrame:
+        """Get the actual sequences of all scans.
+        :return: DataFrame containing the scan number and actual sequence of each scan.
+        """
+        self.__loadScans()
+        return pd.DataFrame({'Scan': self.scans, 'Actual': self.sequences.toList()})
+
+    def getPeptides(self) -> List[str]:
+        """Get the inclusion list of the pool."""
+        self.__loadPeptides()
+        return self.peptides.toList()
+
+    def getPackedPeptides(self) -> PackedSequences:
+        """Get the inclusion list of the pool as PackedSequences, e.g. for an InclusionListIndex sent to workers."""
+        self.__loadPeptides()
+        return self.peptides
+
+    def joinScan(self, parsed: pd.DataFrame) -> pd.DataFrame:
+        """Add the actual sequence to a parsed result by its scan number. Rows whose scan was not measured are removed.
+        Parameters:
+        :param parsed: Parsed result containing the column Scan.
+        :return: Parsed result with the additional column Actual.
+        """
+        rows, found = self.findScans(parsed['Scan'].to_numpy())
+        joined = parsed[found].reset_index(drop=True)
+        joined['Actual'] = self.sequences.take(rows[found])
+        return joined
+
+    def joinRow(self, parsed: pd.DataFrame) -> pd.DataFrame:
+        """Add the scan number and actual sequence to a parsed result by the row of the spectrum in msmsScans.txt.
+        Rows whose ID exceeds msmsScans.txt are removed.
+        Parameters:
+        :param parsed: Parsed result containing the column ID.
+        :return: Parsed result with the additional columns Scan and Actual.
+        """
+        ids = parsed['ID'].to_numpy()
+        found = (ids >= 0) & (ids < len(self))
+        joined = parsed[found].reset_index(drop=True)
+        rows = ids[found].astype(np.int64)
+        joined['Scan'] = self.scans[rows]
+        joined['Actual'] = self.sequences.take(rows)
+        return joined
@@ -0,0 +1,290 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+
+import pandas as pd
+
+# directory the records of all processes are written to, worker processes inherit it from the environment
+PROFILE_DIRECTORY_VARIABLE = 'PIPELINE_PROFILE_DIRECTORY'
+
+
+def residentMemory() -> tuple:
+    """Current and peak resident memory of this process in MB, (0, 0) where /proc is not available."""
+    current, peak = 0.0, 0.0
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1]) / 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return current, peak
+
+
+class StageRecord:
+    __slots__ = ('stage', 'tags', 'pid', 'thread', 'start', 'wall_seconds', 'cpu_seconds', 'rows_in', 'rows_out',
+                 'rss_mb', 'peak_rss_mb', 'peak_traced_mb', 'counts', 'traced_peak')
+
+    def __init__(self, stage: str, tags: dict, rows_in: int = None):
+        """Measurements of one execution of a pipeline stage. Code inside the stage sets the rows it produced with
+        setRowsOut and counts work, e.g. alignments, with count.
+        Parameters:
+        :param stage: Name of the stage, e.g. parse or score.
+        :param tags: Tags identifying the execution, e.g. pool and algorithm.
+        :param rows_in: Number of rows the stage received.
+        """
+        self.stage = stage
+        self.tags = tags
+        self.pid = os.getpid()
+        self.thread = threading.get_ident()
+        self.start = time.time()
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.rss_mb = 0.0
+        self.peak_rss_mb = 0.0
+        self.peak_traced_mb = None
+        self.counts = dict()
+        self.traced_peak = 0
+
+    def setRowsIn(self, rows: int):
+        self.rows_in = int(rows)
+
+    def setRowsOut(self, rows: int):
+        self.rows_out = int(rows)
+
+    def count(self, name: str, value: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + int(value)
+
+    def toDict(self) -> dict:
+        return {'stage': self.stage, **self.tags, 'pid': self.pid, 'thread': self.thread, 'start': self.start,
+                'wall_seconds': self.wall_seconds, 'cpu_seconds': self.cpu_seconds, 'rows_in': self.rows_in,
+                'rows_out': self.rows_out, 'rss_mb': self.rss_mb, 'peak_rss_mb': self.peak_rss_mb,
+                'peak_traced_mb': self.peak_traced_mb, **self.counts}
+
+
+class NoRecord:
+    """Stand-in for a StageRecord while profiling is disabled, so instrumented code does not need to check."""
+
+    def setRowsIn(self, rows: int):
+        pass
+
+    def setRowsOut(self, rows: int):
+        pass
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+
+NO_RECORD = NoRecord()
+
+
+class Profiler:
+    def __init__(self, directory: str = None, enabled: bool = False):
+        """Initializes the Profiler object, which records the wall time, CPU time, rows, memory and counts of pipeline
+        stages. Stages can be nested, nested stages inherit the tags of the enclosing stage.
+        Parameters:
+        :param directory: Directory every record is appended to as soon as its stage ends, one JSON lines file per
+            process. Needed to collect the records of worker processes.
+        :param enabled: If False, stages are not measured at all.
+        """
+        self.enabled = enabled or directory is not None
+        self.directory = directory
+        self.records = list()
+        self.local = threading.local()
+
+    def __stack(self) -> list:
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = list()
+        return self.local.stack
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int = None, **tags) -> Iterator[StageRecord]:
+        """Measure a stage.
+        Parameters:
+        :param name: Name of the stage, e.g. parse, merge, match, score or write.
+        :param rows_in: Number of rows the stage receives.
+        :param tags: Tags identifying the execution, e.g. pool='Pool_49', algorithm='direcTag'.
+        :return: Context manager yielding the StageRecord, or a record ignoring everything if profiling is disabled.
+        """
+        if not self.enabled:
+            yield NO_RECORD
+            return
+        stack = self.__stack()
+        record = StageRecord(name, {**(stack[-1].tags if stack else dict()), **tags}, rows_in)
+        if tracemalloc.is_tracing():
+            # the peak is reset for this stage, the peak seen so far is handed on to the enclosing stage
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].traced_peak = max(stack[-1].traced_peak, peak)
+            tracemalloc.reset_peak()
+            record.traced_peak = current
+        stack.append(record)
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.wall_seconds = time.perf_counter() - wall
+            record.cpu_seconds = time.process_time() - cpu
+            record.rss_mb, record.peak_rss_mb = residentMemory()
+            stack.pop()
+            if tracemalloc.is_tracing():
+                record.traced_peak = max(record.traced_peak, tracemalloc.get_traced_memory()[1])
+                record.peak_traced_mb = record.traced_peak / 1024 ** 2
+                if stack:
+                    stack[-1].traced_peak = max(stack[-1].traced_peak, record.traced_peak)
+            self.__store(record)
+
+    def __store(self, record: StageRecord):
+        values = record.toDict()
+        self.records.append(values)
+        if self.directory is not None:
+            with open(os.path.join(self.directory, f'{os.getpid()}.jsonl'), 'a') as file:
+                file.write(json.dumps(values) + '\n')
+
+    def count(self, name: str, value: int = 1):
+        """Add to a count of the innermost running stage, e.g. the number of alignments."""
+        if self.enabled:
+            stack = self.__stack()
+            if stack:
+                stack[-1].count(name, value)
+
+    def profiled(self, name: str = None, **tags) -> Callable:
+        """Decorator measuring every call of a function as a stage.
+        Parameters:
+        :param name: Name of the stage, defaults to the name of the function.
+        :param tags: Tags of the stage.
+        """
+        def decorator(function: Callable) -> Callable:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or function.__name__, **tags):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+# profiler of this process, worker processes started while profiling is enabled write to the same directory
+PROFILER = Profiler(os.environ.get(PROFILE_DIRECTORY_VARIABLE))
+
+
+def enableProfiling(directory: str = None, trace_memory: bool = False):
+    """Start recording stages. Has to be called before worker processes are started, they inherit the directory.
+    Parameters:
+    :param directory: Directory the records of this process and all worker processes are written to. If None, only
+        the stages of this process are recorded, in memory.
+    :param trace_memory: Also record the peak of the memory allocated by python and numpy within each stage with
+        tracemalloc, which slows down allocations.
+    """
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        os.environ[PROFILE_DIRECTORY_VARIABLE] = directory
+    PROFILER.directory = directory
+    PROFILER.enabled = True
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disableProfiling():
+    os.environ.pop(PROFILE_DIRECTORY_VARIABLE, None)
+    PROFILER.directory = None
+    PROFILER.enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def stage(name: str, rows_in: int = None, **tags):
+    """Measure a stage with the profiler of this process, see Profiler.stage."""
+    return PROFILER.stage(name, rows_in, **tags)
+
+
+def profiled(name: str = None, **tags) -> Callable:
+    """Decorator measuring every call of a function with the profiler of this process, see Profiler.profiled."""
+    return PROFILER.profiled(name, **tags)
+
+
+def count(name: str, value: int = 1):
+    """Add to a count of the innermost running stage of this process, e.g. count('alignments', 100)."""
+    PROFILER.count(name, value)
+
+
+def collectRecords(directory: str = None) -> List[dict]:
+    """Collect the stage records.
+    Parameters:
+    :param directory: Profiling directory containing the records of all processes. If None, the records of this
+        process are returned.
+    :return: List of records sorted by their start time.
+    """
+    if directory is None:
+        return sorted(PROFILER.records, key=lambda record: record['start'])
+    records = list()
+    for name in os.listdir(directory):
+        if name.endswith('.jsonl'):
+            with open(os.path.join(directory, name), 'r') as file:
+                records += [json.loads(line) for line in file if line.strip()]
+    return sorted(records, key=lambda record: record['start'])
+
+
+def summarizeRecords(records: List[dict], by: List[str] = None) -> pd.DataFrame:
+    """Sum up the measurements of the stages, e.g. to find the pool, algorithm and stage which became slower.
+    Parameters:
+    :param records: Stage records as returned by collectRecords.
+    :param by: Columns to group by, defaults to the stage and all tags. Add pid to get one row per worker.
+    :return: DataFrame with the number of executions and the summed times, rows and counts, and the maximum memory.
+    """
+    data = pd.DataFrame(records)
+    if data.empty:
+        return data
+    fixed = ['stage', 'pid', 'thread', 'start', 'wall_seconds', 'cpu_seconds', 'rows_in', 'rows_out', 'rss_mb',
+             'peak_rss_mb', 'peak_traced_mb']
+    numeric = [column for column in data.columns if column not in fixed and pd.api.types.is_numeric_dtype(data[column])]
+    if by is None:
+        by = ['stage'] + [column for column in data.columns if column not in fixed and column not in numeric]
+    sums = {column: 'sum' for column in ['wall_seconds', 'cpu_seconds', 'rows_in', 'rows_out'] + numeric}
+    maxima = {column: 'max' for column in ['rss_mb', 'peak_rss_mb', 'peak_traced_mb']}
+    summary = data.groupby(by, dropna=False).agg(executions=('stage', 'size'), **{
+        column: (column, function) for column, function in {**sums, **maxima}.items()})
+    return summary.reset_index()
+
+
+def saveJSON(records: List[dict], file: str):
+    with open(file, 'w') as output:
+        json.dump(records, output, indent=1)
+
+
+def saveChromeTrace(records: List[dict], file: str):
+    """Save the stage records in the Chrome trace event format, which can be opened with chrome://tracing or Perfetto.
+    Every process is shown in its own row, nested stages below their enclosing stage.
+    Parameters:
+    :param records: Stage records as returned by collectRecords.
+    :param file: Path to the trace file.
+    """
+    events = [{'name': record['stage'], 'cat': 'stage', 'ph': 'X', 'ts': record['start'] * 1e6,
+               'dur': record['wall_seconds'] * 1e6, 'pid': record['pid'], 'tid': record['thread'],
+               'args': {key: value for key, value in record.items()
+                        if key not in ('stage', 'pid', 'thread', 'start', 'wall_seconds')}}
+              for record in records]
+    main = os.getpid()
+    events += [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'main' if pid == main else f'worker {pid}'}}
+               for pid in sorted({record['pid'] for record in records})]
+    with open(file, 'w') as output:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, output)
+
+
+if __name__ == "__main__":
+    enableProfiling(trace_memory=True)
+    with stage('example', pool='Pool_49', algorithm='direcTag') as outer:
+        with stage('allocate', rows_in=10 ** 6) as inner:
+            data = list(range(10 ** 6))
+            inner.setRowsOut(len(data))
+            count('alignments', 10)
+    print(summarizeRecords(collectRecords()))
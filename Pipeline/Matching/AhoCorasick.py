@@ -0,0 +1,89 @@
+from collections import deque
+from typing import Iterable, Iterator, Tuple
+
+import pandas as pd
+
+
+class AhoCorasick:
+    def __init__(self, patterns: Iterable[str]):
+        """Build an Aho-Corasick automaton, which finds all occurrences of many patterns in one pass over a text.
+        Parameters:
+        :param patterns: Patterns to search for. Duplicates and empty patterns are ignored.
+        """
+        self.patterns = list(dict.fromkeys(pattern for pattern in patterns if pattern))
+        # trie of the patterns, every node is a dictionary of transitions
+        self.transitions = [dict()]
+        self.outputs = [list()]
+        for idx, pattern in enumerate(self.patterns):
+            node = 0
+            for character in pattern:
+                nxt = self.transitions[node].get(character)
+                if nxt is None:
+                    nxt = len(self.transitions)
+                    self.transitions[node][character] = nxt
+                    self.transitions.append(dict())
+                    self.outputs.append(list())
+                node = nxt
+            self.outputs[node].append(idx)
+
+        # failure links point to the node of the longest proper suffix which is also in the trie
+        self.fail = [0] * len(self.transitions)
+        queue = deque(self.transitions[0].values())
+        while queue:
+            node = queue.popleft()
+            for character, nxt in self.transitions[node].items():
+                queue.append(nxt)
+                fallback = self.fail[node]
+                while fallback and character not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.transitions[fallback].get(character, 0)
+                # a node also outputs every pattern of its failure node, as those are suffixes of it
+                self.outputs[nxt] = self.outputs[nxt] + self.outputs[self.fail[nxt]]
+
+    def iterMatches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Find all occurrences of the patterns in a text.
+        Parameters:
+        :param text: Text to search in.
+        :return: Iterator of (end position, pattern index) tuples, one per occurrence.
+        """
+        node = 0
+        transitions = self.transitions
+        fail = self.fail
+        outputs = self.outputs
+        for position, character in enumerate(text):
+            while node and character not in transitions[node]:
+                node = fail[node]
+            node = transitions[node].get(character, 0)
+            for idx in outputs[node]:
+                yield position, idx
+
+    def findAll(self, text: str) -> list:
+        """Find all patterns occurring in a text.
+        Parameters:
+        :param text: Text to search in.
+        :return: List of the patterns which occur at least once, in order of their first occurrence.
+        """
+        return [self.patterns[idx] for idx in dict.fromkeys(idx for _, idx in self.iterMatches(text))]
+
+
+def matchTagsToPeptides(tags: Iterable[str], peptides: Iterable[str]) -> pd.DataFrame:
+    """Find every (tag, peptide) pair where the tag is a substring of the peptide.
+    Parameters:
+    :param tags: Sequence tags, e.g. predicted by DirecTag.
+    :param peptides: Peptide sequences, e.g. of an inclusion list.
+    :return: DataFrame with the columns Predicted (tag) and Inclusion (peptide), one row per distinct pair.
+    """
+    automaton = AhoCorasick(tags)
+    predicted = list()
+    inclusion = list()
+    for peptide in dict.fromkeys(peptides):
+        for tag in automaton.findAll(peptide):
+            predicted.append(tag)
+            inclusion.append(peptide)
+    return pd.DataFrame({'Predicted': predicted, 'Inclusion': inclusion}, columns=['Predicted', 'Inclusion'])
+
+
+if __name__ == "__main__":
+    automaton = AhoCorasick(["GSH", "SHP", "HQE", "EVDS"])
+    print(list(automaton.iterMatches("VAMAMGSHPR")))
+    print(matchTagsToPeptides(["GSH", "SHP", "HQE", "EVDS"], ["VAMAMGSHPR", "LTHQEVDSR"]))
@@ -0,0 +1,107 @@
+from typing import Sequence, Optional, Union
+
+import numpy as np
+
+from Pipeline.Instrumentation import count
+from Pipeline.PackedSequences import PackedSequences
+from Pipeline.Scoring.SequenceSimilarity import SequenceSimilarity
+from Pipeline.Scoring.SubstitutionMatrix import loadSubstitutionMatrix
+
+
+class InclusionListIndex:
+    def __init__(self, peptides: Union[Sequence[str], PackedSequences], substitution_matrix: str = 'BLOSUM62',
+                 alignment_mode: str = 'global', open_gap_score: int = -2, extend_gap_score: int = -2):
+        """Index over the peptides of an inclusion list to find peptides with a perfect (100%) similarity.
+        Candidates are pruned with conditions every perfect match has to fulfill, and only the remaining
+        candidates are aligned. The result is therefore identical to aligning against every peptide.
+        The peptides and their encodings are held in numpy arrays, which joblib memory maps into its worker processes
+        once they are large, instead of pickling a copy of the inclusion list for every chunk.
+        Parameters:
+        :param peptides: Peptide sequences of the inclusion list, e.g. the PackedSequences of a GroundTruth.
+        :param substitution_matrix: Name of the substitution matrix.
+        :param alignment_mode: Alignment mode used for the similarity.
+        :param open_gap_score: Gap opening score.
+        :param extend_gap_score: Gap extension score.
+        """
+        self.peptides = peptides if isinstance(peptides, PackedSequences) else PackedSequences(peptides)
+        self.alignment_mode = alignment_mode
+        self.similarity = SequenceSimilarity(substitution_matrix=substitution_matrix, alignment_mode=alignment_mode,
+                                             open_gap_score=open_gap_score, extend_gap_score=extend_gap_score)
+        # with a positive gap score gaps count as similar positions, so no candidate can be ruled out
+        self.prunable = open_gap_score <= 0
+
+        # encode amino acids as codes, the two additional codes are used for unknown amino acids and padding
+        matrix = loadSubstitutionMatrix(substitution_matrix)
+        self.codes = {aa: code for code, aa in enumerate(matrix.alphabet)}
+        self.unknown = len(matrix.alphabet)
+        self.padding = len(matrix.alphabet) + 1
+        # positive[a, b] is True if substituting a by b has a positive score; unknown amino acids are never ruled out
+        self.positive = np.zeros((len(matrix.alphabet) + 2, len(matrix.alphabet) + 2), dtype=bool)
+        self.positive[:self.unknown, :self.unknown] = np.asarray(matrix) > 0
+        self.positive[:, self.unknown] = True
+
+        # encode all peptides at once by looking up the code of every byte of the packed sequences
+        lookup = np.full(256, self.unknown, dtype=np.uint8)
+        for aa, code in self.codes.items():
+            lookup[ord(aa)] = code
+        self.lengths = self.peptides.getLengths()
+        self.encoded = np.full((len(self.peptides), self.lengths.max(initial=0)), self.padding, dtype=np.uint8)
+        rows = np.repeat(np.arange(len(self.peptides)), self.lengths)
+        columns = np.arange(len(rows)) - np.repeat(self.peptides.offsets[:-1] - self.peptides.offsets[0], self.lengths)
+        self.encoded[rows, columns] = lookup[self.peptides.data[self.peptides.offsets[0]:self.peptides.offsets[-1]]]
+
+    def __globalCandidates(self, query: np.ndarray) -> np.ndarray:
+        """A perfect global match has no gaps, so it has the same length and only positive substitutions."""
+        candidates = np.flatnonzero(self.lengths == len(query))
+        aligned = self.encoded[candidates, :len(query)]
+        return candidates[self.positive[query[None, :], aligned].all(axis=1)]
+
+    def __localCandidates(self, query: np.ndarray) -> np.ndarray:
+        """A perfect local match aligns every amino acid of the query, in order, to a positive substitution."""
+        candidates = np.flatnonzero(self.lengths >= len(query))
+        positions = np.arange(self.encoded.shape[1])
+        # position in each candidate after the last greedily matched amino acid
+        start = np.zeros(len(candidates), dtype=np.int64)
+        for code in query:
+            compatible = self.positive[code][self.encoded[candidates]] & (positions[None, :] >= start[:, None])
+            found = compatible.any(axis=1)
+            candidates = candidates[found]
+            start = compatible[found].argmax(axis=1) + 1
+        return candidates
+
+    def getCandidates(self, predicted: str) -> np.ndarray:
+        """Get the indices of all peptides which may have a perfect similarity with a predicted sequence.
+        Parameters:
+        :param predicted: Predicted sequence.
+        :return: Sorted indices of the candidate peptides.
+        """
+        if not self.prunable or any(aa not in self.codes for aa in predicted) or len(predicted) == 0:
+            return np.arange(len(self.peptides))
+        query = np.fromiter((self.codes[aa] for aa in predicted), dtype=np.int64, count=len(predicted))
+        if self.alignment_mode == 'global':
+            return self.__globalCandidates(query)
+        if self.alignment_mode == 'local':
+            return self.__localCandidates(query)
+        return np.arange(len(self.peptides))
+
+    def bestMatch(self, predicted: str) -> Optional[str]:
+        """Return the first peptide of the inclusion list with a perfect similarity to a predicted sequence.
+        Parameters:
+        :param predicted: Predicted sequence.
+        :return: Matching peptide, or None if no peptide has a perfect similarity.
+        """
+        candidates = self.getCandidates(predicted)
+        for aligned, idx in enumerate(candidates, 1):
+            if self.similarity.getScore(predicted=predicted, actual=self.peptides[idx]) == 1.0:
+                count('alignments', aligned)
+                return self.peptides[idx]
+        count('alignments', len(candidates))
+        return None
+
+
+if __name__ == "__main__":
+    index = InclusionListIndex(["VAMAMGSHPR", "LTHQEVDSR", "ITHQEVDSR"])
+    print(index.bestMatch("ITHQEVDSR"))
+    index = InclusionListIndex(["VAMAMGSHPR", "LTHQEVDSR", "ITHQEVDSR"], alignment_mode='local', open_gap_score=-10,
+                               extend_gap_score=-10)
+    print(index.bestMatch("GSHP"))
@@ -1,17 +1,23 @@
+from Pipeline.Preprocessing.MGFIndex import MGFIndex
+from Pipeline.Preprocessing.MGFReader import MGFReader
+
 
 class MgfPeakCounter():
     """
     A class to count the number of peaks in a .mgf file.
     """
 
-    def __init__(self, mgf_file):
+    def __init__(self, mgf_file, use_index=True):
         """
         Initialize the MgfPeakCounter object.
 
         :param mgf_file: The path to the .mgf file to count the peaks in.
         :type mgf_file: str
+        :param use_index: Count the spectra with the persisted MGFIndex, which is built on first use.
+        :type use_index: bool
         """
         self.mgf_file = mgf_file
+        self.use_index = use_index
 
     def count_peaks(self):
         """
@@ -20,9 +26,11 @@ class MgfPeakCounter():
         :return: The number of peaks in the .mgf file.
         :rtype: int
         """
-        with open(self.mgf_file, 'r') as f:
-            num_peaks = 0
-            for line in f:
-                if line.startswith('PEPMASS'):
-                    num_peaks += 1
-        return num_peaks
\ No newline at end of file
+        if self.use_index:
+            return len(MGFIndex.open(self.mgf_file))
+        # only the spectrum headers are needed, so the peaks are not parsed
+        num_peaks = 0
+        for entry in MGFReader(self.mgf_file, readPeaks=False):
+            if entry.getPepMass() != -1:
+                num_peaks += 1
+        return num_peaks
@@ -0,0 +1,80 @@
+import os
+from typing import Iterable, List
+
+import numpy as np
+
+
+class PackedSequences:
+    __slots__ = ('data', 'offsets')
+
+    def __init__(self, sequences: Iterable[str]):
+        """Stores many sequences in two flat arrays instead of one python string each. Sequence i is
+        data[offsets[i]:offsets[i+1]]. Since only numpy arrays are stored, joblib memory maps the sequences into worker
+        processes instead of pickling a copy for each of them.
+        Parameters:
+        :param sequences: ASCII sequences to store.
+        """
+        encoded = [sequence.encode('ascii') for sequence in sequences]
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(sequence) for sequence in encoded], out=self.offsets[1:])
+        self.data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    @staticmethod
+    def fromArrays(data: np.ndarray, offsets: np.ndarray) -> 'PackedSequences':
+        """Create PackedSequences from existing data and offset arrays without copying them."""
+        packed = PackedSequences([])
+        packed.data = data
+        packed.offsets = offsets
+        return packed
+
+    def toMemmap(self, directory: str, name: str) -> 'PackedSequences':
+        """Copy the sequences into memory mapped files. joblib passes memory mapped arrays to its workers by file name,
+        so the sequences are neither pickled nor hashed for each task.
+        Parameters:
+        :param directory: Directory to create the files in.
+        :param name: Prefix of the file names.
+        :return: PackedSequences backed by the memory mapped files.
+        """
+        data = np.lib.format.open_memmap(os.path.join(directory, f'{name}.data.npy'), mode='w+', dtype=np.uint8,
+                                         shape=self.data.shape)
+        data[:] = self.data
+        offsets = np.lib.format.open_memmap(os.path.join(directory, f'{name}.offsets.npy'), mode='w+',
+                                            dtype=np.int64, shape=self.offsets.shape)
+        offsets[:] = self.offsets
+        return PackedSequences.fromArrays(data, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> str:
+        return self.data[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode('ascii')
+
+    def getLengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def take(self, indices: np.ndarray) -> np.ndarray:
+        """Get many sequences at once.
+        Parameters:
+        :param indices: Indices of the sequences.
+        :return: Object array containing the sequences in the order of the indices.
+        """
+        data = self.data.tobytes()
+        starts = self.offsets[indices].tolist()
+        ends = self.offsets[np.asarray(indices) + 1].tolist()
+        output = np.empty(len(starts), dtype=object)
+        output[:] = [data[start:end].decode('ascii') for start, end in zip(starts, ends)]
+        return output
+
+    def getRange(self, start: int, end: int) -> List[str]:
+        """Get the consecutive sequences start to end, only reading the bytes of these sequences.
+        Parameters:
+        :param start: Index of the first sequence.
+        :param end: Index after the last sequence.
+        :return: List containing the sequences.
+        """
+        offsets = (self.offsets[start:end + 1] - self.offsets[start]).tolist()
+        data = self.data[self.offsets[start]:self.offsets[end]].tobytes()
+        return [data[offsets[idx]:offsets[idx + 1]].decode('ascii') for idx in range(end - start)]
+
+    def toList(self) -> List[str]:
+        return self.getRange(0, len(self))
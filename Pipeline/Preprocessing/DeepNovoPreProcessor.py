@@ -1,108 +1,70 @@
-from typing import Tuple, List
+import os
+import shutil
 
+import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+
+from Pipeline.Preprocessing.MGFReader import MGFReader
+
+
+def processShard(source:str, start:int, end:int, destination:str, sequence:str) -> tuple:
+    """Convert a byte range of an MGF file for DeepNovo.
+    Parameters:
+    :param source: Path to the MGF file.
+    :param start: Byte offset of the first spectrum of the shard.
+    :param end: Byte offset after the last spectrum of the shard.
+    :param destination: Path to write the converted spectra to.
+    :param sequence: Sequence written to the SEQ field of every spectrum.
+    :return: Tuple of arrays containing the scan number, peak count, precursor mass and charge of each spectrum.
+    """
+    scan_id = []
+    peak_count = []
+    prec_mass = []
+    charge = []
+    with open(destination, 'w') as file:
+        for batch in MGFReader(source, start=start, end=end).batches():
+            batch.setSequence(sequence)
+            file.write(batch.toMGF())
+            scan_id.append(batch.getScans())
+            peak_count.append(batch.getPeakCounts())
+            prec_mass.append(batch.getPepMasses())
+            charge.append(batch.getCharges())
+    return tuple(np.concatenate(values) if values else np.empty(0) for values in [scan_id, peak_count, prec_mass, charge])
 
 
-class MGFEntry:
-    def __init__(self, sequence:str):
-        self.title = 'title'
-        self.sequence = sequence
-        self.scan = -1
-        self.charge = -1
-        self.rtinseconds = -1
-        self.pepmass = -1
-        self.peaks = list()
-
-    def setTitle(self, title:str):
-        self.title = title
-
-    def setSequence(self, sequence:str):
-        self.sequence = sequence
-
-    def setScan(self, scan:int):
-        self.scan = scan
-
-    def setCharge(self, charge:int):
-        self.charge = charge
-
-    def setRTInSeconds(self, rtinseconds:float):
-        self.rtinseconds = rtinseconds
-
-    def setPepMass(self, pepmass:float):
-        self.pepmass = pepmass
-
-    def addPeak(self, peak:Tuple[float, float]):
-        self.peaks.append(peak)
-
-    def getScan(self):
-        return self.scan
-
-    def getPeakCount(self):
-        return len(self.peaks)
-
-    def getPepMass(self):
-        return self.pepmass
-
-    def getCharge(self):
-        return self.charge
-
-
-    def __str__(self):
-        peaks = '\n'.join([f"{peak[0]} {peak[1]}" for peak in self.peaks])
-        return f"BEGIN IONS\nTITLE={self.title}\nPEPMASS={self.pepmass}\nCHARGE={self.charge}+\nSCANS={self.scan}\nRTINSECONDS={self.rtinseconds}\nSEQ={self.sequence}\n{peaks}\nEND IONS\n"
-
 class DeepNovoPreProcessor:
     def __init__(self, destination:str, sequence:str):
         self.destination = destination
         self.sequence = sequence
 
-    def process(self, source:str):
-        entries = self.__parse(source)
-        self.__write(entries)
-        self.__savePeakDistribution(entries)
-
-    def __parse(self, source:str)->List[MGFEntry]:
-        lines = list()
-        with open(source, 'r') as file:
-            lines = file.readlines()
-        entries = list()
-        entry = None
-        for line in lines:
-            if line.startswith("BEGIN IONS"):
-                entry = MGFEntry(self.sequence)
-            elif line.startswith("TITLE"):
-                entry.setTitle(line.split('=',1)[1].strip())
-            elif line.startswith("PEPMASS"):
-                entry.setPepMass(float(line.split('=')[1].strip()))
-            elif line.startswith("CHARGE"):
-                entry.setCharge(int(line.split('=')[1].strip().split('+')[0]))
-            elif line.startswith("SCANS"):
-                entry.setScan(int(line.split('=')[1].strip()))
-            elif line.startswith("RTINSECONDS"):
-                entry.setRTInSeconds(float(line.split('=')[1].strip()))
-            elif line.startswith("END IONS"):
-                entries.append(entry)
-            else:
-                mz, intensity =line.split()
-                entry.addPeak(tuple([float(mz), float(intensity)]) )
-        return entries
-
-    def __write(self, entries):
-        with open(self.destination, 'w') as file:
-            for entry in entries:
-                file.write(str(entry))
-
-    def __savePeakDistribution(self, entries):
+    def process(self, source:str, n_jobs:int = 1):
+        """Convert an MGF file for DeepNovo and save the peak and mass distributions.
+        The source is streamed in batches, so only a few spectra are held in memory at a time.
+        Parameters:
+        :param source: Path to the MGF file.
+        :param n_jobs: Number of processes. With more than one, the file is split at BEGIN IONS lines into shards
+            which are converted in parallel and merged in order, producing the same output as a single process.
+        """
+        if n_jobs == 1:
+            stats = [processShard(source, 0, os.path.getsize(source), self.destination, self.sequence)]
+        else:
+            shards = MGFReader(source).shards(effective_n_jobs(n_jobs))
+            shard_files = [f"{self.destination}.shard{idx}" for idx in range(len(shards))]
+            stats = Parallel(n_jobs=n_jobs)(
+                delayed(processShard)(source, start, end, shard_file, self.sequence)
+                for (start, end), shard_file in zip(shards, shard_files))
+            # merge the shards in file order
+            with open(self.destination, 'wb') as file:
+                for shard_file in shard_files:
+                    with open(shard_file, 'rb') as shard:
+                        shutil.copyfileobj(shard, file)
+                    os.remove(shard_file)
+        self.__savePeakDistribution(*[np.concatenate(values) for values in zip(*stats)])
+
+    def __savePeakDistribution(self, scan_id:np.ndarray, peak_count:np.ndarray, prec_mass:np.ndarray, charge:np.ndarray):
         mass_H = 1.0078
-        scan_id = []
-        peak_count = []
-        pepmass = []
-        prec_mass = []
-        for entry in entries:
-            scan_id.append(entry.getScan())
-            peak_count.append(entry.getPeakCount())
-            pepmass.append(entry.getPepMass()*entry.getCharge() - entry.getCharge()*mass_H)
-            prec_mass.append(entry.getPepMass())
+        pepmass = prec_mass*charge - charge*mass_H
         peak_distribution_df = pd.DataFrame({'Scan': scan_id, 'PeakCount': peak_count})
         pepmass_distribution_df = pd.DataFrame({'Scan': scan_id, 'PepMass': pepmass})
         precursormass_distribution_df = pd.DataFrame({'Scan': scan_id, 'PrecursorMass': prec_mass})
@@ -116,4 +78,4 @@ if __name__ == "__main__":
     for file in files:
         file = f"../../Data/Datasets/{file}"
         preprocessor = DeepNovoPreProcessor(file+'_deepnovo.mgf', "PEPTIDE")
-        preprocessor.process(file+'.mgf')
\ No newline at end of file
+        preprocessor.process(file+'.mgf', n_jobs=os.cpu_count())
\ No newline at end of file
@@ -0,0 +1,173 @@
+import mmap
+import os
+import re
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from Pipeline.Preprocessing.MGFReader import MGFReader
+from Pipeline.Preprocessing.Spectrum import Spectrum, SpectrumBatch
+
+BEGIN_IONS = re.compile(rb'^BEGIN IONS', re.MULTILINE)
+
+
+class MGFIndex:
+    def __init__(self, mgf_file: str, index_file: str = None):
+        """Initializes the MGFIndex object, which maps the scans and titles of an MGF file to byte offsets.
+        Parameters:
+        :param mgf_file: Path to the MGF file.
+        :param index_file: Path to the persisted index. Defaults to the MGF file with the suffix .index.tsv.
+        """
+        self.mgf_file = mgf_file
+        self.index_file = index_file if index_file is not None else mgf_file + '.index.tsv'
+        self.index = None
+        self.scan_lookup = None
+        self.title_lookup = None
+
+    @staticmethod
+    def open(mgf_file: str, index_file: str = None) -> 'MGFIndex':
+        """Load the persisted index of an MGF file, or build and persist it if it is missing or outdated.
+        Parameters:
+        :param mgf_file: Path to the MGF file.
+        :param index_file: Path to the persisted index.
+        :return: Loaded MGFIndex object.
+        """
+        index = MGFIndex(mgf_file, index_file)
+        if index.isStale():
+            index.build()
+            try:
+                index.save()
+            except OSError:
+                # the index can still be used, it is just rebuilt next time
+                pass
+        else:
+            index.load()
+        return index
+
+    def isStale(self) -> bool:
+        """Check if the persisted index is missing or older than the MGF file."""
+        return not os.path.exists(self.index_file) or os.path.getmtime(self.index_file) < os.path.getmtime(self.mgf_file)
+
+    def build(self) -> pd.DataFrame:
+        """Scan the MGF file once and record the scan number, title, and byte range of every spectrum.
+        :return: DataFrame containing the columns Scan, Title, Start and End.
+        """
+        scans, titles, starts, ends = [], [], [], []
+        # an empty file cannot be memory mapped and has no spectra
+        if os.path.getsize(self.mgf_file) > 0:
+            with open(self.mgf_file, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for match in BEGIN_IONS.finditer(data):
+                    start = match.start()
+                    # the spectrum ends after the line containing END IONS
+                    end = data.find(b'END IONS', start)
+                    end = data.find(b'\n', end) if end != -1 else -1
+                    end = end + 1 if end != -1 else len(data)
+                    scan = data.find(b'\nSCANS=', start, end)
+                    scans.append(int(data[scan + 7:data.find(b'\n', scan + 1)].strip()) if scan != -1 else -1)
+                    title = data.find(b'\nTITLE=', start, end)
+                    titles.append(data[title + 7:data.find(b'\n', title + 1)].strip().decode() if title != -1 else '')
+                    starts.append(start)
+                    ends.append(end)
+        self.index = pd.DataFrame({'Scan': np.array(scans, dtype=np.int64), 'Title': titles,
+                                   'Start': np.array(starts, dtype=np.int64), 'End': np.array(ends, dtype=np.int64)})
+        self.scan_lookup = None
+        self.title_lookup = None
+        return self.index
+
+    def save(self):
+        self.index.to_csv(self.index_file, sep='\t', index=None)
+
+    def load(self) -> pd.DataFrame:
+        self.index = pd.read_csv(self.index_file, sep='\t', header=0, keep_default_na=False,
+                                 dtype={'Scan': np.int64, 'Title': str, 'Start': np.int64, 'End': np.int64})
+        self.scan_lookup = None
+        self.title_lookup = None
+        return self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def getRange(self, scan: int) -> tuple:
+        """Get the byte range of a scan.
+        Parameters:
+        :param scan: Scan number.
+        :return: Tuple of the start and end offset of the spectrum.
+        """
+        if self.scan_lookup is None:
+            # keep the first spectrum of duplicated scan numbers
+            self.scan_lookup = {value: idx for idx, value in reversed(list(enumerate(self.index['Scan'].tolist())))}
+        idx = self.scan_lookup[scan]
+        return int(self.index['Start'].iat[idx]), int(self.index['End'].iat[idx])
+
+    def getTitleRange(self, title: str) -> tuple:
+        """Get the byte range of a spectrum by its title.
+        Parameters:
+        :param title: Title of the spectrum.
+        :return: Tuple of the start and end offset of the spectrum.
+        """
+        if self.title_lookup is None:
+            self.title_lookup = {value: idx for idx, value in reversed(list(enumerate(self.index['Title'].tolist())))}
+        idx = self.title_lookup[title]
+        return int(self.index['Start'].iat[idx]), int(self.index['End'].iat[idx])
+
+
+class IndexedMGFReader:
+    def __init__(self, mgf_file: str, index_file: str = None):
+        """Initializes the IndexedMGFReader object, which reads single spectra of a memory mapped MGF file.
+        Parameters:
+        :param mgf_file: Path to the MGF file.
+        :param index_file: Path to the persisted index.
+        """
+        self.index = MGFIndex.open(mgf_file, index_file)
+        self.file = open(mgf_file, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if len(self.index) else b''
+        self.parser = MGFReader(mgf_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __read(self, start: int, end: int) -> Spectrum:
+        return next(self.parser.parse(self.data[start:end].splitlines(keepends=True)))
+
+    def getScan(self, scan: int) -> Spectrum:
+        """Read the spectrum of a scan.
+        Parameters:
+        :param scan: Scan number.
+        :return: Spectrum of the scan.
+        """
+        return self.__read(*self.index.getRange(scan))
+
+    def getTitle(self, title: str) -> Spectrum:
+        """Read a spectrum by its title.
+        Parameters:
+        :param title: Title of the spectrum.
+        :return: Spectrum with the title.
+        """
+        return self.__read(*self.index.getTitleRange(title))
+
+    def getScans(self, scans: Iterable[int]) -> SpectrumBatch:
+        """Read the spectra of many scans.
+        Parameters:
+        :param scans: Scan numbers.
+        :return: Spectra of the scans in the given order.
+        """
+        return SpectrumBatch([self.getScan(scan) for scan in scans])
+
+
+if __name__ == "__main__":
+    file = "../../Data/Datasets/Pool_49/01640c_BA7-Thermo_SRM_Pool_49_01_01-3xHCD-1h-R2.mgf"
+    with IndexedMGFReader(file) as reader:
+        print(len(reader))
+        print(reader.getScan(reader.index.index['Scan'].iat[0]))
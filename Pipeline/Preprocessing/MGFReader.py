@@ -0,0 +1,114 @@
+import os
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from Pipeline.Preprocessing.Spectrum import Spectrum, SpectrumBatch
+
+
+class MGFReader:
+    def __init__(self, source: str, readPeaks: bool = True, start: int = 0, end: int = None):
+        """Initializes the MGFReader object, which reads an MGF file one spectrum at a time.
+        Parameters:
+        :param source: Path to the MGF file.
+        :param readPeaks: If False, only the header of each spectrum is parsed and the peaks are skipped.
+        :param start: Byte offset to start reading at, has to be the start of a line.
+        :param end: Byte offset to stop reading at. Spectra starting at or after this offset are not read.
+        """
+        self.source = source
+        self.readPeaks = readPeaks
+        self.start = start
+        self.end = end
+
+    def __iter__(self) -> Iterator[Spectrum]:
+        with open(self.source, 'rb') as file:
+            file.seek(self.start)
+            yield from self.parse(self.__lines(file) if self.end is not None else file)
+
+    def __lines(self, file) -> Iterator[bytes]:
+        """Yield the lines of a file until the end offset is reached."""
+        position = self.start
+        for line in file:
+            if position >= self.end:
+                return
+            position += len(line)
+            yield line
+
+    def shards(self, count: int) -> List[Tuple[int, int]]:
+        """Split the MGF file into byte ranges of roughly equal size, each starting at a BEGIN IONS line.
+        Parameters:
+        :param count: Number of shards to split the file into.
+        :return: List of (start, end) byte ranges covering the whole file in order.
+        """
+        size = os.path.getsize(self.source)
+        boundaries = [0]
+        with open(self.source, 'rb') as file:
+            for i in range(1, count):
+                file.seek(max(size * i // count - 1, boundaries[-1]))
+                # skip to the start of the next line, then to the next spectrum
+                file.readline()
+                position = file.tell()
+                for line in file:
+                    if line.startswith(b"BEGIN IONS"):
+                        break
+                    position += len(line)
+                if position >= size:
+                    break
+                if position > boundaries[-1]:
+                    boundaries.append(position)
+        boundaries.append(size)
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    def batches(self, size: int = 1024) -> Iterator[SpectrumBatch]:
+        """Read the MGF file in batches of spectra.
+        Parameters:
+        :param size: Maximum number of spectra per batch.
+        :return: Iterator of columnar spectrum batches.
+        """
+        spectra = list()
+        for spectrum in self:
+            spectra.append(spectrum)
+            if len(spectra) == size:
+                yield SpectrumBatch(spectra)
+                spectra = list()
+        if spectra:
+            yield SpectrumBatch(spectra)
+
+    def parse(self, lines: Iterable[bytes]) -> Iterator[Spectrum]:
+        """Parse the lines of an MGF file, holding only the spectrum that is currently read in memory.
+        Parameters:
+        :param lines: Lines of the MGF file as bytes.
+        :return: Iterator of the parsed spectra.
+        """
+        entry = None
+        peaks = list()
+        for line in lines:
+            if line.startswith(b"BEGIN IONS"):
+                entry = Spectrum('')
+                peaks = list()
+            elif line.startswith(b"TITLE"):
+                entry.setTitle(line.split(b'=', 1)[1].strip().decode())
+            elif line.startswith(b"PEPMASS"):
+                entry.setPepMass(float(line.split(b'=')[1].strip()))
+            elif line.startswith(b"CHARGE"):
+                entry.setCharge(int(line.split(b'=')[1].strip().split(b'+')[0]))
+            elif line.startswith(b"SCANS"):
+                entry.setScan(int(line.split(b'=')[1].strip()))
+            elif line.startswith(b"RTINSECONDS"):
+                entry.setRTInSeconds(float(line.split(b'=')[1].strip()))
+            elif line.startswith(b"SEQ"):
+                entry.setSequence(line.split(b'=', 1)[1].strip().decode())
+            elif line.startswith(b"END IONS"):
+                if peaks:
+                    # parse all peaks of the spectrum at once into an (n, 2) array of m/z and intensity
+                    values = np.array(b' '.join(peaks).split(), dtype=np.float64).reshape(-1, 2)
+                    entry.setPeaks(values[:, 0], values[:, 1])
+                yield entry
+                entry = None
+            elif self.readPeaks and entry is not None and line.strip() and b'=' not in line:
+                peaks.append(line)
+
+
+if __name__ == "__main__":
+    for entry in MGFReader("../../Data/Datasets/Pool_49/01640c_BA7-Thermo_SRM_Pool_49_01_01-3xHCD-1h-R2.mgf"):
+        print(entry.getScan(), entry.getPepMass(), entry.getCharge(), entry.getPeakCount())
@@ -0,0 +1,161 @@
+from typing import Tuple, Sequence
+
+import numpy as np
+
+
+def formatPeaks(mz: np.ndarray, intensity: np.ndarray) -> str:
+    """Format peaks as MGF peak lines with a single format call instead of one f-string per peak.
+    Parameters:
+    :param mz: m/z values of the peaks.
+    :param intensity: Intensities of the peaks.
+    :return: Peak lines, each terminated by a newline.
+    """
+    peaks = np.empty(2 * len(mz), dtype=np.float64)
+    peaks[0::2] = mz
+    peaks[1::2] = intensity
+    # %r formats python floats exactly like f"{value}"
+    return ('%r %r\n' * len(mz)) % tuple(peaks.tolist())
+
+
+def formatNumber(value: float) -> str:
+    """Format a header value, missing values are stored as -1 and written as such."""
+    return '-1' if value == -1 else repr(value)
+
+
+def formatSpectrum(title: str, pepmass, charge: int, scan: int, rtinseconds, sequence: str, peaks: str) -> str:
+    """Format a spectrum in the MGF format, which is read by DeepNovo.
+    Parameters:
+    :param title: Title of the spectrum.
+    :param pepmass: Precursor m/z.
+    :param charge: Precursor charge.
+    :param scan: Scan number.
+    :param rtinseconds: Retention time in seconds.
+    :param sequence: Sequence written to the SEQ field.
+    :param peaks: Peak lines as returned by formatPeaks.
+    :return: Spectrum in the MGF format.
+    """
+    # a spectrum without peaks still has an empty line between the header and END IONS
+    if not peaks:
+        peaks = '\n'
+    return f"BEGIN IONS\nTITLE={title}\nPEPMASS={pepmass}\nCHARGE={charge}+\nSCANS={scan}\nRTINSECONDS={rtinseconds}\nSEQ={sequence}\n{peaks}END IONS\n"
+
+
+class Spectrum:
+    __slots__ = ('title', 'sequence', 'scan', 'charge', 'rtinseconds', 'pepmass', 'mz', 'intensity')
+
+    def __init__(self, sequence:str):
+        self.title = 'title'
+        self.sequence = sequence
+        self.scan = -1
+        self.charge = -1
+        self.rtinseconds = -1
+        self.pepmass = -1
+        self.mz = np.empty(0, dtype=np.float64)
+        self.intensity = np.empty(0, dtype=np.float64)
+
+    def setTitle(self, title:str):
+        self.title = title
+
+    def setSequence(self, sequence:str):
+        self.sequence = sequence
+
+    def setScan(self, scan:int):
+        self.scan = scan
+
+    def setCharge(self, charge:int):
+        self.charge = charge
+
+    def setRTInSeconds(self, rtinseconds:float):
+        self.rtinseconds = rtinseconds
+
+    def setPepMass(self, pepmass:float):
+        self.pepmass = pepmass
+
+    def setPeaks(self, mz:np.ndarray, intensity:np.ndarray):
+        self.mz = np.asarray(mz, dtype=np.float64)
+        self.intensity = np.asarray(intensity, dtype=np.float64)
+
+    def addPeak(self, peak:Tuple[float, float]):
+        self.mz = np.append(self.mz, peak[0])
+        self.intensity = np.append(self.intensity, peak[1])
+
+    def getScan(self):
+        return self.scan
+
+    def getPeakCount(self):
+        return len(self.mz)
+
+    def getPepMass(self):
+        return self.pepmass
+
+    def getCharge(self):
+        return self.charge
+
+    def __str__(self):
+        return formatSpectrum(self.title, self.pepmass, self.charge, self.scan, self.rtinseconds, self.sequence,
+                              formatPeaks(self.mz, self.intensity))
+
+
+class SpectrumBatch:
+    __slots__ = ('titles', 'sequences', 'scans', 'charges', 'rtinseconds', 'pepmasses', 'offsets', 'mz', 'intensity')
+
+    def __init__(self, spectra:Sequence[Spectrum]):
+        """Columnar container for many spectra. The peaks of all spectra are stored in two flat arrays, the peaks of
+        spectrum i are mz[offsets[i]:offsets[i+1]] and intensity[offsets[i]:offsets[i+1]].
+        Parameters:
+        :param spectra: Spectra to store in the batch.
+        """
+        self.titles = [spectrum.title for spectrum in spectra]
+        self.sequences = [spectrum.sequence for spectrum in spectra]
+        self.scans = np.fromiter((spectrum.scan for spectrum in spectra), dtype=np.int64, count=len(spectra))
+        self.charges = np.fromiter((spectrum.charge for spectrum in spectra), dtype=np.int64, count=len(spectra))
+        self.rtinseconds = np.fromiter((spectrum.rtinseconds for spectrum in spectra), dtype=np.float64, count=len(spectra))
+        self.pepmasses = np.fromiter((spectrum.pepmass for spectrum in spectra), dtype=np.float64, count=len(spectra))
+        self.offsets = np.zeros(len(spectra) + 1, dtype=np.int64)
+        np.cumsum([spectrum.getPeakCount() for spectrum in spectra], out=self.offsets[1:])
+        self.mz = np.concatenate([spectrum.mz for spectrum in spectra] or [np.empty(0)]).astype(np.float64, copy=False)
+        self.intensity = np.concatenate([spectrum.intensity for spectrum in spectra] or [np.empty(0)]).astype(np.float64, copy=False)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __getitem__(self, idx:int) -> Spectrum:
+        spectrum = Spectrum(self.sequences[idx])
+        spectrum.setTitle(self.titles[idx])
+        spectrum.setScan(int(self.scans[idx]))
+        spectrum.setCharge(int(self.charges[idx]))
+        spectrum.setRTInSeconds(float(self.rtinseconds[idx]))
+        spectrum.setPepMass(float(self.pepmasses[idx]))
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        spectrum.setPeaks(self.mz[start:end], self.intensity[start:end])
+        return spectrum
+
+    def setSequence(self, sequence:str):
+        self.sequences = [sequence] * len(self)
+
+    def getScans(self) -> np.ndarray:
+        return self.scans
+
+    def getPeakCounts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def getPepMasses(self) -> np.ndarray:
+        return self.pepmasses
+
+    def getCharges(self) -> np.ndarray:
+        return self.charges
+
+    def toMGF(self) -> str:
+        """Serialize all spectra of the batch in the MGF format.
+        :return: Spectra in the MGF format, identical to writing str() of every spectrum.
+        """
+        # format the values of all peaks at once and split the lines per spectrum afterwards
+        peak_lines = formatPeaks(self.mz, self.intensity).splitlines(keepends=True)
+        offsets = self.offsets.tolist()
+        rtinseconds = self.rtinseconds.tolist()
+        pepmasses = self.pepmasses.tolist()
+        return ''.join(
+            formatSpectrum(title, formatNumber(pepmass), charge, scan, formatNumber(rt), sequence,
+                           ''.join(peak_lines[offsets[idx]:offsets[idx + 1]]))
+            for idx, (title, pepmass, charge, scan, rt, sequence) in enumerate(
+                zip(self.titles, pepmasses, self.charges.tolist(), self.scans.tolist(), rtinseconds, self.sequences)))
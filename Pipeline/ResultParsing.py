@@ -1,116 +1,213 @@
+import os
+from typing import Dict, Iterable, Iterator, List, Tuple
+
 import pandas as pd
+from joblib import Parallel, delayed
 
 from Pipeline.AlgorithmResultParsers.DeepNovoParser import DeepNovoParser
 from Pipeline.AlgorithmResultParsers.DirecTagParser import DirecTagParser
 from Pipeline.AlgorithmResultParsers.NovorParser import NovorParser
 from Pipeline.AlgorithmResultParsers.PEAKSParser import PEAKSParser
+from Pipeline.GroundTruth import GroundTruth, msmsScansFile
+from Pipeline.Instrumentation import stage
+from Pipeline.ResultStore import saveResult
+from Pipeline.StageCache import StageCache
+
+
+# parser of each algorithm, the arguments it is created with and the column joining its results to the actual
+# sequences: 'Scan' is the scan number, 'ID' the row of the spectrum in msmsScans.txt
+PARSERS = {
+    'peaks': (PEAKSParser, {}, 'Scan'),
+    'direcTag': (DirecTagParser, {'skipNLines': 25}, 'ID'),
+    'novor': (NovorParser, {'skipNLines': 20}, 'ID'),
+    'deepnovo': (DeepNovoParser, {}, 'Scan'),
+}
+
+
+def registerParser(algorithm: str, parser: type, arguments: dict, join: str):
+    """Register the parser of an algorithm, so its results can be read by readResult and ingestResults.
+    Parameters:
+    :param algorithm: Name of the algorithm, used in the names of the output files.
+    :param parser: AParser subclass reading the result file of the algorithm.
+    :param arguments: Arguments passed to the parser in addition to the result file.
+    :param join: Column joining the parsed results to the actual sequences, either 'Scan' or 'ID'.
+    """
+    if join not in ('Scan', 'ID'):
+        raise ValueError(f"Unknown join column {join}, expected Scan or ID.")
+    PARSERS[algorithm] = (parser, arguments, join)
+
+
+def parseResult(registration: tuple, file: str) -> pd.DataFrame:
+    """Parse the result file of an algorithm.
+    Parameters:
+    :param registration: Parser, arguments and join column of the algorithm as stored in PARSERS.
+    :param file: Path to the result file.
+    :return: DataFrame containing the parsed result.
+    """
+    parser, arguments, _ = registration
+    with stage('parse', parser=parser.__name__, file=file) as record:
+        result = parser(file, **arguments).parse()
+        record.setRowsOut(len(result))
+    return result
+
+
+def joinActualSequences(parsed: pd.DataFrame, ground_truth: GroundTruth, join: str) -> pd.DataFrame:
+    """Merge a parsed result with the actual sequences.
+    Parameters:
+    :param parsed: DataFrame containing the parsed result.
+    :param ground_truth: GroundTruth of the pool containing the actual sequences.
+    :param join: 'Scan' to join by scan number, 'ID' to join by the row of the spectrum in msmsScans.txt.
+    :return: DataFrame containing the parsed result merged with the actual sequences.
+    """
+    if join == 'Scan':
+        return ground_truth.joinScan(parsed)
+    return ground_truth.joinRow(parsed)
 
 
-def readPeaksResult(file: str, actual_sequences: pd.DataFrame) -> pd.DataFrame:
+def readResult(algorithm: str, file: str, ground_truth: GroundTruth) -> pd.DataFrame:
+    """Reads the result file of an algorithm.
+    Parameters:
+    :param algorithm: Name of a registered algorithm, e.g. peaks, direcTag, novor or deepnovo.
+    :param file: Path to the result file.
+    :param ground_truth: GroundTruth of the pool containing the actual sequences.
+    :return: DataFrame containing the result merged with the actual sequences.
+    """
+    return joinActualSequences(parseResult(PARSERS[algorithm], file), ground_truth, PARSERS[algorithm][2])
+
+
+def readPeaksResult(file: str, ground_truth: GroundTruth) -> pd.DataFrame:
     """Reads the PEAKS result file.
     Parameters:
     :param file: Path to the PEAKS result file.
     :return: DataFrame containing the PEAKS result merged with the actual sequences.
     """
-    # read PEAKS result
-    peaks_df = PEAKSParser(file).parse()
-    # merge expected and actual sequences for peaks
-    merged_df = pd.merge(peaks_df, actual_sequences, left_on='Scan', right_on='Scan', how='inner')
-    # score the sequences and write the result to a file
-    peaks_result = merged_df  # .query('Actual != \' \'')
-    return peaks_result
+    return readResult('peaks', file, ground_truth)
 
 
-def readDirecTagResult(file: str, actual_sequences: pd.DataFrame) -> pd.DataFrame:
+def readDirecTagResult(file: str, ground_truth: GroundTruth) -> pd.DataFrame:
     """Reads the DirecTag result file.
     Parameters:
     :param file: Path to the DirecTag result file.
     :return: DataFrame containing the DirecTag result merged with the actual sequences.
     """
-    # read DirecTag result
-    direcTag_df = DirecTagParser(file, 25).parse()
-    # merge expected and actual sequences for direcTag
-    merged_df = pd.merge(direcTag_df, actual_sequences, left_on='ID', right_index=True, how='inner')
-    # score the sequences and write the result to a file
-    direcTag_result = merged_df  # .query('Actual != \' \'')
-    return direcTag_result
-
-
-def readNovorResult(file: str, actual_sequences: pd.DataFrame) -> pd.DataFrame:
-    # read Novor result
-    novor_df = NovorParser(file, 20).parse()
-    # merge expected and actual sequences for novor
-    merged_df = pd.merge(novor_df, actual_sequences, left_on='ID', right_index=True, how='inner')
-    # score the sequences and write the result to a file
-    novor_result = merged_df  # .query('Actual != \' \'')
-    return novor_result
-
-
-def readDeepNovoResult(file: str, actual_sequences: pd.DataFrame) -> pd.DataFrame:
-    # read DeepNovo result
-    deepnovo_df = DeepNovoParser(file).parse()
-    # merge expected and actual sequences for deepnovo
-    merged_df = pd.merge(deepnovo_df, actual_sequences, left_on='Scan', right_on='Scan', how='inner')
-    # score the sequences and write the result to a file
-    deepnovo_result = merged_df  # .query('Actual != \' \'')
-    return deepnovo_result
+    return readResult('direcTag', file, ground_truth)
 
 
-if __name__ == "__main__":
-    # read expected sequences for pool 49
+def iterDirecTagResult(file: str, ground_truth: GroundTruth, chunksize: int = 100000) -> Iterator[pd.DataFrame]:
+    """Reads the DirecTag result file in chunks, so the whole result never has to be held in memory.
+    Parameters:
+    :param file: Path to the DirecTag result file.
+    :param ground_truth: GroundTruth of the pool containing the actual sequences.
+    :param chunksize: Maximum number of tags per chunk.
+    :return: Iterator of DataFrames containing the DirecTag result merged with the actual sequences.
+    """
+    for direcTag_df in DirecTagParser(file, 25).iterParse(chunksize):
+        yield ground_truth.joinRow(direcTag_df)
+
+
+def readNovorResult(file: str, ground_truth: GroundTruth) -> pd.DataFrame:
+    return readResult('novor', file, ground_truth)
 
+
+def readDeepNovoResult(file: str, ground_truth: GroundTruth) -> pd.DataFrame:
+    return readResult('deepnovo', file, ground_truth)
+
+
+def readManifest(file: str) -> List[Tuple[str, str, str]]:
+    """Read a manifest of result files to ingest.
+    Parameters:
+    :param file: Path to a tab separated file with the columns Pool, Algorithm and Path.
+    :return: List of (pool, algorithm, path) jobs.
+    """
+    manifest = pd.read_csv(file, sep='\t', header=0, dtype=str)
+    return list(manifest[['Pool', 'Algorithm', 'Path']].itertuples(index=False, name=None))
+
+
+def ingestResults(manifest: Iterable[Tuple[str, str, str]], result_format: str = 'parquet',
+                  output_directory: str = '../Data/ParsingResults', ground_truth_files: Dict[str, str] = None,
+                  cache: StageCache = None, n_jobs: int = -1) -> List[str]:
+    """Parse the result files of many algorithms and pools concurrently and write the standard outputs
+    {algorithm}_results and {algorithm}_results_all_sequences of each job to {output_directory}/{pool}.
+    Parameters:
+    :param manifest: (pool, algorithm, path) jobs, the algorithm has to be registered in PARSERS.
+    :param result_format: Format of the output files: parquet, feather or tsv.
+    :param output_directory: Directory containing one directory per pool for the output files.
+    :param ground_truth_files: msmsScans.txt file of each pool, defaults to msmsScansFile(pool).
+    :param cache: Optional StageCache, jobs whose result file and msmsScans.txt did not change are not parsed again.
+    :param n_jobs: Number of worker processes.
+    :return: Paths of the written output files.
+    """
+    ground_truth_files = dict(ground_truth_files or dict())
+    written, pending = list(), list()
+    for pool, algorithm, path in manifest:
+        if algorithm not in PARSERS:
+            raise ValueError(f"No parser registered for {algorithm}, expected one of {list(PARSERS)}.")
+        ground_truth_files.setdefault(pool, msmsScansFile(pool))
+        key, result = None, None
+        if cache is not None:
+            key = cache.key(f'parse {algorithm} {pool}', [path, ground_truth_files[pool]], PARSERS[algorithm][1])
+            result = cache.get(key)
+        if result is None:
+            pending.append((pool, algorithm, path, key))
+        else:
+            written += writeStandardOutputs(result, pool, algorithm, result_format, output_directory)
+
+    if not pending:
+        return written
+    # the actual sequences are read only once per pool, in the same process pool as the result files
+    pools = list(dict.fromkeys(pool for pool, _, _, _ in pending))
+    tasks = [delayed(GroundTruth(ground_truth_files[pool]).load)() for pool in pools] + \
+            [delayed(parseResult)(PARSERS[algorithm], path) for _, algorithm, path, _ in pending]
+    # results are joined and written in the order of the manifest while the remaining files are still parsed
+    outputs = Parallel(n_jobs=n_jobs, return_as='generator')(tasks)
+    ground_truths = {pool: next(outputs) for pool in pools}
+    for (pool, algorithm, _, key), parsed in zip(pending, outputs):
+        with stage('merge', rows_in=len(parsed), pool=pool, algorithm=algorithm) as record:
+            result = joinActualSequences(parsed, ground_truths[pool], PARSERS[algorithm][2])
+            record.setRowsOut(len(result))
+        if cache is not None:
+            cache.put(key, result)
+        with stage('write', pool=pool, algorithm=algorithm):
+            written += writeStandardOutputs(result, pool, algorithm, result_format, output_directory)
+    return written
+
+
+def writeStandardOutputs(result: pd.DataFrame, pool: str, algorithm: str, result_format: str = 'parquet',
+                         output_directory: str = '../Data/ParsingResults') -> List[str]:
+    """Write the identified and all sequences of a parsed result merged with the actual sequences.
+    Parameters:
+    :param result: Parsed result merged with the actual sequences.
+    :param pool: Name of the pool, e.g. Pool_49.
+    :param algorithm: Name of the algorithm, e.g. direcTag.
+    :param result_format: Format of the output files: parquet, feather or tsv.
+    :param output_directory: Directory containing one directory per pool for the output files.
+    :return: Paths of the written output files.
+    """
+    os.makedirs(f'{output_directory}/{pool}', exist_ok=True)
+    identified_file = f'{output_directory}/{pool}/{algorithm}_results.{result_format}'
+    all_file = f'{output_directory}/{pool}/{algorithm}_results_all_sequences.{result_format}'
+    saveResult(result.query('Actual != \' \''), identified_file)
+    saveResult(result, all_file)
+    return [identified_file, all_file]
+
+if __name__ == "__main__":
     pools = [
         ('Pool_49', 'BA7'),
         ('Pool_52', 'BD7'),
         ('Pool_60', 'BD8')]
+    # format of the parsed results: parquet, feather or tsv
+    result_format = 'parquet'
+    # parse results are only recomputed if the algorithm result or msmsScans.txt changed
+    cache = StageCache('../Data/StageCache')
 
+    manifest = list()
     for p in pools:
-
-        # parse deepnovo result and save to file
-        if False:
-            DeepNovoParser(f"../Data/AlgorithmResults/{p[0]}/DeepNovo/decode_output.tab").parse().to_csv(
-                f"../Data/ParsingResults/{p[0]}/deepnovo_results_raw.tsv", sep='\t', index=None)
-            PEAKSParser(f"../Data/AlgorithmResults/{p[0]}/PEAKS/Sample 1.denovo.csv").parse().to_csv(
-                f"../Data/ParsingResults/{p[0]}/peaks_results_raw.tsv", sep='\t', index=None)
-            DirecTagParser(
-                f"../Data/AlgorithmResults/{p[0]}/DirecTag/Run_1/01640c_{p[1]}-Thermo_SRM_{p[0]}_01_01-3xHCD-1h-R2.tags",
-                25).parse().to_csv(f"../Data/ParsingResults/{p[0]}/direcTag_results_raw.tsv", sep='\t', index=None)
-            NovorParser(
-                f"../Data/AlgorithmResults/{p[0]}/Novor/Run_1/01640c_{p[1]}-Thermo_SRM_{p[0]}_01_01-3xHCD-1h-R2.novor.csv",
-                20).parse().to_csv(f"../Data/ParsingResults/{p[0]}/novor_results_raw.tsv", sep='\t', index=None)
-
-        expected_pool = pd.read_csv(
-            f"../Data/Datasets/{p[0]}/Thermo_SRM_{p[0]}_01_01_3xHCD-1h-R2-tryptic/msmsScans.txt",
-            sep='\t')
-        actualSequence_pool_df = pd.DataFrame(
-            {'Scan': expected_pool['Scan number'], 'Actual': expected_pool['Sequence']})
-
-        # read peaks result
-        # peaks_result = readPeaksResult(f"../Data/AlgorithmResults/{p[0]}/PEAKS/Sample 1.denovo.csv",actualSequence_pool_df)
-        # write the result to a file
-        # peaks_result.query('Actual != \' \'').to_csv(f'../Data/ParsingResults/{p[0]}/peaks_results.tsv', sep='\t', index=None)
-        # peaks_result.to_csv(f'../Data/ParsingResults/{p[0]}/peaks_results_all_sequences.tsv', sep='\t', index=None)
-
-        # read direcTag result
-        direcTag_result = readDirecTagResult(
-            f"../Data/AlgorithmResults/{p[0]}/DirecTag/Run_1/01640c_{p[1]}-Thermo_SRM_{p[0]}_01_01-3xHCD-1h-R2.tags",
-            actualSequence_pool_df)
-        # write the result to a file
-        direcTag_result.query('Actual != \' \'').to_csv(f'../Data/ParsingResults/{p[0]}/direcTag_results.tsv', sep='\t',
-                                                        index=None)
-        direcTag_result.to_csv(f'../Data/ParsingResults/{p[0]}/direcTag_results_all_sequences.tsv', sep='\t', index=None)
-
-        # read novor result
-        # novor_result = readNovorResult(
-        #   f"../Data/AlgorithmResults/{p[0]}/Novor/Run_1/01640c_{p[1]}-Thermo_SRM_{p[0]}_01_01-3xHCD-1h-R2.novor.csv",
-        #  actualSequence_pool_df)
-        # write the result to a file
-        # novor_result.query('Actual != \' \'').to_csv(f'../Data/ParsingResults/{p[0]}/novor_results.tsv', sep='\t', index=None)
-        # novor_result.to_csv(f'../Data/ParsingResults/{p[0]}/novor_results_all_sequences.tsv', sep='\t', index=None)
-
-        # read deepnovo result
-        # deepnovo_result = readDeepNovoResult(f"../Data/AlgorithmResults/{p[0]}/DeepNovo/decode_output.tab",
-        #                                     actualSequence_pool_df)
-        # write the result to a file
-        # deepnovo_result.query('Actual != \' \'').to_csv(f'../Data/ParsingResults/{p[0]}/deepnovo_results.tsv', sep='\t', index=None)
-        # deepnovo_result.to_csv(f'../Data/ParsingResults/{p[0]}/deepnovo_results_all_sequences.tsv', sep='\t', index=None)
+        manifest.append((p[0], 'peaks', f"../Data/AlgorithmResults/{p[0]}/PEAKS/Sample 1.denovo.csv"))
+        manifest.append((p[0], 'direcTag',
+                         f"../Data/AlgorithmResults/{p[0]}/DirecTag/Run_1/01640c_{p[1]}-Thermo_SRM_{p[0]}_01_01-3xHCD-1h-R2.tags"))
+        manifest.append((p[0], 'novor',
+                         f"../Data/AlgorithmResults/{p[0]}/Novor/Run_1/01640c_{p[1]}-Thermo_SRM_{p[0]}_01_01-3xHCD-1h-R2.novor.csv"))
+        manifest.append((p[0], 'deepnovo', f"../Data/AlgorithmResults/{p[0]}/DeepNovo/decode_output.tab"))
+    # parse all results concurrently, jobs can also be read from a file with readManifest
+    for file in ingestResults(manifest, result_format, cache=cache):
+        print(file)
@@ -0,0 +1,174 @@
+import os
+from typing import List, Tuple, Any, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from Pipeline.Instrumentation import stage
+
+# columns containing peptide sequences, which repeat heavily and are stored as categories
+SEQUENCE_COLUMNS = ['Predicted', 'Actual', 'Inclusion']
+# columns identifying a spectrum
+ID_COLUMNS = ['ID', 'Scan']
+
+FORMATS = {'.parquet': 'parquet', '.feather': 'feather', '.tsv': 'tsv'}
+
+
+def getFormat(file: str) -> str:
+    """Get the storage format of a result file from its extension.
+    Parameters:
+    :param file: Path to the result file.
+    :return: One of parquet, feather or tsv.
+    """
+    extension = os.path.splitext(file)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unknown result format {extension}, expected one of {list(FORMATS)}.")
+    return FORMATS[extension]
+
+
+def compactTypes(data: pd.DataFrame) -> pd.DataFrame:
+    """Convert a parsed or scored result to fixed, compact data types.
+    Sequences become categories, scan numbers and IDs int32, scores float32 and other integers int32.
+    Parameters:
+    :param data: Parsed or scored result.
+    :return: Result with compact data types.
+    """
+    data = data.copy()
+    for column in data.columns:
+        if column in SEQUENCE_COLUMNS:
+            data[column] = data[column].astype('category')
+        elif column in ID_COLUMNS and data[column].notna().all():
+            data[column] = data[column].astype(np.int32)
+        elif pd.api.types.is_float_dtype(data[column]):
+            data[column] = data[column].astype(np.float32)
+        elif pd.api.types.is_integer_dtype(data[column]):
+            data[column] = data[column].astype(np.int32)
+    return data
+
+
+def saveResult(data: pd.DataFrame, file: str, compact: bool = True):
+    """Save a parsed or scored result. The format is chosen by the extension: .parquet, .feather or .tsv.
+    Parameters:
+    :param data: Parsed or scored result.
+    :param file: Path to the result file.
+    :param compact: Convert the result to compact data types before saving, ignored for TSV files.
+    """
+    file_format = getFormat(file)
+    with stage('write', rows_in=len(data), file=file):
+        if file_format == 'tsv':
+            data.to_csv(file, sep='\t', index=None)
+            return
+        data = (compactTypes(data) if compact else data).reset_index(drop=True)
+        if file_format == 'parquet':
+            data.to_parquet(file, index=False)
+        else:
+            data.to_feather(file)
+
+
+def saveResultChunks(chunks: Iterable[pd.DataFrame], file: str):
+    """Save a result that arrives in chunks, writing each chunk as soon as it is available.
+    Numeric columns are stored with compact data types, sequences as plain strings, since the categories of the
+    chunks differ.
+    Parameters:
+    :param chunks: Chunks of the parsed or scored result, all with the same columns.
+    :param file: Path to the result file.
+    """
+    file_format = getFormat(file)
+    if file_format == 'tsv':
+        header = True
+        for chunk in chunks:
+            chunk.to_csv(file, sep='\t', index=None, header=header, mode='w' if header else 'a')
+            header = False
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema, writer = None, None
+    try:
+        for chunk in chunks:
+            sequences = [column for column in SEQUENCE_COLUMNS if column in chunk.columns]
+            chunk = compactTypes(chunk).reset_index(drop=True)
+            chunk[sequences] = chunk[sequences].astype(str)
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(file, schema) if file_format == 'parquet' else pa.ipc.new_file(file, schema)
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def loadResult(file: str, columns: List[str] = None, filters: List[Tuple[str, str, Any]] = None) -> pd.DataFrame:
+    """Load a parsed or scored result. For Parquet and Feather files only the requested columns and rows are read.
+    Parameters:
+    :param file: Path to the result file.
+    :param columns: Columns to load, all columns if None.
+    :param filters: Row filters as (column, operator, value) tuples which all have to be fulfilled,
+        e.g. [('Actual', '==', ' ')]. Supported operators are ==, !=, <, <=, >, >=, in and not in.
+    :return: DataFrame containing the result.
+    """
+    file_format = getFormat(file)
+    with stage('read', file=file) as record:
+        if file_format == 'tsv':
+            # round trip parsing reads the stored floats back exactly, so reused scores equal recalculated ones
+            data = pd.read_csv(file, sep='\t', index_col=None, header=0, float_precision='round_trip')
+            for column, operator, value in filters or []:
+                data = data[_filterMask(data[column], operator, value)]
+            data = data.reset_index(drop=True) if columns is None else data[columns].reset_index(drop=True)
+        else:
+            import pyarrow.dataset as ds
+            import pyarrow.parquet as pq
+            dataset = ds.dataset(file, format='parquet' if file_format == 'parquet' else 'ipc')
+            expression = pq.filters_to_expression(filters) if filters else None
+            data = dataset.to_table(columns=columns, filter=expression).to_pandas()
+        record.setRowsOut(len(data))
+    return data
+
+
+def iterResult(file: str, chunksize: int = 100000, columns: List[str] = None) -> Iterator[pd.DataFrame]:
+    """Load a parsed or scored result in chunks, e.g. to aggregate it without holding all rows in memory.
+    Parameters:
+    :param file: Path to the result file.
+    :param chunksize: Maximum number of rows per chunk.
+    :param columns: Columns to load, all columns if None.
+    :return: Iterator of DataFrames in the order of the rows.
+    """
+    file_format = getFormat(file)
+    if file_format == 'tsv':
+        for chunk in pd.read_csv(file, sep='\t', index_col=None, header=0, usecols=columns, chunksize=chunksize,
+                                 float_precision='round_trip'):
+            yield chunk if columns is None else chunk[columns]
+        return
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(file, format='parquet' if file_format == 'parquet' else 'ipc')
+    for batch in dataset.to_batches(columns=columns, batch_size=chunksize):
+        yield batch.to_pandas()
+
+
+def _filterMask(values: pd.Series, operator: str, value) -> pd.Series:
+    """Evaluate a (column, operator, value) filter on a column."""
+    if operator in ('==', '='):
+        return values == value
+    if operator == '!=':
+        return values != value
+    if operator == '<':
+        return values < value
+    if operator == '<=':
+        return values <= value
+    if operator == '>':
+        return values > value
+    if operator == '>=':
+        return values >= value
+    if operator == 'in':
+        return values.isin(value)
+    if operator == 'not in':
+        return ~values.isin(value)
+    raise ValueError(f"Unknown filter operator {operator}.")
+
+
+if __name__ == "__main__":
+    result = loadResult("../Data/ParsingResults/Pool_49/direcTag_results_all_sequences.tsv")
+    saveResult(result, "../Data/ParsingResults/Pool_49/direcTag_results_all_sequences.parquet")
+    print(loadResult("../Data/ParsingResults/Pool_49/direcTag_results_all_sequences.parquet",
+                     columns=['ID', 'Predicted', 'Actual'], filters=[('Actual', '!=', ' ')]))
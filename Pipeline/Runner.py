@@ -0,0 +1,442 @@
+import argparse
+import copy
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Tuple
+
+from joblib.externals.loky import get_reusable_executor
+
+from Pipeline.GroundTruth import GroundTruth
+from Pipeline.Instrumentation import collectRecords, enableProfiling, saveChromeTrace, stage, summarizeRecords
+from Pipeline.ResultParsing import PARSERS, readResult, writeStandardOutputs
+from Pipeline.ResultStore import iterResult, saveResult
+from Pipeline.Scheduler import defaultJobs
+from Pipeline.StreamingAggregator import aggregateChunks
+
+# settings of the __main__ blocks of ResultParsing, ScoreCalculation, ScoreCalculationUnidentified and
+# DeepNovoPreProcessor, every entry can be overridden by the experiment config
+DEFAULT_CONFIG = {
+    # relative paths are resolved against the directory of the config file
+    'data': '../Data',
+    'result_format': 'parquet',
+    # number of nodes run at the same time, all cores if null
+    'jobs': None,
+    # number of worker processes of each scoring, preprocessing and matching node
+    'node_jobs': 1,
+    'pools': {'Pool_49': 'BA7', 'Pool_52': 'BD7', 'Pool_60': 'BD8'},
+    'algorithms': ['peaks', 'direcTag', 'novor', 'deepnovo'],
+    'stages': {'preprocess': False, 'parse': True, 'score': True},
+    # algorithms whose unidentified predictions are matched against the inclusion list and scored
+    'unidentified': ['direcTag'],
+    # algorithms whose scores are averaged per ID
+    'aggregate': ['direcTag'],
+    'preprocess_sequence': 'PEPTIDE',
+    'scoring': {
+        'default': {'alignment_mode': 'global', 'gap_open': -2, 'gap_ext': -2},
+        'direcTag': {'alignment_mode': 'local', 'gap_open': -10, 'gap_ext': -10},
+    },
+    # sqlite database of a ScoreCache shared by all scoring nodes, also by nodes running at the same time, disabled if
+    # null
+    'score_cache': None,
+    # rescore only the pairs which changed since the last run and update the averages of their IDs
+    'incremental': False,
+    # align with the batched array kernel of VectorizedAlignment, which gives the same scores as PairwiseAligner
+    'vectorized': False,
+    # directory for the stage records, the Chrome trace and the summary of the run, disabled if null
+    'profile': None,
+    'state_file': '{data}/StageCache/runner_state.json',
+    # file patterns, filled with {data}, {pool}, {sample}, {algorithm} and {format}
+    'files': {
+        'mgf': '{data}/Datasets/{pool}/01640c_{sample}-Thermo_SRM_{pool}_01_01-3xHCD-1h-R2.mgf',
+        'preprocessed': '{data}/Datasets/{pool}/01640c_{sample}-Thermo_SRM_{pool}_01_01-3xHCD-1h-R2_deepnovo.mgf',
+        'msms_scans': '{data}/Datasets/{pool}/Thermo_SRM_{pool}_01_01_3xHCD-1h-R2-tryptic/msmsScans.txt',
+        'peptides': '{data}/Datasets/{pool}/Thermo_SRM_{pool}_01_01_3xHCD-1h-R2-tryptic/peptides.txt',
+        'results': {
+            'peaks': '{data}/AlgorithmResults/{pool}/PEAKS/Sample 1.denovo.csv',
+            'direcTag': '{data}/AlgorithmResults/{pool}/DirecTag/Run_1/01640c_{sample}-Thermo_SRM_{pool}_01_01-3xHCD-1h-R2.tags',
+            'novor': '{data}/AlgorithmResults/{pool}/Novor/Run_1/01640c_{sample}-Thermo_SRM_{pool}_01_01-3xHCD-1h-R2.novor.csv',
+            'deepnovo': '{data}/AlgorithmResults/{pool}/DeepNovo/decode_output.tab',
+        },
+        # the parsed results are written to {parsed}/{pool}/{algorithm}_results.{format} by writeStandardOutputs
+        'parsed': '{data}/ParsingResults',
+        'scored': '{data}/ScoringResults/{pool}/{algorithm}_scored.{format}',
+        'grouped': '{data}/ScoringResults/{pool}/{algorithm}_scored_grouped.{format}',
+        'matches': '{data}/ScoringResults_Unidentified/CheckInclusionList/{pool}_{algorithm}_similarity_100_match.tsv',
+        'unidentified_scored': '{data}/ScoringResults_Unidentified/CheckInclusionList/{pool}/{algorithm}_scored.{format}',
+        'unidentified_grouped':
+            '{data}/ScoringResults_Unidentified/CheckInclusionList/{pool}/{algorithm}_scored_grouped.{format}',
+    },
+}
+
+
+def makeDirectories(*files: str):
+    for file in files:
+        os.makedirs(os.path.dirname(file) or '.', exist_ok=True)
+
+
+def preprocessNode(mgf: str, destination: str, sequence: str, n_jobs: int = 1):
+    from Pipeline.Preprocessing.DeepNovoPreProcessor import DeepNovoPreProcessor
+    DeepNovoPreProcessor(destination, sequence).process(mgf, n_jobs=n_jobs)
+
+
+def parseNode(algorithm: str, pool: str, result_file: str, msms_file: str, parsed_directory: str, result_format: str):
+    result = readResult(algorithm, result_file, GroundTruth(msms_file))
+    writeStandardOutputs(result, pool, algorithm, result_format, parsed_directory)
+
+
+def scoreNode(parsed_file: str, scored_file: str, scoring: dict, n_jobs: int = 1, score_cache: str = None,
+              vectorized: bool = False):
+    from Pipeline.ScoreCalculation import processParsed
+    from Pipeline.Scoring.ScoreCache import ScoreCache
+    makeDirectories(scored_file)
+    cache = ScoreCache(database=score_cache) if score_cache is not None else None
+    try:
+        saveResult(processParsed(parsed_file, **scoring, n_jobs=n_jobs, cache=cache, vectorized=vectorized),
+                   scored_file)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def scoreIncrementalNode(parsed_file: str, scored_file: str, grouped_file: str, scoring: dict, n_jobs: int = 1,
+                         score_cache: str = None, vectorized: bool = False):
+    from Pipeline.ScoreCalculation import scoreIncrementally
+    from Pipeline.Scoring.ScoreCache import ScoreCache
+    makeDirectories(scored_file, *([grouped_file] if grouped_file is not None else []))
+    cache = ScoreCache(database=score_cache) if score_cache is not None else None
+    try:
+        scoreIncrementally(parsed_file, scored_file, grouped_file, **scoring, n_jobs=n_jobs, cache=cache,
+                           vectorized=vectorized)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def matchNode(all_file: str, pool: str, algorithm: str, peptides_file: str, match_file: str, scoring: dict,
+              n_jobs: int = 1):
+    from Pipeline.ScoreCalculationUnidentified import findPerfectSimilarityMatchInclusionList
+    makeDirectories(match_file)
+    findPerfectSimilarityMatchInclusionList(all_file, pool, algorithm, **scoring,
+                                            ground_truth=GroundTruth(peptides_file=peptides_file), n_jobs=n_jobs,
+                                            match_file=match_file)
+
+
+def scoreUnidentifiedNode(all_file: str, pool: str, algorithm: str, peptides_file: str, match_file: str,
+                          scored_file: str, scoring: dict, n_jobs: int = 1, score_cache: str = None):
+    from Pipeline.ScoreCalculationUnidentified import processParsed
+    from Pipeline.Scoring.ScoreCache import ScoreCache
+    makeDirectories(scored_file)
+    cache = ScoreCache(database=score_cache) if score_cache is not None else None
+    try:
+        saveResult(processParsed(all_file, pool, algorithm, **scoring,
+                                 ground_truth=GroundTruth(peptides_file=peptides_file), n_jobs=n_jobs, cache=cache,
+                                 match_file=match_file), scored_file)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def aggregateNode(scored_file: str, grouped_file: str):
+    makeDirectories(grouped_file)
+    # the scored result is averaged chunk by chunk, the result equals groupByIdAndAverage
+    saveResult(aggregateChunks(iterResult(scored_file)).reset_index(), grouped_file)
+
+
+class Node:
+    def __init__(self, name: str, function: Callable, parameters: dict, inputs: List[str], outputs: List[str],
+                 settings: dict = None, tags: dict = None):
+        """A node of the pipeline graph, i.e. one stage for one pool and algorithm.
+        Parameters:
+        :param name: Unique name of the node, e.g. 'score Pool_49 direcTag'.
+        :param function: Function running the node, called with the parameters and settings as keyword arguments.
+        :param parameters: Arguments which change the outputs. The node is run again if they change.
+        :param inputs: Files read by the node, either produced by other nodes or given.
+        :param outputs: Files written by the node.
+        :param settings: Arguments which do not change the outputs, e.g. the number of worker processes.
+        :param tags: Tags of the node in the profile, e.g. stage, pool and algorithm.
+        """
+        self.name = name
+        self.function = function
+        self.parameters = parameters
+        self.inputs = [os.path.normpath(file) for file in inputs]
+        self.outputs = [os.path.normpath(file) for file in outputs]
+        self.settings = settings or dict()
+        self.tags = tags or dict()
+        self.dependencies = list()
+
+    def hash(self) -> str:
+        description = {'function': self.function.__name__, 'parameters': self.parameters}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def mergeConfig(defaults: dict, overrides: dict) -> dict:
+    """Merge a config into the defaults, dictionaries are merged recursively, all other values are replaced."""
+    merged = copy.deepcopy(defaults)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = mergeConfig(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def loadConfig(file: str = None) -> dict:
+    """Load an experiment config from a TOML or JSON file and complete it with DEFAULT_CONFIG.
+    Parameters:
+    :param file: Path to the config file, .toml or .json. If None, the defaults are used.
+    :return: Complete config, the data and profile directories and the score cache are absolute paths.
+    """
+    config, directory = dict(), os.getcwd()
+    if file is not None:
+        if file.endswith('.toml'):
+            import tomllib
+            with open(file, 'rb') as toml:
+                config = tomllib.load(toml)
+        else:
+            with open(file, 'r') as data:
+                config = json.load(data)
+        directory = os.path.dirname(os.path.abspath(file))
+    # the pools of the config replace the default pools instead of adding to them
+    config = {**mergeConfig(DEFAULT_CONFIG, config), 'pools': config.get('pools', DEFAULT_CONFIG['pools'])}
+    config['data'] = os.path.normpath(os.path.join(directory, config['data']))
+    for setting in ['profile', 'score_cache']:
+        if config[setting] is not None:
+            config[setting] = os.path.normpath(os.path.join(directory, config[setting]))
+    unknown = [algorithm for algorithm in config['algorithms'] if algorithm not in PARSERS]
+    if unknown:
+        raise ValueError(f"No parser registered for {unknown}, expected any of {list(PARSERS)}.")
+    return config
+
+
+def buildGraph(config: dict) -> Dict[str, Node]:
+    """Create the nodes preprocess -> parse -> match -> score -> aggregate of every pool and algorithm.
+    Parameters:
+    :param config: Complete config as returned by loadConfig.
+    :return: Dictionary mapping the node names to the nodes in a topological order.
+    """
+    files, stages, result_format = config['files'], config['stages'], config['result_format']
+    node_jobs, score_cache = config['node_jobs'], config['score_cache']
+    # the kernel does not change the scores, so it is a setting and switching it does not make the scores stale
+    score_settings = {'n_jobs': node_jobs, 'score_cache': score_cache, 'vectorized': config['vectorized']}
+    nodes = list()
+    for pool, sample in config['pools'].items():
+        def path(pattern: str, algorithm: str = '') -> str:
+            return pattern.format(data=config['data'], pool=pool, sample=sample, algorithm=algorithm,
+                                  format=result_format)
+
+        if stages.get('preprocess', False):
+            destination = path(files['preprocessed'])
+            distributions = [os.path.join(os.path.dirname(destination), f'mgf_{name}_distribution.tsv')
+                             for name in ['peaks', 'pepmass', 'precursormass']]
+            nodes.append(Node(f'preprocess {pool}', preprocessNode,
+                              {'mgf': path(files['mgf']), 'destination': destination,
+                               'sequence': config['preprocess_sequence']},
+                              [path(files['mgf'])], [destination] + distributions, {'n_jobs': node_jobs},
+                              {'stage': 'preprocess', 'pool': pool}))
+        for algorithm in config['algorithms']:
+            scoring = mergeConfig(config['scoring']['default'], config['scoring'].get(algorithm, dict()))
+            parsed_directory = path(files['parsed'])
+            identified_file = f'{parsed_directory}/{pool}/{algorithm}_results.{result_format}'
+            all_file = f'{parsed_directory}/{pool}/{algorithm}_results_all_sequences.{result_format}'
+            tags = {'pool': pool, 'algorithm': algorithm}
+            if stages.get('parse', True):
+                nodes.append(Node(f'parse {pool} {algorithm}', parseNode,
+                                  {'algorithm': algorithm, 'pool': pool, 'result_file': path(files['results'][algorithm]),
+                                   'msms_file': path(files['msms_scans']), 'parsed_directory': parsed_directory,
+                                   'result_format': result_format},
+                                  [path(files['results'][algorithm]), path(files['msms_scans'])],
+                                  [identified_file, all_file], tags={'stage': 'parse', **tags}))
+            if not stages.get('score', True):
+                continue
+            scored_file = path(files['scored'], algorithm)
+            if config['incremental']:
+                # the averages are updated by the scoring node, which knows the IDs whose rows changed
+                grouped_file = path(files['grouped'], algorithm) if algorithm in config['aggregate'] else None
+                nodes.append(Node(f'score {pool} {algorithm}', scoreIncrementalNode,
+                                  {'parsed_file': identified_file, 'scored_file': scored_file,
+                                   'grouped_file': grouped_file, 'scoring': scoring},
+                                  [identified_file], [scored_file] + ([grouped_file] if grouped_file else []),
+                                  score_settings, {'stage': 'score', **tags}))
+            else:
+                nodes.append(Node(f'score {pool} {algorithm}', scoreNode,
+                                  {'parsed_file': identified_file, 'scored_file': scored_file, 'scoring': scoring},
+                                  [identified_file], [scored_file], score_settings, {'stage': 'score', **tags}))
+            if algorithm in config['aggregate'] and not config['incremental']:
+                grouped_file = path(files['grouped'], algorithm)
+                nodes.append(Node(f'aggregate {pool} {algorithm}', aggregateNode,
+                                  {'scored_file': scored_file, 'grouped_file': grouped_file},
+                                  [scored_file], [grouped_file], tags={'stage': 'aggregate', **tags}))
+            if algorithm not in config['unidentified']:
+                continue
+            match_file = path(files['matches'], algorithm)
+            peptides_file = path(files['peptides'])
+            nodes.append(Node(f'match {pool} {algorithm}', matchNode,
+                              {'all_file': all_file, 'pool': pool, 'algorithm': algorithm,
+                               'peptides_file': peptides_file, 'match_file': match_file, 'scoring': scoring},
+                              [all_file, peptides_file], [match_file], {'n_jobs': node_jobs},
+                              {'stage': 'match', **tags}))
+            unidentified_file = path(files['unidentified_scored'], algorithm)
+            nodes.append(Node(f'score unidentified {pool} {algorithm}', scoreUnidentifiedNode,
+                              {'all_file': all_file, 'pool': pool, 'algorithm': algorithm,
+                               'peptides_file': peptides_file, 'match_file': match_file,
+                               'scored_file': unidentified_file, 'scoring': scoring},
+                              [all_file, peptides_file, match_file], [unidentified_file],
+                              {'n_jobs': node_jobs, 'score_cache': score_cache},
+                              {'stage': 'score unidentified', **tags}))
+            if algorithm in config['aggregate']:
+                grouped_file = path(files['unidentified_grouped'], algorithm)
+                nodes.append(Node(f'aggregate unidentified {pool} {algorithm}', aggregateNode,
+                                  {'scored_file': unidentified_file, 'grouped_file': grouped_file},
+                                  [unidentified_file], [grouped_file],
+                                  tags={'stage': 'aggregate unidentified', **tags}))
+
+    producers = {output: node.name for node in nodes for output in node.outputs}
+    for node in nodes:
+        node.dependencies = list(dict.fromkeys(producers[file] for file in node.inputs if file in producers))
+    return {node.name: node for node in nodes}
+
+
+def planRun(graph: Dict[str, Node], state: dict, force: bool = False) -> Tuple[List[str], Dict[str, str]]:
+    """Find the nodes which have to run. A node is stale if an output is missing or older than an input, if its
+    parameters changed since its last run, or if a node it depends on is stale.
+    Parameters:
+    :param graph: Nodes as returned by buildGraph.
+    :param state: Hash of the parameters of every node at its last successful run.
+    :param force: Run all nodes.
+    :return: Tuple of the names of the stale nodes in a topological order and the nodes which cannot run with the
+        reason, e.g. a missing input file.
+    """
+    stale, blocked = list(), dict()
+    for name, node in graph.items():
+        blocking = [dependency for dependency in node.dependencies if dependency in blocked]
+        if blocking:
+            blocked[name] = f'depends on {blocking[0]}'
+            continue
+        produced = {output for dependency in node.dependencies for output in graph[dependency].outputs}
+        missing = [file for file in node.inputs if file not in produced and not os.path.exists(file)]
+        if missing:
+            blocked[name] = f'missing input {missing[0]}'
+            continue
+        if force or any(dependency in stale for dependency in node.dependencies) or state.get(name) != node.hash() or \
+                any(not os.path.exists(file) for file in node.outputs):
+            stale.append(name)
+            continue
+        oldest_output = min(os.path.getmtime(file) for file in node.outputs)
+        if any(os.path.getmtime(file) > oldest_output for file in node.inputs):
+            stale.append(name)
+    return stale, blocked
+
+
+def runNode(function: Callable, parameters: dict, settings: dict, name: str, tags: dict):
+    """Run a node in a worker process and measure it as a stage."""
+    with stage(tags.get('stage', name), node=name, **{key: value for key, value in tags.items() if key != 'stage'}):
+        function(**parameters, **settings)
+
+
+def loadState(file: str) -> dict:
+    if not os.path.exists(file):
+        return dict()
+    with open(file, 'r') as state:
+        return json.load(state)
+
+
+def saveState(state: dict, file: str):
+    makeDirectories(file)
+    with open(f'{file}.{os.getpid()}.tmp', 'w') as output:
+        json.dump(state, output, indent=1)
+    os.replace(f'{file}.{os.getpid()}.tmp', file)
+
+
+def runGraph(graph: Dict[str, Node], stale: List[str], state: dict, state_file: str, jobs: int = None) -> List[str]:
+    """Run the stale nodes, every node as soon as the nodes it depends on are done, up to jobs nodes at a time.
+    Parameters:
+    :param graph: Nodes as returned by buildGraph.
+    :param stale: Names of the nodes to run, in a topological order.
+    :param state: Hash of the parameters of every node at its last successful run, updated after each node.
+    :param state_file: File the state is saved to.
+    :param jobs: Number of nodes run at the same time, all cores if None.
+    :return: Names of the nodes which failed or were skipped because a node they depend on failed.
+    """
+    # loky workers can start worker processes of their own, e.g. for the scoring of a node
+    executor = get_reusable_executor(max_workers=jobs if jobs is not None else defaultJobs())
+    pending, running, done, failed = list(stale), dict(), set(), list()
+    while pending or running:
+        for name in list(pending):
+            dependencies = [dependency for dependency in graph[name].dependencies if dependency in stale]
+            if any(dependency in failed for dependency in dependencies):
+                print(f"Skipping {name}, a node it depends on failed.")
+                pending.remove(name)
+                failed.append(name)
+            elif all(dependency in done for dependency in dependencies):
+                node = graph[name]
+                print(f"Starting {name}")
+                running[executor.submit(runNode, node.function, node.parameters, node.settings, name, node.tags)] = \
+                    (name, time.perf_counter())
+                pending.remove(name)
+        if not running:
+            break
+        finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+        for future in finished:
+            name, start = running.pop(future)
+            try:
+                future.result()
+            except Exception as error:
+                print(f"Failed {name}: {type(error).__name__}: {error}")
+                failed.append(name)
+                continue
+            done.add(name)
+            state[name] = graph[name].hash()
+            saveState(state, state_file)
+            print(f"Finished {name} in {time.perf_counter() - start:.1f} s")
+    return failed
+
+
+def main(arguments: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Run the pipeline preprocess -> parse -> match -> score -> aggregate '
+                                                 'for all pools and algorithms of an experiment config.')
+    parser.add_argument('config', nargs='?', default=None, help='experiment config, .toml or .json')
+    parser.add_argument('--jobs', type=int, default=None, help='number of nodes run at the same time')
+    parser.add_argument('--force', action='store_true', help='run all nodes, not only the stale ones')
+    parser.add_argument('--dry-run', action='store_true', help='only print the nodes which would run')
+    parser.add_argument('--only', nargs='+', default=None,
+                        help='only run the nodes whose name contains one of these words, e.g. Pool_49 or score')
+    args = parser.parse_args(arguments)
+
+    config = loadConfig(args.config)
+    graph = buildGraph(config)
+    state_file = config['state_file'].format(data=config['data'])
+    state = loadState(state_file)
+    stale, blocked = planRun(graph, state, args.force)
+    if args.only is not None:
+        stale = [name for name in stale if any(word in name for word in args.only)]
+    for name, reason in blocked.items():
+        print(f"Cannot run {name}: {reason}")
+    print(f"{len(stale)} of {len(graph)} nodes are stale: {', '.join(stale) if stale else 'nothing to do'}")
+    if args.dry_run or not stale:
+        return 0
+
+    profile = config['profile']
+    if profile is not None:
+        # the records of earlier runs are replaced, the profiling is enabled before the executor starts its workers,
+        # which inherit the profiling directory
+        if os.path.isdir(profile):
+            for name in os.listdir(profile):
+                if name.endswith('.jsonl'):
+                    os.remove(os.path.join(profile, name))
+        enableProfiling(profile)
+    if config['score_cache'] is not None:
+        makeDirectories(config['score_cache'])
+    failed = runGraph(graph, stale, state, state_file, args.jobs if args.jobs is not None else config['jobs'])
+    if profile is not None:
+        records = collectRecords(profile)
+        saveChromeTrace(records, os.path.join(profile, 'trace.json'))
+        summarizeRecords(records).to_csv(os.path.join(profile, 'summary.tsv'), sep='\t', index=None)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import os
+from typing import Callable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+
+
+def defaultJobs() -> int:
+    """Number of worker processes used if none is given: all cores of the machine."""
+    return os.cpu_count() or 1
+
+
+def alignmentCosts(predicted: Sequence[str], actual: Sequence[str] = None) -> np.ndarray:
+    """Estimate the cost of aligning every (predicted, actual) pair, which grows with the product of their lengths.
+    Parameters:
+    :param predicted: Predicted sequences.
+    :param actual: Actual sequences, same length as predicted. If None, the cost only depends on the predicted
+        sequence, e.g. when it is matched against the same inclusion list.
+    :return: Array containing the estimated cost of each pair.
+    """
+    predicted_lengths = pd.Series(predicted, dtype=object).str.len().fillna(0).to_numpy(dtype=np.int64)
+    actual_lengths = pd.Series(actual, dtype=object).str.len().fillna(0).to_numpy(dtype=np.int64) \
+        if actual is not None else np.zeros(len(predicted_lengths), dtype=np.int64)
+    # every pair has a fixed overhead, so empty sequences are not free
+    return (predicted_lengths + 1) * (actual_lengths + 1)
+
+
+def balancedChunks(costs: np.ndarray, count: int) -> List[Tuple[int, int]]:
+    """Split rows into consecutive chunks of roughly equal total cost.
+    Parameters:
+    :param costs: Estimated cost of each row.
+    :param count: Number of chunks to create, fewer are created if there are not enough rows.
+    :return: List of (start, end) row ranges covering all rows in order.
+    """
+    if len(costs) == 0:
+        return [(0, 0)]
+    cumulative = np.cumsum(costs, dtype=np.float64)
+    targets = cumulative[-1] * np.arange(1, count) / count
+    # a row belongs to the chunk containing the middle of its cost, so an expensive row gets a chunk of its own
+    centers = cumulative - np.asarray(costs, dtype=np.float64) / 2
+    boundaries = np.unique(np.concatenate([[0], np.searchsorted(centers, targets), [len(costs)]]).astype(np.int64))
+    return list(zip(boundaries[:-1].tolist(), boundaries[1:].tolist()))
+
+
+def scheduleChunks(function: Callable, data: pd.DataFrame, costs: np.ndarray, *args, n_jobs: int = None,
+                   tasks_per_job: int = 16) -> Iterator:
+    """Apply a function to chunks of a DataFrame in parallel. The rows are split into many small chunks of equal
+    estimated cost, which idle workers take one at a time, so a chunk of long sequences does not hold up the others.
+    Parameters:
+    :param function: Function called with a chunk of the DataFrame and the additional arguments.
+    :param data: DataFrame to process.
+    :param costs: Estimated cost of each row of the DataFrame.
+    :param args: Additional arguments passed to the function.
+    :param n_jobs: Number of worker processes, defaults to all cores.
+    :param tasks_per_job: Number of chunks created per worker process.
+    :return: Iterator of the results of the chunks in the order of the rows, available while later chunks are
+        still processed.
+    """
+    n_jobs = effective_n_jobs(n_jobs if n_jobs is not None else defaultJobs())
+    chunks = balancedChunks(costs, n_jobs * tasks_per_job if n_jobs > 1 else 1)
+    return Parallel(n_jobs=n_jobs, return_as='generator', batch_size=1)(
+        delayed(function)(data.iloc[start:end], *args) for start, end in chunks)
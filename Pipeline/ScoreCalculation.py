@@ -1,11 +1,19 @@
+import json
+import os
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
 import pandas as pd
 from joblib import Parallel, delayed
 
-from Scoring.AlignmentScore import AlignmentScore
-from Scoring.LevenshteinDistance import LevenshteinDistance
-from Scoring.NormalizedAlignmentScore import NormalizedAlignmentScore
-from Scoring.SequenceIdentity import SequenceIdentity
-from Scoring.SequenceSimilarity import SequenceSimilarity
+from Pipeline.Instrumentation import stage
+from Pipeline.ResultStore import compactTypes, getFormat, iterResult, loadResult, saveResult, saveResultChunks
+from Pipeline.Scheduler import defaultJobs
+from Pipeline.StageCache import StageCache
+from Pipeline.StreamingAggregator import StreamingAggregator
+from Pipeline.Scoring.BatchScore import scoreMany
+from Pipeline.Scoring.ScoreCache import ScoreCache
+from Pipeline.Scoring.CombinedScore import SCORE_COLUMNS
 
 import warnings
 
@@ -15,106 +23,249 @@ RESULT_CLOUMNS = ['ID', 'Predicted', 'Actual', 'Score', 'Similarity', 'Identity'
                   'Normalized Local Alignment', 'Normalized Global Alignment', 'Levenshtein']
 
 
-def calculateScores(entry, alignment_mode: str = 'global', gap_open = -2, gap_ext=-2) -> list:
-    """Calculate the similarity and identity of two sequences.
-    Parameters:
-    :param entry: DataFrame entry containing the predicted and actual sequence.
-    :return: List containing the predicted sequence, the actual sequence, the similarity score, and the identity score.
-        """
-    identiy = SequenceIdentity(alignment_mode=alignment_mode, open_gap_score=gap_open, extend_gap_score=gap_ext)
-    similarity = SequenceSimilarity(alignment_mode=alignment_mode, open_gap_score=gap_open, extend_gap_score=gap_ext)
-    localAlignmentScore = AlignmentScore(alignment_mode='local', open_gap_score=gap_open, extend_gap_score=gap_ext)
-    globalAlignmentScore = AlignmentScore(alignment_mode='global', open_gap_score=gap_open, extend_gap_score=gap_ext)
-    normalizedLocalAlignmentScore = NormalizedAlignmentScore(alignment_mode='local', open_gap_score=gap_open, extend_gap_score=gap_ext)
-    normalizedGlobalAlignmentScore = NormalizedAlignmentScore(alignment_mode='global', open_gap_score=gap_open, extend_gap_score=gap_ext)
-    levenshtein = LevenshteinDistance()
-    return [
-        entry['ID'] if 'ID' in entry else entry['Scan'],
-        entry['Predicted'], entry['Actual'], entry['Score'],
-        similarity.getScore(predicted=entry['Predicted'], actual=entry['Actual']),
-        identiy.getScore(predicted=entry['Predicted'], actual=entry['Actual']),
-        localAlignmentScore.getScore(predicted=entry['Predicted'], actual=entry['Actual']),
-        globalAlignmentScore.getScore(predicted=entry['Predicted'], actual=entry['Actual']),
-        normalizedLocalAlignmentScore.getScore(predicted=entry['Predicted'], actual=entry['Actual']),
-        normalizedGlobalAlignmentScore.getScore(predicted=entry['Predicted'], actual=entry['Actual']),
-        levenshtein.getScore(predicted=entry['Predicted'], actual=entry['Actual'])]
-
-
-def calculateChunkIndex(len_df, num_cores):
-    """Calculate the start and end indices for each chunk.
+def calculateScoresOfChunk(subset_df, alignment_mode: str = 'global', gap_open=-2, gap_ext=-2, n_jobs: int = 1,
+                           cache: ScoreCache = None, vectorized: bool = False):
+    """Calculate the scores of all sequence pairs of a DataFrame.
     Parameters:
-    :param len_df: Length of the DataFrame.
-    :param num_cores: Number of cores to use for parallel processing.
-    :return: List of tuples containing the start and end indices for each chunk.
+    :param subset_df: DataFrame containing the ID or Scan, the predicted and actual sequence and the algorithm score.
+    :param n_jobs: Number of worker processes scoring the pairs, None for all cores.
+    :param cache: Optional ScoreCache, pairs scored before are not aligned again.
+    :param vectorized: Align the pairs in batches with the array kernel of VectorizedAlignment.
+    :return: DataFrame containing the result columns.
     """
-    # Calculate the chunk size
-    chunk_size = len_df // num_cores
-    # Initialize a list to store start and end indices for each chunk
-    chunk_indices = []
-    # Create chunks and calculate start and end indices
-    for i in range(num_cores):
-        start_index = i * chunk_size
-        end_index = (i + 1) * chunk_size if i < num_cores - 1 else len_df
-        chunk_indices.append((start_index, end_index))
-
-    return chunk_indices
-
-
-def calculateScoresOfChunk(subset_df, alignment_mode: str = 'global', gap_open = -2, gap_ext=-2):
-    output = subset_df.apply(lambda x: calculateScores(x, alignment_mode, gap_open, gap_ext), axis=1)
-    output = pd.DataFrame(list(output), columns=RESULT_CLOUMNS)
+    predicted = subset_df['Predicted'].to_numpy()
+    actual = subset_df['Actual'].to_numpy()
+    scores = scoreMany(predicted, actual, alignment_mode, gap_open, gap_ext, n_jobs=n_jobs, cache=cache,
+                       vectorized=vectorized)
+    output = pd.DataFrame({
+        'ID': (subset_df['ID'] if 'ID' in subset_df.columns else subset_df['Scan']).to_numpy(),
+        'Predicted': predicted, 'Actual': actual, 'Score': subset_df['Score'].to_numpy(), **scores},
+        columns=RESULT_CLOUMNS)
     return output
 
 
-def processParsed(file: str, alignment_mode: str = 'global', gap_open = -2, gap_ext=-2):
+def processParsed(file: str, alignment_mode: str = 'global', gap_open = -2, gap_ext=-2, n_jobs: int = None,
+                  cache: ScoreCache = None, vectorized: bool = False):
     # read parsed result
-    parsed_df = pd.read_csv(file, sep='\t', index_col=None, header=0)
-
-    # define number of cpus and calculate chunk indices for parallel processing
-    cpus = 6  # os.cpu_count()
-    chunk_indices = calculateChunkIndex(len(parsed_df), cpus)
-
-    # define parallel processing object with number of cpus
-    parallel_direcTag = Parallel(n_jobs=cpus)
-    # process the direcTag result in parallel
-    output = parallel_direcTag(
-        delayed(calculateScoresOfChunk)(parsed_df.iloc[chunk[0]:chunk[1], :], alignment_mode, gap_open, gap_ext) for chunk in
-        chunk_indices)
-    # concatenate the results
-    output = pd.concat(output, axis=0)
+    parsed_df = loadResult(file)
+
+    # the pairs are scored by all cpus, which share the sequences and the scores through memory mapped files
+    with stage('score', rows_in=len(parsed_df), file=file) as record:
+        output = calculateScoresOfChunk(parsed_df, alignment_mode, gap_open, gap_ext, n_jobs=n_jobs, cache=cache,
+                                        vectorized=vectorized)
+        record.setRowsOut(len(output))
     return output
 
+def processParsedChunks(chunks: Iterable[pd.DataFrame], alignment_mode: str = 'global', gap_open=-2, gap_ext=-2,
+                        n_jobs: int = None) -> Iterator[pd.DataFrame]:
+    """Score a parsed result that arrives in chunks, e.g. from DirecTagParser.iterParse, without materializing it.
+    Parameters:
+    :param chunks: Chunks of the parsed result containing the ID or Scan, the predicted and actual sequence and the
+        algorithm score.
+    :param n_jobs: Number of chunks scored in parallel, defaults to all cores.
+    :return: Iterator of the scored chunks in the order of the parsed chunks.
+    """
+    # joblib only pulls a few chunks ahead of the workers, so memory stays bounded by the chunk size
+    return Parallel(n_jobs=n_jobs if n_jobs is not None else defaultJobs(), return_as='generator')(
+        delayed(calculateScoresOfChunk)(chunk, alignment_mode, gap_open, gap_ext) for chunk in chunks)
+
+
 def groupByIdAndAverage(data:pd.DataFrame)->pd.DataFrame:
     grouped = data.drop(columns=['Predicted', 'Actual']).groupby('ID').mean()
     return grouped
 
 
+def scoreInChunks(file: str, scored_file: str, alignment_mode: str = 'global', gap_open=-2, gap_ext=-2,
+                  n_jobs: int = None, chunksize: int = 100000, aggregator: StreamingAggregator = None) -> pd.DataFrame:
+    """Score a parsed result chunk by chunk and average the scores per ID while the chunks are written, so neither
+    the parsed nor the scored rows are held in memory at once, e.g. for the many tags of DirecTag.
+    Parameters:
+    :param file: Path to the parsed result.
+    :param scored_file: Path to the scored result.
+    :param n_jobs: Number of chunks scored in parallel, defaults to all cores.
+    :param chunksize: Number of parsed rows per chunk.
+    :param aggregator: Optional StreamingAggregator, e.g. to add the maximum scores or the best tag of every ID.
+    :return: DataFrame indexed by ID, equal to groupByIdAndAverage of the scored result.
+    """
+    aggregator = aggregator if aggregator is not None else StreamingAggregator()
+    chunks = processParsedChunks(iterResult(file, chunksize), alignment_mode, gap_open, gap_ext, n_jobs=n_jobs)
+    saveResultChunks(aggregator.consume(chunks), scored_file)
+    return aggregator.result()
+
+
+def matchScoredRows(parsed_df: pd.DataFrame, scored_df: pd.DataFrame) -> np.ndarray:
+    """Find the scored row of every parsed row with the same ID or Scan, predicted and actual sequence. Repeated pairs
+    of an ID are matched in their order, so a pair occurring twice more than before yields two new rows.
+    Parameters:
+    :param parsed_df: Parsed result containing the ID or Scan, the predicted and actual sequence.
+    :param scored_df: Previously scored result.
+    :return: Index of the matching scored row of every parsed row, -1 for new pairs.
+    """
+    def keys(data: pd.DataFrame, ids: pd.Series) -> pd.DataFrame:
+        keys = pd.DataFrame({'ID': ids.to_numpy(np.int64), 'Predicted': data['Predicted'].astype(str).to_numpy(),
+                             'Actual': data['Actual'].astype(str).to_numpy()})
+        keys['Occurrence'] = keys.groupby(['ID', 'Predicted', 'Actual'], sort=False).cumcount()
+        return keys
+
+    parsed_keys = keys(parsed_df, parsed_df['ID'] if 'ID' in parsed_df.columns else parsed_df['Scan'])
+    scored_keys = keys(scored_df, scored_df['ID'])
+    scored_keys['Row'] = np.arange(len(scored_keys))
+    # a left merge keeps the order of the parsed rows, the keys of the scored rows are unique
+    rows = parsed_keys.merge(scored_keys, how='left', on=['ID', 'Predicted', 'Actual', 'Occurrence'])['Row']
+    return rows.fillna(-1).to_numpy(np.int64)
+
+
+def processParsedIncremental(file: str, scored_df: pd.DataFrame, alignment_mode: str = 'global', gap_open=-2,
+                             gap_ext=-2, n_jobs: int = None, cache: ScoreCache = None,
+                             vectorized: bool = False) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Score a parsed result, reusing the scores of the pairs of a previously scored result of the same algorithm and
+    pool. Only pairs which are new to an ID are aligned, e.g. after DeepNovo decoded a few spectra differently.
+    Parameters:
+    :param file: Path to the parsed result.
+    :param scored_df: Previous result of processParsed with the same alignment parameters, e.g. loaded by loadResult.
+    :param n_jobs: Number of worker processes scoring the new pairs, None for all cores.
+    :param cache: Optional ScoreCache, new pairs scored before are not aligned again.
+    :param vectorized: Align the new pairs with the array kernel of VectorizedAlignment.
+    :return: Tuple of the scored result, with the rows in the order of the parsed result like processParsed, and the
+        IDs whose rows were added, removed or got another algorithm score. The score columns keep the data types of
+        scored_df, the scores of new pairs are rounded to them, so a stored float32 result gives the scores of
+        processParsed rounded to float32.
+    """
+    parsed_df = loadResult(file)
+    with stage('score', rows_in=len(parsed_df), file=file) as record:
+        rows = matchScoredRows(parsed_df, scored_df)
+        new = rows < 0
+        reused = rows[~new]
+        record.count('reused rows', len(reused))
+        new_df = calculateScoresOfChunk(parsed_df[new], alignment_mode, gap_open, gap_ext, n_jobs=n_jobs, cache=cache,
+                                        vectorized=vectorized)
+
+        ids = (parsed_df['ID'] if 'ID' in parsed_df.columns else parsed_df['Scan']).to_numpy()
+        output = pd.DataFrame({'ID': ids, 'Predicted': parsed_df['Predicted'].to_numpy(),
+                               'Actual': parsed_df['Actual'].to_numpy(), 'Score': parsed_df['Score'].to_numpy()})
+        for column in SCORE_COLUMNS:
+            # a column never mixes the stored precision with the precision of the new scores
+            values = np.empty(len(output), dtype=scored_df[column].dtype)
+            values[new] = new_df[column].to_numpy().astype(values.dtype)
+            values[~new] = scored_df[column].to_numpy()[reused]
+            output[column] = values
+        output = output[RESULT_CLOUMNS]
+        record.setRowsOut(len(output))
+
+    # the stored scores may be float32, so the algorithm scores are compared at that precision
+    previous_score = scored_df['Score'].to_numpy(np.float32)[reused]
+    current_score = output['Score'].to_numpy(np.float32)[~new]
+    rescored = (previous_score != current_score) & ~(np.isnan(previous_score) & np.isnan(current_score))
+    removed = np.ones(len(scored_df), dtype=bool)
+    removed[reused] = False
+    changed_ids = np.unique(np.concatenate([ids[new].astype(np.int64), ids[~new][rescored].astype(np.int64),
+                                            scored_df['ID'].to_numpy(np.int64)[removed]]))
+    return output, changed_ids
+
+
+def updateGroupedAverage(grouped: pd.DataFrame, scored_df: pd.DataFrame, changed_ids: np.ndarray) -> pd.DataFrame:
+    """Update the result of groupByIdAndAverage after the rows of some IDs changed, averaging only these IDs again.
+    Parameters:
+    :param grouped: Previous result of groupByIdAndAverage, indexed by ID.
+    :param scored_df: Current scored result.
+    :param changed_ids: IDs whose rows were added, removed or changed, as returned by processParsedIncremental.
+    :return: Result equal to groupByIdAndAverage(scored_df) if grouped was averaged from scores of the same precision.
+    """
+    kept = grouped[~grouped.index.isin(changed_ids)]
+    averaged = groupByIdAndAverage(scored_df[scored_df['ID'].isin(changed_ids)])
+    return pd.concat([kept, averaged.astype(kept.dtypes.to_dict())]).sort_index()
+
+
+def scoreIncrementally(file: str, scored_file: str, grouped_file: str = None, alignment_mode: str = 'global',
+                       gap_open=-2, gap_ext=-2, n_jobs: int = None, cache: ScoreCache = None,
+                       vectorized: bool = False) -> pd.DataFrame:
+    """Score a parsed result and save it, rescoring only the pairs which changed since scored_file was written.
+    The alignment parameters are stored next to the scored result, if they changed all pairs are scored again.
+    Parameters:
+    :param file: Path to the parsed result.
+    :param scored_file: Path to the scored result, read if it exists and overwritten.
+    :param grouped_file: Optional path to the result of groupByIdAndAverage, saved with the ID column. Only the
+        averages of changed IDs are recalculated if it was written by an earlier call.
+    :param n_jobs: Number of worker processes scoring the new pairs, None for all cores.
+    :param cache: Optional ScoreCache, new pairs scored before are not aligned again.
+    :param vectorized: Align the pairs with the array kernel of VectorizedAlignment.
+    :return: DataFrame containing the scored result, with the scores in the precision they are stored in.
+    """
+    parameters = {'alignment_mode': alignment_mode, 'gap_open': gap_open, 'gap_ext': gap_ext}
+    parameter_file = f'{scored_file}.json'
+    previous = None
+    if os.path.exists(scored_file) and os.path.exists(parameter_file):
+        with open(parameter_file, 'r') as stored:
+            if json.load(stored) == parameters:
+                previous = loadResult(scored_file)
+
+    if previous is None:
+        scored_df, changed_ids = processParsed(file, **parameters, n_jobs=n_jobs, cache=cache,
+                                                  vectorized=vectorized), None
+        if getFormat(scored_file) != 'tsv':
+            # the averages are calculated from the stored float32 scores, which later runs reuse
+            scored_df[SCORE_COLUMNS] = compactTypes(scored_df[SCORE_COLUMNS])
+    else:
+        scored_df, changed_ids = processParsedIncremental(file, previous, **parameters, n_jobs=n_jobs,
+                                                              cache=cache, vectorized=vectorized)
+    saveResult(scored_df, scored_file)
+    with open(parameter_file, 'w') as stored:
+        json.dump(parameters, stored)
+
+    if grouped_file is not None:
+        grouped = loadResult(grouped_file) if changed_ids is not None and os.path.exists(grouped_file) else None
+        if grouped is not None and 'ID' in grouped.columns:
+            grouped = updateGroupedAverage(grouped.set_index('ID'), scored_df, changed_ids)
+        else:
+            grouped = groupByIdAndAverage(scored_df)
+        saveResult(grouped.reset_index(), grouped_file)
+    return scored_df
+
+
 if __name__ == "__main__":
     pools = ['Pool_49', 'Pool_52', 'Pool_60']
+    # format of the parsed and scored results: parquet, feather or tsv
+    result_format = 'parquet'
+    # scores are only recomputed if the parsed result or the scoring parameters changed
+    cache = StageCache('../Data/StageCache')
+    # scores of sequence pairs are shared by all pools and algorithms and kept between runs
+    score_cache = ScoreCache(database='../Data/StageCache/scores.sqlite')
 
     for p in pools:
         print("Scoring ", p, " - PEAKS")
         # score peaks
-        #peaks_scored_df = processParsed(f"../Data/ParsingResults/{p}/peaks_results.tsv", alignment_mode='global')
+        #peaks_file = f"../Data/ParsingResults/{p}/peaks_results.{result_format}"
+        #peaks_params = dict(alignment_mode='global')
+        #peaks_scored_df = cache.cached(f'score peaks {p}', [peaks_file], peaks_params,
+        #                               lambda: processParsed(peaks_file, **peaks_params, cache=score_cache))
         # save peaks scores
-        #peaks_scored_df.to_csv(f"../Data/ScoringResults/{p}/peaks_scored.tsv", sep='\t', index=None)
+        #saveResult(peaks_scored_df, f"../Data/ScoringResults/{p}/peaks_scored.{result_format}")
 
         print("Scoring ", p, " - Novor")
         # score novor
-        #novor_scored_df = processParsed(f"../Data/ParsingResults/{p}/novor_results.tsv", alignment_mode='global')
+        #novor_file = f"../Data/ParsingResults/{p}/novor_results.{result_format}"
+        #novor_params = dict(alignment_mode='global')
+        #novor_scored_df = cache.cached(f'score novor {p}', [novor_file], novor_params,
+        #                               lambda: processParsed(novor_file, **novor_params, cache=score_cache))
         # save novor scores
-        #novor_scored_df.to_csv(f"../Data/ScoringResults/{p}/novor_scored.tsv", sep='\t', index=None)
+        #saveResult(novor_scored_df, f"../Data/ScoringResults/{p}/novor_scored.{result_format}")
 
         print("Scoring ", p, " - DeepNovo")
         # score deepnovo
-        #deepnovo_scored_df = processParsed(f"../Data/ParsingResults/{p}/deepnovo_results.tsv", alignment_mode='global')
+        #deepnovo_file = f"../Data/ParsingResults/{p}/deepnovo_results.{result_format}"
+        #deepnovo_params = dict(alignment_mode='global')
+        #deepnovo_scored_df = cache.cached(f'score deepnovo {p}', [deepnovo_file], deepnovo_params,
+        #                                  lambda: processParsed(deepnovo_file, **deepnovo_params, cache=score_cache))
         # save deepnovo scores
-        #deepnovo_scored_df.to_csv(f"../Data/ScoringResults/{p}/deepnovo_scored.tsv", sep='\t', index=None)
+        #saveResult(deepnovo_scored_df, f"../Data/ScoringResults/{p}/deepnovo_scored.{result_format}")
 
         print("Scoring ", p, " - DirecTag")
         # read directag
-        directag_scored_df = processParsed(f"../Data/ParsingResults/{p}/direcTag_results.tsv", alignment_mode='local', gap_open = -10, gap_ext=-10)
+        directag_file = f"../Data/ParsingResults/{p}/direcTag_results.{result_format}"
+        directag_params = dict(alignment_mode='local', gap_open=-10, gap_ext=-10)
+        directag_scored_df = cache.cached(f'score direcTag {p}', [directag_file], directag_params,
+                                          lambda: processParsed(directag_file, **directag_params, cache=score_cache))
         # save directag scores
-        directag_scored_df.to_csv(f"../Data/ScoringResults/{p}/direcTag_scored.tsv", sep='\t', index=None)
+        saveResult(directag_scored_df, f"../Data/ScoringResults/{p}/direcTag_scored.{result_format}")
         # group by ID and average every column
-        groupByIdAndAverage(directag_scored_df).to_csv(f"../Data/ScoringResults/{p}/direcTag_scored_grouped.tsv", sep='\t', index=None)
\ No newline at end of file
+        saveResult(groupByIdAndAverage(directag_scored_df), f"../Data/ScoringResults/{p}/direcTag_scored_grouped.{result_format}")
\ No newline at end of file
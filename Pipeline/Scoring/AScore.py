@@ -1,3 +1,14 @@
+def firstAlignment(aligner, predicted: str, actual: str):
+    """Get the first optimal alignment of two sequences, without counting all optimal alignments first. For repetitive
+    sequences the number of optimal alignments explodes, counting them can even overflow.
+    Parameters:
+    :param aligner: PairwiseAligner to align the sequences with.
+    :param predicted: First (predicted) sequence.
+    :param actual: Second (actual) sequence.
+    :return: First optimal alignment, or None if there is none, e.g. a local alignment without a positive score.
+    """
+    return next(iter(aligner.align(predicted, actual)), None)
+
 
 class AScore():
     def getScore(self, predicted:str, actual:str)->float:
@@ -1,6 +1,7 @@
-from Bio.Align import substitution_matrices, PairwiseAligner
+from Bio.Align import PairwiseAligner
 
 from Pipeline.Scoring.AScore import AScore
+from Pipeline.Scoring.SubstitutionMatrix import loadSubstitutionMatrix
 
 
 class AlignmentScore(AScore):
@@ -10,7 +11,7 @@ class AlignmentScore(AScore):
         self.aligner.mode = alignment_mode
         self.aligner.open_gap_score = open_gap_score
         self.aligner.extend_gap_score = extend_gap_score
-        self.aligner.substitution_matrix = substitution_matrices.load(self.substitution_matrix)
+        self.aligner.substitution_matrix = loadSubstitutionMatrix(self.substitution_matrix)
 
     def getScore(self, predicted: str, actual: str) -> float:
         """Perform a global alignment between two sequences and calculate the alignment score.
@@ -20,14 +21,9 @@ class AlignmentScore(AScore):
         :return: Alignment score between the two sequences.
             """
 
-        # align the sequences
-        alignments = self.aligner.align(predicted, actual)
-        if len(alignments)==0:
-            return 0.0
-        # get the first (best) alignment
-        alignment = alignments[0]
-        # return the alignment score
-        return alignment.score
+        # only the score is needed, which is calculated without building any alignment
+        # a local alignment without a positive score has the score 0
+        return self.aligner.score(predicted, actual)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+import os
+import tempfile
+from typing import Sequence, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from Levenshtein import distance
+
+from Pipeline.Instrumentation import count, stage
+from Pipeline.PackedSequences import PackedSequences
+from Pipeline.Scheduler import alignmentCosts, balancedChunks
+from Pipeline.Scoring.CombinedScore import getCombinedScore, ALIGNMENT_SCORE_COLUMNS, SCORE_COLUMNS
+from Pipeline.Scoring.ScoreCache import ScoreCache
+from Pipeline.Scoring.VectorizedAlignment import alignmentScoresMany
+
+try:
+    # Levenshtein is built on rapidfuzz, which computes pairwise distances of whole collections in one call
+    from rapidfuzz.process import cpdist
+    from rapidfuzz.distance import Levenshtein as RapidfuzzLevenshtein
+except ImportError:
+    cpdist = None
+
+
+def levenshteinMany(predicted: Sequence[str], actual: Sequence[str]) -> np.ndarray:
+    """Calculate the Levenshtein distance of every (predicted, actual) pair.
+    Parameters:
+    :param predicted: Predicted sequences.
+    :param actual: Actual sequences, same length as predicted.
+    :return: Array containing the Levenshtein distance of each pair.
+    """
+    if len(predicted) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if cpdist is not None:
+        return cpdist(list(predicted), list(actual), scorer=RapidfuzzLevenshtein.distance, dtype=np.int64)
+    return np.fromiter(map(distance, predicted, actual), dtype=np.int64, count=len(predicted))
+
+
+def uniquePairs(predicted: Sequence[str], actual: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Find the distinct (predicted, actual) pairs.
+    Parameters:
+    :param predicted: Predicted sequences.
+    :param actual: Actual sequences, same length as predicted.
+    :return: Tuple of the index of each pair in the distinct pairs, and the predicted and actual sequences of the
+        distinct pairs.
+    """
+    codes, unique = pd.factorize(pd.MultiIndex.from_arrays([np.asarray(predicted, dtype=object),
+                                                            np.asarray(actual, dtype=object)]),
+                                 use_na_sentinel=False)
+    return codes, np.asarray(unique.get_level_values(0), dtype=object), np.asarray(unique.get_level_values(1), dtype=object)
+
+
+def scoreMany(predicted: Sequence[str], actual: Sequence[str], alignment_mode: str = 'global', gap_open: int = -2,
+              gap_ext: int = -2, substitution_matrix: str = 'BLOSUM62', n_jobs: int = 1,
+              cache: ScoreCache = None, vectorized: bool = False) -> Dict[str, np.ndarray]:
+    """Calculate all scores for many sequence pairs at once. Every distinct pair is scored only once and its scores are
+    copied to all of its rows.
+    Parameters:
+    :param predicted: Predicted sequences.
+    :param actual: Actual sequences, same length as predicted.
+    :param alignment_mode: Alignment mode used for the similarity and identity.
+    :param gap_open: Gap opening score.
+    :param gap_ext: Gap extension score.
+    :param substitution_matrix: Name of the substitution matrix.
+    :param n_jobs: Number of worker processes, None for all cores.
+    :param cache: Optional ScoreCache, only pairs which are not cached are scored.
+    :param vectorized: Align the pairs in batches with the array kernel of VectorizedAlignment, which gives the same
+        scores with far less overhead per pair.
+    :return: Dictionary mapping the names in SCORE_COLUMNS to arrays containing the score of each pair.
+    """
+    if len(predicted) != len(actual):
+        raise ValueError(f"Got {len(predicted)} predicted but {len(actual)} actual sequences.")
+    codes, unique_predicted, unique_actual = uniquePairs(predicted, actual)
+    count('pairs', len(predicted))
+    count('distinct pairs', len(unique_predicted))
+    scores = np.empty((len(unique_predicted), len(SCORE_COLUMNS)), dtype=np.float64)
+    missing = np.ones(len(unique_predicted), dtype=bool)
+    if cache is not None:
+        parameters = ScoreCache.parameters(alignment_mode, gap_open, gap_ext, substitution_matrix)
+        scores, found = cache.getMany(unique_predicted, unique_actual, parameters)
+        missing = ~found
+        count('cached pairs', found.sum())
+    if missing.any():
+        computed = scorePairs(unique_predicted[missing], unique_actual[missing], alignment_mode, gap_open, gap_ext,
+                              substitution_matrix, n_jobs, vectorized)
+        scores[missing] = np.column_stack([computed[name] for name in SCORE_COLUMNS])
+        if cache is not None:
+            cache.putMany(unique_predicted[missing], unique_actual[missing], parameters, scores[missing])
+    # copy the scores of the distinct pairs back to every row
+    output = {name: scores[codes, column] for column, name in enumerate(SCORE_COLUMNS)}
+    output['Levenshtein'] = output['Levenshtein'].astype(np.int64)
+    return output
+
+
+def scorePairs(predicted: Sequence[str], actual: Sequence[str], alignment_mode: str = 'global', gap_open: int = -2,
+               gap_ext: int = -2, substitution_matrix: str = 'BLOSUM62', n_jobs: int = 1,
+               vectorized: bool = False) -> Dict[str, np.ndarray]:
+    """Calculate all scores of every sequence pair, without looking for repeated pairs.
+    Parameters:
+    :param predicted: Predicted sequences.
+    :param actual: Actual sequences, same length as predicted.
+    :param n_jobs: Number of worker processes, None for all cores.
+    :param vectorized: Align the pairs with the array kernel of VectorizedAlignment.
+    :return: Dictionary mapping the names in SCORE_COLUMNS to arrays containing the score of each pair.
+    """
+    n_jobs = effective_n_jobs(n_jobs if n_jobs is not None else os.cpu_count() or 1)
+    if n_jobs > 1 and len(predicted) > 1:
+        return scoreManyShared(predicted, actual, alignment_mode, gap_open, gap_ext, substitution_matrix, n_jobs,
+                               vectorized=vectorized)
+    count('alignments', len(predicted))
+    if vectorized:
+        scores = alignmentScoresMany(predicted, actual, alignment_mode, gap_open, gap_ext, substitution_matrix)
+        scores['Levenshtein'] = levenshteinMany(predicted, actual)
+        return scores
+    scorer = getCombinedScore(alignment_mode, gap_open, gap_ext, substitution_matrix)
+
+    # fill preallocated columns instead of building a list per pair
+    scores = {column: np.empty(len(predicted), dtype=np.float64) for column in ALIGNMENT_SCORE_COLUMNS}
+    for idx, (p, a) in enumerate(zip(predicted, actual)):
+        for column, score in scorer.getAlignmentScores(p, a).items():
+            scores[column][idx] = score
+    scores['Levenshtein'] = levenshteinMany(predicted, actual)
+    return scores
+
+
+def scoreRange(predicted: PackedSequences, actual: PackedSequences, start: int, end: int, output: np.ndarray,
+               alignment_mode: str, gap_open: int, gap_ext: int, substitution_matrix: str, vectorized: bool = False):
+    """Score the pairs start to end and write the scores into the rows start to end of a shared result array.
+    Parameters:
+    :param predicted: Packed predicted sequences.
+    :param actual: Packed actual sequences.
+    :param start: Index of the first pair.
+    :param end: Index after the last pair.
+    :param output: Result array with one column per name in SCORE_COLUMNS.
+    """
+    with stage('score range', rows_in=end - start):
+        scores = scorePairs(predicted.getRange(start, end), actual.getRange(start, end), alignment_mode, gap_open,
+                            gap_ext, substitution_matrix, vectorized=vectorized)
+    for column, name in enumerate(SCORE_COLUMNS):
+        output[start:end, column] = scores[name]
+
+
+def scoreManyShared(predicted: Sequence[str], actual: Sequence[str], alignment_mode: str = 'global', gap_open: int = -2,
+                    gap_ext: int = -2, substitution_matrix: str = 'BLOSUM62', n_jobs: int = None,
+                    tasks_per_job: int = 16, temp_folder: str = None,
+                    vectorized: bool = False) -> Dict[str, np.ndarray]:
+    """Calculate all scores for many sequence pairs in parallel. The sequences are passed to the workers as packed
+    bytes and offsets in memory mapped files, and the workers write their scores directly into a memory mapped result
+    array, so neither the sequences nor the scores are pickled.
+    Parameters:
+    :param predicted: Predicted sequences.
+    :param actual: Actual sequences, same length as predicted.
+    :param n_jobs: Number of worker processes, None for all cores.
+    :param tasks_per_job: Number of pair ranges of equal alignment cost created per worker process.
+    :param temp_folder: Directory for the memory mapped files, defaults to the system temporary directory.
+    :param vectorized: Align the pairs with the array kernel of VectorizedAlignment.
+    :return: Dictionary mapping the names in SCORE_COLUMNS to arrays containing the score of each pair.
+    """
+    n_jobs = effective_n_jobs(n_jobs if n_jobs is not None else os.cpu_count() or 1)
+    ranges = balancedChunks(alignmentCosts(predicted, actual), n_jobs * tasks_per_job)
+    with tempfile.TemporaryDirectory(prefix='scoring', dir=temp_folder) as directory:
+        packed_predicted = PackedSequences(predicted).toMemmap(directory, 'predicted')
+        packed_actual = PackedSequences(actual).toMemmap(directory, 'actual')
+        output = np.lib.format.open_memmap(os.path.join(directory, 'scores.npy'), mode='w+', dtype=np.float64,
+                                           shape=(len(predicted), len(SCORE_COLUMNS)))
+        Parallel(n_jobs=n_jobs, batch_size=1)(
+            delayed(scoreRange)(packed_predicted, packed_actual, start, end, output, alignment_mode, gap_open, gap_ext,
+                                substitution_matrix, vectorized) for start, end in ranges)
+        scores = {name: np.array(output[:, column]) for column, name in enumerate(SCORE_COLUMNS)}
+        del output, packed_predicted, packed_actual
+    scores['Levenshtein'] = scores['Levenshtein'].astype(np.int64)
+    return scores
+
+
+if __name__ == "__main__":
+    print(scoreMany(["ITHQGEVDSR", "PESK"], ["LTHQEVDSR", "DHPESYHSFMWNNFFK"]))
+    print(scoreMany(["ITHQGEVDSR", "PESK"], ["LTHQEVDSR", "DHPESYHSFMWNNFFK"], alignment_mode='local', gap_open=-10,
+                    gap_ext=-10))
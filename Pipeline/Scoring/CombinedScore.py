@@ -0,0 +1,102 @@
+from functools import lru_cache
+
+from Bio.Align import PairwiseAligner
+from Levenshtein import distance
+
+from Pipeline.Scoring.AScore import firstAlignment
+from Pipeline.Scoring.SubstitutionMatrix import loadSubstitutionMatrix, positiveSubstitutions
+
+ALIGNMENT_SCORE_COLUMNS = ['Similarity', 'Identity', 'Local Alignment', 'Global Alignment', 'Normalized Local Alignment',
+                           'Normalized Global Alignment']
+SCORE_COLUMNS = ALIGNMENT_SCORE_COLUMNS + ['Levenshtein']
+
+
+class CombinedScore:
+    def __init__(self, substitution_matrix: str = 'BLOSUM62', alignment_mode: str = 'global', open_gap_score: int = -2,
+                 extend_gap_score: int = -2):
+        """Initializes the CombinedScore object, which calculates all metrics of a sequence pair at once.
+        Parameters:
+        :param substitution_matrix: Name of the substitution matrix.
+        :param alignment_mode: Alignment mode used for the similarity and identity.
+        :param open_gap_score: Gap opening score.
+        :param extend_gap_score: Gap extension score.
+        """
+        self.substitution_matrix = substitution_matrix
+        self.alignment_mode = alignment_mode
+        self.open_gap_score = open_gap_score
+        self.positive_substitutions = positiveSubstitutions(substitution_matrix)
+        # one aligner per mode, all sharing the same preloaded matrix
+        self.aligners = dict()
+        for mode in {alignment_mode, 'local', 'global'}:
+            aligner = PairwiseAligner()
+            aligner.mode = mode
+            aligner.open_gap_score = open_gap_score
+            aligner.extend_gap_score = extend_gap_score
+            aligner.substitution_matrix = loadSubstitutionMatrix(substitution_matrix)
+            self.aligners[mode] = aligner
+
+    def getAlignmentScores(self, predicted: str, actual: str) -> dict:
+        """Calculate all alignment based scores of a sequence pair, aligning the pair only once per alignment mode.
+        Parameters:
+        :param predicted: First (predicted) sequence.
+        :param actual: Second (actual) sequence.
+        :return: Dictionary mapping the names in ALIGNMENT_SCORE_COLUMNS to the corresponding scores.
+        """
+        alignments = {mode: firstAlignment(self.aligners[mode], predicted, actual) for mode in self.aligners}
+
+        alignment = alignments[self.alignment_mode]
+        if alignment is None:
+            similarity = 0.0
+            identity = 0.0
+        else:
+            pairs = list(zip(alignment[0, :], alignment[1, :]))
+            # gaps are not part of the matrix and are scored with the gap opening score, as in SequenceSimilarity
+            gap_positive = self.open_gap_score > 0
+            positive_substitution_scores = sum(1 for pair in pairs if self.positive_substitutions.get(pair, gap_positive))
+            identical_positions = sum(a == b for a, b in pairs)
+            length = len(pairs) if self.alignment_mode == 'global' else len(predicted)
+            similarity = positive_substitution_scores / length
+            identity = identical_positions / length
+
+        scores = {'Similarity': similarity, 'Identity': identity}
+        for mode, name in [('local', 'Local'), ('global', 'Global')]:
+            alignment = alignments[mode]
+            if alignment is None:
+                scores[f'{name} Alignment'] = 0.0
+                scores[f'Normalized {name} Alignment'] = 0.0
+            else:
+                scores[f'{name} Alignment'] = alignment.score
+                scores[f'Normalized {name} Alignment'] = alignment.score / len(alignment[0, :])
+        return scores
+
+    def getScores(self, predicted: str, actual: str) -> dict:
+        """Calculate all scores of a sequence pair, aligning the pair only once per alignment mode.
+        Parameters:
+        :param predicted: First (predicted) sequence.
+        :param actual: Second (actual) sequence.
+        :return: Dictionary mapping the names in SCORE_COLUMNS to the corresponding scores.
+        """
+        scores = self.getAlignmentScores(predicted, actual)
+        scores['Levenshtein'] = distance(predicted, actual)
+        return scores
+
+
+@lru_cache(maxsize=None)
+def getCombinedScore(alignment_mode: str = 'global', open_gap_score: int = -2, extend_gap_score: int = -2,
+                     substitution_matrix: str = 'BLOSUM62') -> CombinedScore:
+    """Return a CombinedScore object for the given parameters, created only once per process (worker).
+    Parameters:
+    :param alignment_mode: Alignment mode used for the similarity and identity.
+    :param open_gap_score: Gap opening score.
+    :param extend_gap_score: Gap extension score.
+    :param substitution_matrix: Name of the substitution matrix.
+    :return: Shared CombinedScore object.
+    """
+    return CombinedScore(substitution_matrix, alignment_mode, open_gap_score, extend_gap_score)
+
+
+if __name__ == "__main__":
+    combined = CombinedScore()
+    print(combined.getScores("ITHQGEVDSR", "LTHQEVDSR"))
+    combined = CombinedScore(alignment_mode='local', open_gap_score=-10, extend_gap_score=-10)
+    print(combined.getScores(actual="DHPESYHSFMWNNFFK", predicted="PESK"))
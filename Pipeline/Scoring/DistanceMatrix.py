@@ -0,0 +1,167 @@
+import os
+import tempfile
+from typing import Iterator, Sequence, Tuple
+
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+from Levenshtein import distance
+
+from Pipeline.Instrumentation import stage
+from Pipeline.PackedSequences import PackedSequences
+from Pipeline.Scheduler import defaultJobs
+from Pipeline.Scoring.AlignmentScore import AlignmentScore
+
+try:
+    # rapidfuzz computes the distances of all pairs of two collections in one call, using multiple threads
+    from rapidfuzz.process import cdist
+    from rapidfuzz.distance import Levenshtein as RapidfuzzLevenshtein
+except ImportError:
+    cdist = None
+
+METRICS = ['levenshtein', 'alignment']
+# compact data types of the matrices, peptides are far shorter than the int16 range
+METRIC_TYPES = {'levenshtein': np.int16, 'alignment': np.float32}
+
+
+def levenshteinBlock(queries: Sequence[str], references: Sequence[str], n_jobs: int = 1) -> np.ndarray:
+    """Calculate the Levenshtein distance of every query to every reference.
+    Parameters:
+    :param queries: Query sequences, e.g. predicted sequences.
+    :param references: Reference sequences, e.g. the peptides of an inclusion list.
+    :param n_jobs: Number of threads, -1 for all cores.
+    :return: int16 array of shape (queries, references).
+    """
+    if cdist is not None:
+        return cdist(list(queries), list(references), scorer=RapidfuzzLevenshtein.distance, dtype=np.int16,
+                     workers=n_jobs)
+    block = np.empty((len(queries), len(references)), dtype=np.int16)
+    for idx, query in enumerate(queries):
+        block[idx] = np.fromiter((distance(query, reference) for reference in references), dtype=np.int16,
+                                 count=len(references))
+    return block
+
+
+def alignmentBlock(queries: PackedSequences, references: PackedSequences, start: int, end: int,
+                   alignment_mode: str = 'global', gap_open: int = -2, gap_ext: int = -2,
+                   substitution_matrix: str = 'BLOSUM62') -> np.ndarray:
+    """Calculate the alignment score of the queries start to end to every reference.
+    Parameters:
+    :param queries: Packed query sequences.
+    :param references: Packed reference sequences.
+    :param start: Index of the first query.
+    :param end: Index after the last query.
+    :return: float32 array of shape (end - start, references).
+    """
+    scorer = AlignmentScore(substitution_matrix, alignment_mode, gap_open, gap_ext)
+    reference_list = references.toList()
+    block = np.empty((end - start, len(reference_list)), dtype=np.float32)
+    with stage('distance block', rows_in=end - start) as record:
+        for idx, query in enumerate(queries.getRange(start, end)):
+            block[idx] = [scorer.getScore(query, reference) for reference in reference_list]
+        record.count('alignments', block.size)
+    return block
+
+
+def iterDistanceBlocks(queries: Sequence[str], references: Sequence[str], metric: str = 'levenshtein',
+                       block_size: int = 1024, alignment_mode: str = 'global', gap_open: int = -2, gap_ext: int = -2,
+                       substitution_matrix: str = 'BLOSUM62', n_jobs: int = None,
+                       temp_folder: str = None) -> Iterator[Tuple[int, np.ndarray]]:
+    """Calculate the distance matrix of two sequence collections in blocks of queries, so only a few blocks are held
+    in memory at a time. Levenshtein blocks are calculated by multiple threads, alignment blocks by multiple worker
+    processes, which get the sequences as memory mapped packed sequences.
+    Parameters:
+    :param queries: Query sequences, e.g. predicted sequences.
+    :param references: Reference sequences, e.g. the peptides of an inclusion list.
+    :param metric: levenshtein (int16 distances) or alignment (float32 alignment scores).
+    :param block_size: Number of queries per block.
+    :param alignment_mode: Alignment mode of the alignment scores.
+    :param gap_open: Gap opening score.
+    :param gap_ext: Gap extension score.
+    :param substitution_matrix: Name of the substitution matrix.
+    :param n_jobs: Number of threads or worker processes, None for all cores.
+    :param temp_folder: Directory for the memory mapped sequences, defaults to the system temporary directory.
+    :return: Iterator of (start, block) tuples in the order of the queries, block holds the rows start to
+        start + len(block) of the distance matrix.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric}, expected one of {METRICS}.")
+    n_jobs = effective_n_jobs(n_jobs if n_jobs is not None else defaultJobs())
+    starts = range(0, len(queries), block_size)
+    if metric == 'levenshtein':
+        for start in starts:
+            yield start, levenshteinBlock(queries[start:start + block_size], references, n_jobs)
+        return
+
+    with tempfile.TemporaryDirectory(prefix='distances', dir=temp_folder) as directory:
+        packed_queries = PackedSequences(queries).toMemmap(directory, 'queries')
+        packed_references = PackedSequences(references).toMemmap(directory, 'references')
+        blocks = Parallel(n_jobs=n_jobs, return_as='generator', batch_size=1)(
+            delayed(alignmentBlock)(packed_queries, packed_references, start, min(start + block_size, len(queries)),
+                                    alignment_mode, gap_open, gap_ext, substitution_matrix) for start in starts)
+        yield from zip(starts, blocks)
+        del packed_queries, packed_references
+
+
+def distanceMatrix(queries: Sequence[str], references: Sequence[str], metric: str = 'levenshtein',
+                   output_file: str = None, block_size: int = 1024, **kwargs) -> np.ndarray:
+    """Calculate the full distance matrix of two sequence collections.
+    Parameters:
+    :param queries: Query sequences, e.g. predicted sequences.
+    :param references: Reference sequences, e.g. the peptides of an inclusion list.
+    :param metric: levenshtein (int16 distances) or alignment (float32 alignment scores).
+    :param output_file: Optional .npy file the matrix is written to block by block, for matrices too large for the
+        memory. The returned matrix is then memory mapped.
+    :param block_size: Number of queries per block.
+    :param kwargs: Alignment parameters, n_jobs and temp_folder as accepted by iterDistanceBlocks.
+    :return: Array of shape (queries, references).
+    """
+    queries, references = list(queries), list(references)
+    shape = (len(queries), len(references))
+    if metric not in METRIC_TYPES:
+        raise ValueError(f"Unknown metric {metric}, expected one of {METRICS}.")
+    if output_file is not None:
+        matrix = np.lib.format.open_memmap(output_file, mode='w+', dtype=METRIC_TYPES[metric], shape=shape)
+    else:
+        matrix = np.empty(shape, dtype=METRIC_TYPES[metric])
+    for start, block in iterDistanceBlocks(queries, references, metric, block_size, **kwargs):
+        matrix[start:start + len(block)] = block
+    if output_file is not None:
+        matrix.flush()
+    return matrix
+
+
+def nearestReferences(queries: Sequence[str], references: Sequence[str], k: int = 1, metric: str = 'levenshtein',
+                      block_size: int = 1024, **kwargs) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the k nearest references of every query without holding the full distance matrix in memory. Nearest are
+    the references with the smallest Levenshtein distance or the highest alignment score, ties are broken by the order
+    of the references.
+    Parameters:
+    :param queries: Query sequences, e.g. predicted sequences.
+    :param references: Reference sequences, e.g. the peptides of an inclusion list.
+    :param k: Number of references per query, at most the number of references.
+    :param metric: levenshtein or alignment.
+    :param block_size: Number of queries per block.
+    :param kwargs: Alignment parameters, n_jobs and temp_folder as accepted by iterDistanceBlocks.
+    :return: Tuple of the indices of the nearest references and their distances or scores, both of shape (queries, k)
+        and sorted from the nearest reference.
+    """
+    queries, references = list(queries), list(references)
+    if metric not in METRIC_TYPES:
+        raise ValueError(f"Unknown metric {metric}, expected one of {METRICS}.")
+    k = min(k, len(references))
+    indices = np.empty((len(queries), k), dtype=np.int64)
+    values = np.empty((len(queries), k), dtype=METRIC_TYPES[metric])
+    for start, block in iterDistanceBlocks(queries, references, metric, block_size, **kwargs):
+        # a stable sort keeps equally near references in their original order
+        order = np.argsort(block if metric == 'levenshtein' else -block, axis=1, kind='stable')[:, :k]
+        indices[start:start + len(block)] = order
+        values[start:start + len(block)] = np.take_along_axis(block, order, axis=1)
+    return indices, values
+
+
+if __name__ == "__main__":
+    predicted = ["ITHQGEVDSR", "PESK", "GSHP"]
+    inclusion = ["LTHQEVDSR", "DHPESYHSFMWNNFFK", "VAMAMGSHPR"]
+    print(distanceMatrix(predicted, inclusion))
+    print(distanceMatrix(predicted, inclusion, metric='alignment', alignment_mode='local', gap_open=-10, gap_ext=-10))
+    print(nearestReferences(predicted, inclusion, k=2))
@@ -1,6 +1,7 @@
-from Bio.Align import substitution_matrices, PairwiseAligner
+from Bio.Align import PairwiseAligner
 
-from Pipeline.Scoring.AScore import AScore
+from Pipeline.Scoring.AScore import AScore, firstAlignment
+from Pipeline.Scoring.SubstitutionMatrix import loadSubstitutionMatrix
 
 class NormalizedAlignmentScore(AScore):
     def __init__(self, substitution_matrix:str = 'BLOSUM62', alignment_mode:str = 'global', open_gap_score:int = -2, extend_gap_score:int = -2):
@@ -9,7 +10,7 @@ class NormalizedAlignmentScore(AScore):
         self.aligner.mode = alignment_mode
         self.aligner.open_gap_score = open_gap_score
         self.aligner.extend_gap_score = extend_gap_score
-        self.aligner.substitution_matrix = substitution_matrices.load(self.substitution_matrix)
+        self.aligner.substitution_matrix = loadSubstitutionMatrix(self.substitution_matrix)
 
     def getScore(self, predicted: str, actual: str) -> float:
         """Perform a global alignment between two sequences and calculate the alignment score.
@@ -20,11 +21,9 @@ class NormalizedAlignmentScore(AScore):
             """
 
         # align the sequences
-        alignments = self.aligner.align(predicted, actual)
-        if len(alignments)==0:
+        alignment = firstAlignment(self.aligner, predicted, actual)
+        if alignment is None:
             return 0.0
-        # get the first (best) alignment
-        alignment = alignments[0]
         # return the alignment score
         return alignment.score / len(alignment[0,:]) #if self.aligner.mode == 'global' else len(predicted))
 
@@ -0,0 +1,113 @@
+import sqlite3
+from collections import OrderedDict
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from Pipeline.Scoring.CombinedScore import SCORE_COLUMNS
+
+# seconds a process waits for another process writing to the database before failing
+DATABASE_TIMEOUT = 600
+
+
+class ScoreCache:
+    def __init__(self, max_entries: int = 200000, database: str = None):
+        """Initializes the ScoreCache object, which remembers the scores of sequence pairs, so pairs that are predicted
+        again, e.g. the same DirecTag tag for many spectra, are not aligned again.
+        The least recently used pairs are dropped from memory once max_entries is reached. If a database is given, all
+        scores are also stored in it, so they can be reused between runs and by other processes.
+        Parameters:
+        :param max_entries: Maximum number of pairs kept in memory.
+        :param database: Optional path to a SQLite database storing the scores persistently.
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.database = database
+        self.connection = None
+        if database is not None:
+            self.connection = sqlite3.connect(database, timeout=DATABASE_TIMEOUT)
+            # with write ahead logging readers do not block the writer, and the writers of other processes wait
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            columns = ', '.join(f'"{column}" REAL' for column in SCORE_COLUMNS)
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS scores (parameters TEXT, predicted TEXT, actual TEXT, '
+                                    f'{columns}, PRIMARY KEY (parameters, predicted, actual))')
+            self.connection.commit()
+
+    @staticmethod
+    def parameters(alignment_mode: str, gap_open: int, gap_ext: int, substitution_matrix: str) -> str:
+        """Combine the scoring parameters to a key, scores are only reused for the same parameters."""
+        return f'{substitution_matrix} {alignment_mode} {float(gap_open)} {float(gap_ext)}'
+
+    def __len__(self):
+        return len(self.entries)
+
+    def getMany(self, predicted: Sequence[str], actual: Sequence[str], parameters: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the scores of many sequence pairs.
+        Parameters:
+        :param predicted: Predicted sequences.
+        :param actual: Actual sequences, same length as predicted.
+        :param parameters: Scoring parameters as returned by parameters.
+        :return: Tuple of an array with one column per name in SCORE_COLUMNS and a mask which pairs were found.
+            The scores of pairs which were not found are undefined.
+        """
+        scores = np.empty((len(predicted), len(SCORE_COLUMNS)), dtype=np.float64)
+        found = np.zeros(len(predicted), dtype=bool)
+        for idx, pair in enumerate(zip(predicted, actual)):
+            entry = self.entries.get((parameters,) + pair)
+            if entry is not None:
+                self.entries.move_to_end((parameters,) + pair)
+                scores[idx] = entry
+                found[idx] = True
+        if self.connection is not None and not found.all():
+            missing = np.flatnonzero(~found)
+            rows = self.__select(parameters, [predicted[idx] for idx in missing], [actual[idx] for idx in missing])
+            position = {(p, a): idx for idx, p, a in zip(missing, (predicted[idx] for idx in missing),
+                                                           (actual[idx] for idx in missing))}
+            for p, a, *values in rows:
+                idx = position[(p, a)]
+                scores[idx] = values
+                found[idx] = True
+                self.__remember((parameters, p, a), tuple(values))
+        return scores, found
+
+    def putMany(self, predicted: Sequence[str], actual: Sequence[str], parameters: str, scores: np.ndarray):
+        """Store the scores of many sequence pairs.
+        Parameters:
+        :param predicted: Predicted sequences.
+        :param actual: Actual sequences, same length as predicted.
+        :param parameters: Scoring parameters as returned by parameters.
+        :param scores: Array with one column per name in SCORE_COLUMNS.
+        """
+        values = scores.tolist()
+        for p, a, row in zip(predicted, actual, values):
+            self.__remember((parameters, p, a), tuple(row))
+        if self.connection is not None:
+            placeholders = ', '.join('?' * (len(SCORE_COLUMNS) + 3))
+            self.connection.executemany(f'INSERT OR REPLACE INTO scores VALUES ({placeholders})',
+                                        ((parameters, p, a, *row) for p, a, row in zip(predicted, actual, values)))
+            self.connection.commit()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __remember(self, key: tuple, values: tuple):
+        self.entries[key] = values
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __select(self, parameters: str, predicted: list, actual: list) -> list:
+        """Look up many pairs in the database at once by joining them with a temporary table."""
+        columns = ', '.join(f's."{column}"' for column in SCORE_COLUMNS)
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS lookup (predicted TEXT, actual TEXT)')
+        self.connection.execute('DELETE FROM lookup')
+        self.connection.executemany('INSERT INTO lookup VALUES (?, ?)', zip(predicted, actual))
+        rows = self.connection.execute(
+            f'SELECT l.predicted, l.actual, {columns} FROM lookup l JOIN scores s '
+            f'ON s.parameters = ? AND s.predicted = l.predicted AND s.actual = l.actual', (parameters,)).fetchall()
+        # end the transaction started by filling the lookup table, so the database is not locked while the missing
+        # pairs are aligned
+        self.connection.commit()
+        return rows
@@ -1,7 +1,7 @@
 from Bio.Align import PairwiseAligner
-from Bio.Align import substitution_matrices
 
-from Pipeline.Scoring.AScore import AScore
+from Pipeline.Scoring.AScore import AScore, firstAlignment
+from Pipeline.Scoring.SubstitutionMatrix import loadSubstitutionMatrix
 
 class SequenceIdentity(AScore):
     def __init__(self, substitution_matrix:str = 'BLOSUM62', alignment_mode:str = 'global', open_gap_score:int = -2, extend_gap_score:int = -2):
@@ -10,7 +10,7 @@ class SequenceIdentity(AScore):
         self.aligner.mode = alignment_mode
         self.aligner.open_gap_score = open_gap_score
         self.aligner.extend_gap_score = extend_gap_score
-        self.aligner.substitution_matrix = substitution_matrices.load(self.substitution_matrix)
+        self.aligner.substitution_matrix = loadSubstitutionMatrix(self.substitution_matrix)
     def getScore(self, predicted:str, actual:str)->float:
         """Calculate the percent identity between two sequences.
         Parameters:
@@ -19,13 +19,9 @@ class SequenceIdentity(AScore):
         :return: Percent identity between the two sequences.
         """
         # align the sequences
-        alignments = self.aligner.align(predicted, actual)
-
-        if len(alignments)==0:
+        alignment = firstAlignment(self.aligner, predicted, actual)
+        if alignment is None:
             return 0.0
-        # get the first (best) alignment
-        alignment = alignments[0]
-        print(alignment)
         # calculate the number of identical positions
         identical_positions = sum(a==b for a,b in zip(alignment[0,:], alignment[1,:]))
 
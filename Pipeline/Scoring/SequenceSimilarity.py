@@ -1,7 +1,7 @@
 from Bio.Align import PairwiseAligner
-from Bio.Align import substitution_matrices
 
-from Pipeline.Scoring.AScore import AScore
+from Pipeline.Scoring.AScore import AScore, firstAlignment
+from Pipeline.Scoring.SubstitutionMatrix import loadSubstitutionMatrix
 
 class SequenceSimilarity(AScore):
     def __init__(self, substitution_matrix:str = 'BLOSUM62', alignment_mode:str = 'global', open_gap_score:int = -2, extend_gap_score:int = -2):
@@ -10,7 +10,7 @@ class SequenceSimilarity(AScore):
         self.aligner.mode = alignment_mode
         self.aligner.open_gap_score = open_gap_score
         self.aligner.extend_gap_score = extend_gap_score
-        self.aligner.substitution_matrix = substitution_matrices.load(self.substitution_matrix)
+        self.aligner.substitution_matrix = loadSubstitutionMatrix(self.substitution_matrix)
     def getScore(self, predicted:str, actual:str)->float:
         """Calculate the percent similarity between two sequences.
         Parameters:
@@ -20,11 +20,9 @@ class SequenceSimilarity(AScore):
         """
 
         # align the sequences
-        alignments = self.aligner.align(predicted, actual)
-        # get the first (best) alignment
-        if len(alignments)==0:
+        alignment = firstAlignment(self.aligner, predicted, actual)
+        if alignment is None:
             return 0.0
-        alignment = alignments[0]
         # calculate the number of positive substitution scores
         positive_substitution_scores = sum(
             1 for a, b in zip(alignment[0,:], alignment[1,:]) if self.aligner.substitution_matrix.get((a, b),self.aligner.open_gap_score) >0)
@@ -0,0 +1,24 @@
+from functools import lru_cache
+
+from Bio.Align import substitution_matrices
+
+
+@lru_cache(maxsize=None)
+def loadSubstitutionMatrix(name: str = 'BLOSUM62'):
+    """Load a substitution matrix once per process and reuse it afterwards.
+    Parameters:
+    :param name: Name of the substitution matrix, e.g. BLOSUM62.
+    :return: Substitution matrix as returned by Bio.Align.substitution_matrices.load.
+    """
+    return substitution_matrices.load(name)
+
+
+@lru_cache(maxsize=None)
+def positiveSubstitutions(name: str = 'BLOSUM62') -> dict:
+    """Map every amino acid pair of a substitution matrix to whether its substitution score is positive.
+    Parameters:
+    :param name: Name of the substitution matrix, e.g. BLOSUM62.
+    :return: Dictionary mapping (a, b) tuples to True if the substitution score is positive, False otherwise.
+    """
+    matrix = loadSubstitutionMatrix(name)
+    return {(a, b): matrix[a][b] > 0 for a in matrix.alphabet for b in matrix.alphabet}
@@ -0,0 +1,308 @@
+from functools import lru_cache
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from Pipeline.Scoring.CombinedScore import ALIGNMENT_SCORE_COLUMNS, getCombinedScore
+from Pipeline.Scoring.SubstitutionMatrix import loadSubstitutionMatrix
+
+# trace flags of the Needleman-Wunsch and Smith-Waterman implementation of Biopython's PairwiseAligner
+HORIZONTAL = 0x1
+VERTICAL = 0x2
+DIAGONAL = 0x4
+STARTPOINT = 0x8
+ENDPOINT = 0x10
+
+
+@lru_cache(maxsize=None)
+def encodedMatrix(name: str = 'BLOSUM62') -> Tuple[np.ndarray, np.ndarray]:
+    """Encode a substitution matrix for array lookups.
+    Parameters:
+    :param name: Name of the substitution matrix, e.g. BLOSUM62.
+    :return: Tuple of an array mapping byte values to letter codes (-1 for letters not in the alphabet) and the
+        matrix of substitution scores indexed by letter codes.
+    """
+    matrix = loadSubstitutionMatrix(name)
+    lookup = np.full(256, -1, dtype=np.int16)
+    for code, letter in enumerate(matrix.alphabet):
+        lookup[ord(letter)] = code
+    scores = np.array([[matrix[a][b] for b in matrix.alphabet] for a in matrix.alphabet], dtype=np.float64)
+    return lookup, scores
+
+
+def isSupported(gap_open: float, gap_ext: float, substitution_matrix: str = 'BLOSUM62') -> bool:
+    """Check if the vectorized kernel reproduces PairwiseAligner for these parameters: linear negative gap scores, for
+    which Biopython uses Needleman-Wunsch and Smith-Waterman, and integer scores, which are compared exactly.
+    Affine gap scores (Gotoh) are left to PairwiseAligner.
+    """
+    scores = encodedMatrix(substitution_matrix)[1]
+    return gap_open == gap_ext and gap_open < 0 and float(gap_open).is_integer() and \
+        bool(np.all(scores == np.round(scores)))
+
+
+def encodeSequences(sequences: Sequence[str], lookup: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Encode sequences as a padded array of letter codes.
+    Parameters:
+    :param sequences: Sequences to encode.
+    :param lookup: Array mapping byte values to letter codes, as returned by encodedMatrix.
+    :return: Tuple of the padded codes (padding is 0), the lengths and whether each sequence is non-empty and consists
+        of letters of the alphabet only.
+    """
+    sequences = [sequence if sequence.isascii() else '' for sequence in map(str, sequences)]
+    lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+    codes = np.zeros((len(sequences), max(int(lengths.max(initial=0)), 1)), dtype=np.int16)
+    letters = lookup[np.frombuffer(''.join(sequences).encode('ascii'), dtype=np.uint8)]
+    rows = np.repeat(np.arange(len(sequences)), lengths)
+    columns = np.arange(len(letters)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    codes[rows, columns] = letters
+    unknown = np.zeros(len(sequences), dtype=bool)
+    unknown[rows[letters < 0]] = True
+    codes[codes < 0] = 0
+    return codes, lengths, (lengths > 0) & ~unknown
+
+
+def fillMatrices(a: np.ndarray, la: np.ndarray, b: np.ndarray, lb: np.ndarray, scores: np.ndarray, gap: int,
+                 local: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fill the score and trace matrices of a batch of pairs like PairwiseAligner, one anti-diagonal at a time for all
+    pairs at once. Cell (i, j) is stored at [i + j, i], so every anti-diagonal and its predecessors are slices.
+    Parameters:
+    :param a: Letter codes of the first sequences, shape (LA, pairs).
+    :param la: Lengths of the first sequences.
+    :param b: Letter codes of the second sequences, shape (LB, pairs).
+    :param lb: Lengths of the second sequences.
+    :param scores: Substitution scores indexed by letter codes.
+    :param gap: Gap score.
+    :param local: Smith-Waterman instead of Needleman-Wunsch.
+    :return: Tuple of the score matrices, the trace matrices and the best local score of every pair.
+    """
+    LA, LB, pairs = a.shape[0], b.shape[0], a.shape[1]
+    S = np.zeros((LA + LB + 1, LA + 1, pairs), dtype=np.int32)
+    T = np.zeros((LA + LB + 1, LA + 1, pairs), dtype=np.uint8)
+    rows, columns = np.arange(LA + 1), np.arange(LB + 1)
+    if local:
+        T[rows, rows] = STARTPOINT
+        T[columns, 0] = STARTPOINT
+    else:
+        S[rows, rows] = (rows * gap)[:, None]
+        T[rows[1:], rows[1:]] = VERTICAL
+        S[columns, 0] = (columns * gap)[:, None]
+        T[columns[1:], 0] = HORIZONTAL
+    maximum = np.zeros(pairs, dtype=np.int32)
+    substitution = scores.astype(np.int32)
+
+    for d in range(2, LA + LB + 1):
+        lo, hi = max(1, d - LB), min(LA, d - 1)
+        i = np.arange(lo, hi + 1)
+        diagonal = S[d - 2, lo - 1:hi] + substitution[a[i - 1], b[d - i - 1]]
+        score = diagonal
+        trace = np.full(score.shape, DIAGONAL, dtype=np.uint8)
+        # the order of the comparisons decides which moves tie, as in PairwiseAligner
+        for previous, move in [(S[d - 1, lo:hi + 1] + gap, HORIZONTAL), (S[d - 1, lo - 1:hi] + gap, VERTICAL)]:
+            trace = np.where(previous > score, move, np.where(previous == score, trace | move, trace)).astype(np.uint8)
+            score = np.maximum(score, previous)
+        if local:
+            # the last row and column only extend diagonally, other cells without a positive score start a path
+            last = (i[:, None] == la) | ((d - i)[:, None] == lb)
+            start = ~last & (score <= 0)
+            score = np.where(last, np.maximum(diagonal, 0), np.where(start, 0, score))
+            trace = np.where(last, DIAGONAL, np.where(start, STARTPOINT, trace)).astype(np.uint8)
+            valid = (i[:, None] <= la) & ((d - i)[:, None] <= lb)
+            maximum = np.maximum(maximum, np.where(valid, score, 0).max(axis=0))
+        S[d, lo:hi + 1] = score
+        T[d, lo:hi + 1] = trace
+    return S, T, maximum
+
+
+def markEndpoints(S: np.ndarray, T: np.ndarray, la: np.ndarray, lb: np.ndarray, maximum: np.ndarray) -> np.ndarray:
+    """Mark the end points of the optimal local alignments and remove the traces PairwiseAligner removes: traces
+    through an end point and traces from cells which cannot be reached from a start point.
+    :return: Boolean array marking the remaining end points, in the layout of the matrices.
+    """
+    LA = S.shape[1] - 1
+    LB = S.shape[0] - 1 - LA
+    i = np.arange(LA + 1)[None, :, None]
+    j = np.arange(LA + LB + 1)[:, None, None] - i
+    valid = (i <= la) & (j >= 0) & (j <= lb)
+    endpoints = valid & (T & DIAGONAL > 0) & (S == maximum) & (maximum > 0)
+    T |= np.where(endpoints, ENDPOINT, 0).astype(np.uint8)
+
+    reachable = np.zeros(T.shape, dtype=bool)
+    reachable[np.arange(LA + 1), np.arange(LA + 1)] = True
+    reachable[np.arange(LB + 1), 0] = True
+    for d in range(2, LA + LB + 1):
+        lo, hi = max(1, d - LB), min(LA, d - 1)
+        trace = T[d, lo:hi + 1]
+        trace = np.where(reachable[d - 2, lo - 1:hi], trace, trace & np.uint8(0xFF ^ DIAGONAL))
+        trace = np.where(reachable[d - 1, lo:hi + 1], trace, trace & np.uint8(0xFF ^ HORIZONTAL))
+        trace = np.where(reachable[d - 1, lo - 1:hi], trace, trace & np.uint8(0xFF ^ VERTICAL))
+        reached = trace & (STARTPOINT | HORIZONTAL | VERTICAL | DIAGONAL) > 0
+        reachable[d, lo:hi + 1] = reached & (trace & ENDPOINT == 0)
+        T[d, lo:hi + 1] = np.where(reached, trace, 0)
+    return valid & (T & ENDPOINT > 0)
+
+
+def traceback(T: np.ndarray, a: np.ndarray, b: np.ndarray, scores: np.ndarray, i: np.ndarray, j: np.ndarray,
+              active: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Follow the first path of PairwiseAligner from the given cells, preferring horizontal over vertical over
+    diagonal moves, and count its columns, identical and positive pairs.
+    :return: Tuple of the number of columns, identical pairs and pairs with a positive substitution score.
+    """
+    i, j = i.copy(), j.copy()
+    pairs = len(i)
+    columns, identical, positive = (np.zeros(pairs, dtype=np.int64) for _ in range(3))
+    active = np.flatnonzero(active)
+    while len(active):
+        trace = T[i[active] + j[active], i[active], active]
+        horizontal = trace & HORIZONTAL > 0
+        vertical = ~horizontal & (trace & VERTICAL > 0)
+        diagonal = ~horizontal & ~vertical & (trace & DIAGONAL > 0)
+        aligned = active[diagonal]
+        first, second = a[i[aligned] - 1, aligned], b[j[aligned] - 1, aligned]
+        identical[aligned] += first == second
+        positive[aligned] += scores[first, second] > 0
+        moved = horizontal | vertical | diagonal
+        columns[active[moved]] += 1
+        i[active[vertical | diagonal]] -= 1
+        j[active[horizontal | diagonal]] -= 1
+        active = active[moved]
+    return columns, identical, positive
+
+
+def alignBatch(a: np.ndarray, la: np.ndarray, b: np.ndarray, lb: np.ndarray, alignment_mode: str, gap: int,
+               scores: np.ndarray) -> Dict[str, np.ndarray]:
+    """Calculate the alignment scores of CombinedScore for a batch of pairs of similar length.
+    Parameters:
+    :param a: Letter codes of the predicted sequences, shape (pairs, LA).
+    :param la: Lengths of the predicted sequences.
+    :param b: Letter codes of the actual sequences, shape (pairs, LB).
+    :param lb: Lengths of the actual sequences.
+    :return: Dictionary mapping the names in ALIGNMENT_SCORE_COLUMNS to arrays containing the score of each pair.
+    """
+    a, b = np.ascontiguousarray(a.T), np.ascontiguousarray(b.T)
+    pairs = np.arange(len(la))
+    S, T, _ = fillMatrices(a, la, b, lb, scores, gap, local=False)
+    global_score = S[la + lb, la, pairs].astype(np.float64)
+    global_counts = traceback(T, a, b, scores, la, lb, np.ones(len(la), dtype=bool))
+
+    S, T, maximum = fillMatrices(a, la, b, lb, scores, gap, local=True)
+    endpoints = markEndpoints(S, T, la, lb, maximum)
+    # the first path starts at the first end point in the order of the rows of the matrix
+    LA, LB = a.shape[0], b.shape[0]
+    keys = np.arange(LA + 1)[None, :] * (LB + 1) + (np.arange(LA + LB + 1)[:, None] - np.arange(LA + 1)[None, :])
+    first = np.where(endpoints, keys[:, :, None], np.iinfo(np.int64).max).reshape(-1, len(la)).min(axis=0)
+    found = first < np.iinfo(np.int64).max
+    end_i, end_j = np.where(found, first // (LB + 1), 1), np.where(found, first % (LB + 1), 1)
+    # the end point itself is only left diagonally
+    start_i, start_j = end_i - 1, end_j - 1
+    first_pair = (a[start_i, pairs], b[start_j, pairs])
+    local_counts = traceback(T, a, b, scores, start_i, start_j, found)
+    local_counts = (local_counts[0] + found, local_counts[1] + (found & (first_pair[0] == first_pair[1])),
+                    local_counts[2] + (found & (scores[first_pair] > 0)))
+    local_score = np.where(found, maximum, 0).astype(np.float64)
+
+    output = dict()
+    columns, identical, positive = global_counts if alignment_mode == 'global' else local_counts
+    length = columns if alignment_mode == 'global' else la
+    aligned = np.ones(len(la), dtype=bool) if alignment_mode == 'global' else found
+    output['Similarity'] = np.where(aligned, positive / np.maximum(length, 1), 0.0)
+    output['Identity'] = np.where(aligned, identical / np.maximum(length, 1), 0.0)
+    output['Local Alignment'] = local_score
+    output['Global Alignment'] = global_score
+    output['Normalized Local Alignment'] = np.where(found, local_score / np.maximum(local_counts[0], 1), 0.0)
+    output['Normalized Global Alignment'] = global_score / global_counts[0]
+    return output
+
+
+def alignmentScoresMany(predicted: Sequence[str], actual: Sequence[str], alignment_mode: str = 'global',
+                        gap_open: int = -2, gap_ext: int = -2, substitution_matrix: str = 'BLOSUM62',
+                        batch_size: int = 512) -> Dict[str, np.ndarray]:
+    """Calculate the alignment scores of CombinedScore.getAlignmentScores for many pairs with array operations instead
+    of one PairwiseAligner call per pair and mode. The pairs are sorted by their lengths and aligned in batches of
+    similar length. The scores equal those of CombinedScore exactly, including the choice among equally good
+    alignments. Pairs the kernel does not support, e.g. with affine gap scores or letters outside the alphabet, are
+    scored by CombinedScore.
+    Parameters:
+    :param predicted: Predicted sequences.
+    :param actual: Actual sequences, same length as predicted.
+    :param alignment_mode: Alignment mode used for the similarity and identity.
+    :param gap_open: Gap opening score.
+    :param gap_ext: Gap extension score.
+    :param substitution_matrix: Name of the substitution matrix.
+    :param batch_size: Number of pairs aligned at once.
+    :return: Dictionary mapping the names in ALIGNMENT_SCORE_COLUMNS to arrays containing the score of each pair.
+    """
+    output = {column: np.empty(len(predicted), dtype=np.float64) for column in ALIGNMENT_SCORE_COLUMNS}
+    if len(predicted) == 0:
+        return output
+    lookup, scores = encodedMatrix(substitution_matrix)
+    a, la, a_valid = encodeSequences(predicted, lookup)
+    b, lb, b_valid = encodeSequences(actual, lookup)
+    vectorized = a_valid & b_valid
+    if alignment_mode not in ('global', 'local') or not isSupported(gap_open, gap_ext, substitution_matrix):
+        vectorized[:] = False
+
+    order = np.flatnonzero(vectorized)
+    order = order[np.lexsort((lb[order], la[order]))]
+    for start in range(0, len(order), batch_size):
+        rows = order[start:start + batch_size]
+        batch = alignBatch(a[rows, :la[rows].max()], la[rows], b[rows, :lb[rows].max()], lb[rows], alignment_mode,
+                           int(gap_open), scores)
+        for column in ALIGNMENT_SCORE_COLUMNS:
+            output[column][rows] = batch[column]
+
+    scorer = getCombinedScore(alignment_mode, gap_open, gap_ext, substitution_matrix)
+    for idx in np.flatnonzero(~vectorized):
+        for column, score in scorer.getAlignmentScores(predicted[idx], actual[idx]).items():
+            output[column][idx] = score
+    return output
+
+
+def compareWithAligner(predicted: Sequence[str], actual: Sequence[str], alignment_mode: str = 'global',
+                       gap_open: int = -2, gap_ext: int = -2, substitution_matrix: str = 'BLOSUM62') -> Dict[str, int]:
+    """Compare the scores of alignmentScoresMany with those of CombinedScore, which aligns every pair with the
+    PairwiseAligners of AlignmentScore, SequenceSimilarity and SequenceIdentity, e.g. after a Biopython upgrade.
+    Parameters:
+    :param predicted: Predicted sequences.
+    :param actual: Actual sequences, same length as predicted.
+    :return: Dictionary mapping the names in ALIGNMENT_SCORE_COLUMNS to the number of pairs whose scores differ.
+    """
+    vectorized = alignmentScoresMany(predicted, actual, alignment_mode, gap_open, gap_ext, substitution_matrix)
+    scorer = getCombinedScore(alignment_mode, gap_open, gap_ext, substitution_matrix)
+    expected = [scorer.getAlignmentScores(p, a) for p, a in zip(predicted, actual)]
+    differences = dict()
+    for column in ALIGNMENT_SCORE_COLUMNS:
+        values = np.array([scores[column] for scores in expected], dtype=np.float64)
+        # the scores have to be equal bit for bit, only NaN equals NaN
+        differ = (vectorized[column] != values) & ~(np.isnan(vectorized[column]) & np.isnan(values))
+        differences[column] = int(differ.sum())
+    return differences
+
+
+def randomPairs(size: int, seed: int = 0) -> Tuple[list, list]:
+    """Create random peptide pairs, half of them from two letters and repeated motifs, which have many equally good
+    alignments and test the choice among them."""
+    rng = np.random.default_rng(seed)
+    alphabets = ['ACDEFGHIKLMNPQRSTVWY', 'AG', 'LI', 'PEK']
+
+    def peptide(alphabet: str, low: int, high: int) -> str:
+        return ''.join(rng.choice(list(alphabet), size=rng.integers(low, high)))
+
+    predicted, actual = list(), list()
+    for idx in range(size):
+        alphabet = alphabets[0] if idx % 2 == 0 else alphabets[1 + idx % 3]
+        predicted.append(peptide(alphabet, 1, 16))
+        actual.append(peptide(alphabet, 1, 21) if idx % 4 != 1 else predicted[-1] * 2)
+    return predicted, actual
+
+
+if __name__ == "__main__":
+    print(alignmentScoresMany(["ITHQGEVDSR", "PESK"], ["LTHQEVDSR", "DHPESYHSFMWNNFFK"]))
+    print(alignmentScoresMany(["ITHQGEVDSR", "PESK"], ["LTHQEVDSR", "DHPESYHSFMWNNFFK"], alignment_mode='local',
+                              gap_open=-10, gap_ext=-10))
+    # the kernel has to give exactly the scores of the PairwiseAligners
+    predicted, actual = randomPairs(4000)
+    for alignment_mode in ['global', 'local']:
+        for gap in [-1, -2, -10]:
+            differences = compareWithAligner(predicted, actual, alignment_mode, gap, gap)
+            print(alignment_mode, gap, differences)
+            assert not any(differences.values()), f"scores differ from PairwiseAligner: {differences}"
@@ -0,0 +1,4 @@
+from Pipeline.Scoring.BatchScore import scoreMany
+from Pipeline.Scoring.ScoreCache import ScoreCache
+from Pipeline.Scoring.DistanceMatrix import distanceMatrix, iterDistanceBlocks, nearestReferences
+from Pipeline.Scoring.VectorizedAlignment import alignmentScoresMany
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+from typing import Callable, Iterable
+
+import pandas as pd
+
+
+class StageCache:
+    def __init__(self, directory: str, max_bytes: int = 10 * 1024 ** 3):
+        """Initializes the StageCache object, which stores the results of pipeline stages keyed by the content of
+        their input files and their parameters, so unchanged stages are not recomputed.
+        Parameters:
+        :param directory: Directory to store the cached results in.
+        :param max_bytes: Maximum size of all cached results. The least recently used results are evicted first.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.hash_file = os.path.join(directory, 'hashes.json')
+        self.hashes = dict()
+        if os.path.exists(self.hash_file):
+            with open(self.hash_file, 'r') as file:
+                self.hashes = json.load(file)
+
+    def fileHash(self, file: str) -> str:
+        """Calculate the SHA-256 hash of a file. Hashes are remembered as long as the size and modification time of the
+        file do not change.
+        Parameters:
+        :param file: Path to the file.
+        :return: Hex digest of the file content.
+        """
+        stat = os.stat(file)
+        path = os.path.abspath(file)
+        known = self.hashes.get(path)
+        if known is not None and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime_ns:
+            return known['hash']
+        digest = hashlib.sha256()
+        with open(file, 'rb') as data:
+            for block in iter(lambda: data.read(1 << 20), b''):
+                digest.update(block)
+        self.hashes[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': digest.hexdigest()}
+        self.__writeAtomic(self.hash_file, json.dumps(self.hashes).encode())
+        return digest.hexdigest()
+
+    def key(self, stage: str, inputs: Iterable[str], params: dict = None) -> str:
+        """Calculate the cache key of a stage.
+        Parameters:
+        :param stage: Name of the stage, e.g. 'parse direcTag Pool_49'.
+        :param inputs: Paths to the input files of the stage.
+        :param params: Parameters of the stage, e.g. alignment mode and gap penalties.
+        :return: Hex digest identifying the stage, its inputs and parameters.
+        """
+        description = {'stage': stage, 'inputs': [self.fileHash(file) for file in inputs], 'params': params or dict()}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key: str):
+        """Get a cached result.
+        Parameters:
+        :param key: Cache key as returned by key.
+        :return: Cached result, or None if the result is not cached.
+        """
+        path = self.__path(key)
+        if not os.path.exists(path):
+            return None
+        # the modification time is used as the last access time for the eviction
+        os.utime(path)
+        return pd.read_pickle(path)
+
+    def put(self, key: str, result):
+        """Store a result and evict the least recently used results if the cache is too large.
+        Parameters:
+        :param key: Cache key as returned by key.
+        :param result: Result of the stage, e.g. a DataFrame.
+        """
+        path = self.__path(key)
+        pd.to_pickle(result, f'{path}.{os.getpid()}.tmp')
+        os.replace(f'{path}.{os.getpid()}.tmp', path)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used results until the cache fits into max_bytes."""
+        entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.pkl')]
+        entries = sorted(((os.path.getmtime(entry), os.path.getsize(entry), entry) for entry in entries), reverse=True)
+        total = 0
+        for _, size, entry in entries:
+            total += size
+            if total > self.max_bytes and os.path.exists(entry):
+                os.remove(entry)
+
+    def cached(self, stage: str, inputs: Iterable[str], params: dict, compute: Callable):
+        """Return the cached result of a stage, or compute and cache it if its inputs or parameters changed.
+        Parameters:
+        :param stage: Name of the stage, e.g. 'parse direcTag Pool_49'.
+        :param inputs: Paths to the input files of the stage.
+        :param params: Parameters of the stage, e.g. alignment mode and gap penalties.
+        :param compute: Function without arguments computing the result of the stage.
+        :return: Result of the stage.
+        """
+        key = self.key(stage, inputs, params)
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    @staticmethod
+    def __writeAtomic(path: str, content: bytes):
+        with open(f'{path}.{os.getpid()}.tmp', 'wb') as file:
+            file.write(content)
+        os.replace(f'{path}.{os.getpid()}.tmp', path)
@@ -0,0 +1,188 @@
+from typing import Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+# columns which are not averaged, like in groupByIdAndAverage
+SEQUENCE_COLUMNS = ['Predicted', 'Actual']
+
+
+class StreamingAggregator:
+    def __init__(self, extremes: bool = False, deviation: bool = False, best: str = None, best_by: str = 'Score',
+                 capacity: int = 1024):
+        """Initializes the StreamingAggregator object, which averages every column of scored results per ID like
+        groupByIdAndAverage, but consumes the scored result chunk by chunk, so the scored rows never have to be in
+        memory at the same time. Only a few values per ID and column are kept.
+        The means are summed up like pandas does, with a compensated sum in the order of the rows, so they equal the
+        means of groupByIdAndAverage of the concatenated chunks exactly.
+        Parameters:
+        :param extremes: Add the maximum and minimum of every column per ID, as '<column> Max' and '<column> Min'.
+        :param deviation: Add the sample standard deviation of every column per ID as '<column> Std', calculated with
+            Welford's algorithm.
+        :param best: Optional sequence column, e.g. Predicted. Adds the sequence of the row with the highest best_by
+            value per ID as 'Best <best>', the first such row on ties.
+        :param best_by: Column selecting the best row.
+        :param capacity: Number of IDs to reserve space for, grown as needed.
+        """
+        self.extremes = extremes
+        self.deviation = deviation
+        self.best = best
+        self.best_by = best_by
+        self.capacity = capacity
+        self.columns = None
+        self.ids = pd.Index([], dtype=np.int64)
+        self.rows = 0
+
+    def __allocate(self, chunk: pd.DataFrame):
+        self.columns = [column for column in chunk.columns if column != 'ID' and column not in SEQUENCE_COLUMNS]
+        # values are summed up in the precision pandas uses, float32 for float32 columns and float64 otherwise
+        self.types = [np.float32 if chunk[column].dtype == np.float32 else np.float64 for column in self.columns]
+        self.id_type = chunk['ID'].dtype
+        self.state = {name: [np.zeros(self.capacity, dtype=dtype) for dtype in self.types]
+                      for name in ['sum', 'compensation', 'max', 'min']}
+        # Welford's running means and squared deviations are always kept in float64
+        self.state['mean'] = [np.zeros(self.capacity) for _ in self.columns]
+        self.state['m2'] = [np.zeros(self.capacity) for _ in self.columns]
+        self.counts = np.zeros((self.capacity, len(self.columns)), dtype=np.int64)
+        for values in self.state['max'] + self.state['min']:
+            values.fill(np.nan)
+        self.best_values = np.full(self.capacity, np.nan)
+        self.best_sequences = np.empty(self.capacity, dtype=object)
+
+    def __grow(self, size: int):
+        capacity = max(size, 2 * self.capacity)
+        for name, arrays in self.state.items():
+            grown = [np.full(capacity, np.nan if name in ('max', 'min') else 0, dtype=array.dtype) for array in arrays]
+            for array, values in zip(grown, arrays):
+                array[:self.capacity] = values
+            self.state[name] = grown
+        counts = np.zeros((capacity, len(self.columns)), dtype=np.int64)
+        counts[:self.capacity] = self.counts
+        best_values = np.full(capacity, np.nan)
+        best_values[:self.capacity] = self.best_values
+        best_sequences = np.empty(capacity, dtype=object)
+        best_sequences[:self.capacity] = self.best_sequences
+        self.counts, self.best_values, self.best_sequences = counts, best_values, best_sequences
+        self.capacity = capacity
+
+    def __slots(self, ids: np.ndarray) -> np.ndarray:
+        """Map the IDs of a chunk to the positions of their values, new IDs are appended."""
+        slots = self.ids.get_indexer(ids)
+        if (slots < 0).any():
+            self.ids = self.ids.append(pd.Index(pd.unique(ids[slots < 0])))
+            if len(self.ids) > self.capacity:
+                self.__grow(len(self.ids))
+            slots = self.ids.get_indexer(ids)
+        return slots
+
+    def update(self, chunk: pd.DataFrame):
+        """Add the rows of a scored chunk.
+        Parameters:
+        :param chunk: Scored result containing an ID column, e.g. a chunk of processParsedChunks.
+        """
+        if len(chunk) == 0:
+            return
+        if self.columns is None:
+            self.__allocate(chunk)
+        slots = self.__slots(chunk['ID'].to_numpy(np.int64))
+        self.rows += len(chunk)
+
+        # the rows are added in rounds, round k adds the k-th row of every ID of the chunk, so every ID gets its rows
+        # in their original order while each round is vectorized over the IDs
+        order = np.argsort(slots, kind='stable')
+        starts = np.flatnonzero(np.r_[True, slots[order][1:] != slots[order][:-1]])
+        ranks = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        by_rank = order[np.argsort(ranks, kind='stable')]
+        bounds = np.r_[0, np.cumsum(np.bincount(ranks))]
+
+        best_by = chunk[self.best_by].to_numpy(np.float64) if self.best is not None else None
+        best = chunk[self.best].to_numpy(dtype=object) if self.best is not None else None
+        for column, (name, dtype) in enumerate(zip(self.columns, self.types)):
+            values = chunk[name].to_numpy(dtype)
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                self.__add(column, slots[by_rank[start:end]], values[by_rank[start:end]])
+        if self.best is not None:
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                rows = by_rank[start:end]
+                current = self.best_values[slots[rows]]
+                better = (best_by[rows] > current) | (np.isnan(current) & ~np.isnan(best_by[rows]))
+                self.best_values[slots[rows[better]]] = best_by[rows[better]]
+                self.best_sequences[slots[rows[better]]] = best[rows[better]]
+
+    def __add(self, column: int, slots: np.ndarray, values: np.ndarray):
+        """Add one value to each of the given IDs, which are all different."""
+        valid = ~np.isnan(values)
+        slots, values = slots[valid], values[valid]
+        self.counts[slots, column] += 1
+        total, compensation = self.state['sum'][column], self.state['compensation'][column]
+        # Kahan summation, an infinite value resets the compensation instead of making it NaN
+        y = values - compensation[slots]
+        t = total[slots] + y
+        error = (t - total[slots]) - y
+        compensation[slots] = np.where(np.isnan(error), 0, error)
+        total[slots] = t
+        if self.deviation:
+            mean, m2 = self.state['mean'][column], self.state['m2'][column]
+            delta = values - mean[slots]
+            mean[slots] += delta / self.counts[slots, column]
+            m2[slots] += delta * (values - mean[slots])
+        if self.extremes:
+            self.state['max'][column][slots] = np.fmax(self.state['max'][column][slots], values)
+            self.state['min'][column][slots] = np.fmin(self.state['min'][column][slots], values)
+
+    def consume(self, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """Add the chunks while passing them on, e.g. to saveResultChunks.
+        Parameters:
+        :param chunks: Scored chunks.
+        :return: Iterator of the same chunks.
+        """
+        for chunk in chunks:
+            self.update(chunk)
+            yield chunk
+
+    def result(self) -> pd.DataFrame:
+        """Get the aggregated result.
+        :return: DataFrame indexed and sorted by ID, with the mean of every column like groupByIdAndAverage and the
+            requested additional columns.
+        """
+        if self.columns is None:
+            return pd.DataFrame(index=pd.Index([], name='ID'))
+        size = len(self.ids)
+        output = dict()
+        for column, (name, dtype) in enumerate(zip(self.columns, self.types)):
+            counts = self.counts[:size, column]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                output[name] = np.where(counts > 0, self.state['sum'][column][:size] / counts, np.nan).astype(dtype)
+        for column, name in enumerate(self.columns):
+            counts = self.counts[:size, column]
+            if self.extremes:
+                output[f'{name} Max'] = self.state['max'][column][:size]
+                output[f'{name} Min'] = self.state['min'][column][:size]
+            if self.deviation:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    output[f'{name} Std'] = np.where(counts > 1, np.sqrt(self.state['m2'][column][:size] /
+                                                                          (counts - 1)), np.nan)
+        if self.best is not None:
+            output[f'Best {self.best}'] = self.best_sequences[:size]
+        grouped = pd.DataFrame(output, index=pd.Index(self.ids.to_numpy().astype(self.id_type), name='ID'))
+        return grouped.sort_index()
+
+
+def aggregateChunks(chunks: Iterable[pd.DataFrame], **kwargs) -> pd.DataFrame:
+    """Average scored chunks per ID, see StreamingAggregator.
+    Parameters:
+    :param chunks: Scored chunks, e.g. of processParsedChunks or iterResult.
+    :param kwargs: Options of StreamingAggregator.
+    :return: DataFrame indexed and sorted by ID.
+    """
+    aggregator = StreamingAggregator(**kwargs)
+    for chunk in chunks:
+        aggregator.update(chunk)
+    return aggregator.result()
+
+
+if __name__ == "__main__":
+    scored = pd.DataFrame({'ID': [3, 1, 3, 2, 1], 'Predicted': ['PEP', 'TID', 'EPT', 'IDE', 'PTI'],
+                           'Actual': ['PEPTIDE'] * 5, 'Score': [10.0, 20.0, 30.0, 40.0, 50.0],
+                           'Levenshtein': [4, 4, 4, 4, 4]})
+    print(aggregateChunks([scored[:2], scored[2:]], extremes=True, deviation=True, best='Predicted'))